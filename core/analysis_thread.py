@@ -1,44 +1,334 @@
 import re
+import threading
 import pandas as pd
 import numpy as np
+from concurrent.futures import ThreadPoolExecutor
 from PyQt5.QtCore import QThread, pyqtSignal
+from utils.timing import StageTimer, format_timings
+from core.processor import LoadCancelledError
+from core.code_analysis import validate_generated_code
+from core.data_compactor import stratified_sample
+from core.execution_pool import ExecutionError
+from core.code_profiler import profile_exec, format_profile
 
 
 class AnalysisThread(QThread):
     update_signal = pyqtSignal(str)
     complete_signal = pyqtSignal(dict)
 
-    def __init__(self, processor, file_paths, request, mode):
+    def __init__(self, processor, file_paths, request, mode, time_range=None, use_cache=True, keyword_filter=None):
         super().__init__()
         self.processor = processor
         self.file_paths = file_paths
         self.request = request
         self.mode = mode
+        self.time_range = time_range  # 可选的时间范围 (开始, 结束)
+        self.keyword_filter = keyword_filter  # 可选的关键词查询，只分析包含关键词的行
+        self.use_cache = use_cache  # 是否使用缓存的API响应和生成代码
+        self.code_cache_key = None
+        self.code_from_cache = False  # 本次执行的代码是否来自代码缓存
+        self.projection = None  # 本次按列裁剪加载的方案（None表示加载了全部列）
+        self.cancel_event = threading.Event()  # 用户取消分析时置位，中止正在等待或接收的API响应
+
+    def cancel(self):
+        """请求取消分析（正在等待或接收的API响应会尽快中止）"""
+        self.cancel_event.set()
 
     def run(self):
+        timer = StageTimer()
         try:
-            self.update_signal.emit("正在加载数据...")
-            data_dict = self.processor.load_data_files(self.file_paths)
-            self.update_signal.emit("数据加载完成，正在进行分析...")
-
             if self.mode == "1":
-                # 代码处理模式：生成代码并执行
-                code_block = self.processor.generate_processing_code(self.request, self.file_paths)
-                self.update_signal.emit("代码生成完成，开始执行...")
-                cleaned_code = self.clean_code_block(code_block)
-                result = self.execute_cleaned_code(cleaned_code, data_dict)
+                # 代码处理模式：基于文件结构和样本生成代码，全量数据加载与API调用并行
+                result = self.run_code_mode(timer)
 
                 # 关键补充：代码模式下也对总结进行本地还原
                 if "summary" in result and result["summary"]:
                     result["summary"] = self.processor.sensitive_processor.restore_sensitive_words(result["summary"])
             else:
                 # 直接回答模式（使用上面修改后的方法）
-                result = self.processor.direct_answer(self.request, self.file_paths)
+                self.update_signal.emit("正在加载数据并进行分析...")
+                with timer.stage("直接回答"):
+                    result = self.processor.direct_answer(
+                        self.request, self.file_paths, self.time_range,
+                        progress_callback=self.update_signal.emit,
+                        use_cache=self.use_cache,
+                        cancel_event=self.cancel_event,
+                        keyword_filter=self.keyword_filter
+                    )
 
+            result["timings"] = timer.report()
+            if self.processor.verbose:
+                print(format_timings(result["timings"]))
             self.complete_signal.emit({"status": "success", "result": result})
         except Exception as e:
             self.complete_signal.emit({"status": "error", "message": str(e)})
 
+    def run_code_mode(self, timer):
+        """生成（或复用缓存的）代码，在抽样数据上试运行通过后执行全量数据
+
+        常见请求匹配内置查询模板时直接执行模板，不调用模型；
+        请求和数据结构与之前某次相同时直接复用当时成功执行的代码；
+        缓存代码执行失败时删除该缓存，跳过缓存重新生成代码并执行。
+        """
+        result = self.run_query_template(timer)
+        if result is not None:
+            return result
+
+        self.code_cache_key = self.processor.code_cache_key(self.request, self.file_paths)
+        profile = self.processor.config.get("profile_code", False)  # 逐行性能分析（有额外开销，默认关闭）
+        code_block, data_dict = self.generate_and_load(timer)
+        cleaned_code, data_dict, problem = self.dry_run_and_repair(self.clean_code_block(code_block), data_dict, timer)
+        if problem is not None:
+            return self.dry_run_failure(cleaned_code, problem)
+        self.update_signal.emit("数据加载完成，开始执行...")
+        with timer.stage("执行代码"):
+            result = self.execute_cleaned_code(cleaned_code, data_dict, profile)
+
+        if result.get("error") and self.code_from_cache:
+            self.update_signal.emit("缓存的代码执行失败，正在重新生成代码...")
+            self.processor.invalidate_cached_code(self.code_cache_key)
+            self.use_cache = False  # 同时跳过API响应缓存，避免返回相同的代码
+            code_block, data_dict = self.generate_and_load(timer)
+            cleaned_code, data_dict, problem = self.dry_run_and_repair(
+                self.clean_code_block(code_block), data_dict, timer
+            )
+            if problem is not None:
+                return self.dry_run_failure(cleaned_code, problem)
+            self.update_signal.emit("数据加载完成，开始执行...")
+            with timer.stage("执行代码(重新生成)"):
+                result = self.execute_cleaned_code(cleaned_code, data_dict, profile)
+
+        if not result.get("error") and not self.code_from_cache:
+            self.processor.store_generated_code(self.code_cache_key, self.request, cleaned_code)
+        return result
+
+    def run_query_template(self, timer):
+        """请求匹配内置查询模板时只加载用到的列并直接执行向量化查询
+
+        Returns:
+            dict | None: 分析结果；未匹配或模板执行失败时返回None（改为由模型生成代码）
+        """
+        with timer.stage("匹配查询模板"):
+            match = self.processor.match_query_template(self.request, self.file_paths)
+        if match is None:
+            return None
+        if not self.keyword_filter and (not self.time_range or all(bound is None for bound in self.time_range)):
+            # 已加载的数据集有列统计（sketch）时直接回答，不再读取数据
+            with timer.stage("执行查询模板(列统计)"):
+                local_vars = self.processor.answer_from_sketches(match)
+            if local_vars is not None:
+                self.update_signal.emit(f"已匹配内置查询（{match.description}），由已加载数据的列统计直接得出结果")
+                result = self.finalize_result(local_vars, {})
+                result["query_template"] = match.name
+                result["from_sketches"] = True
+                return result
+        self.update_signal.emit(f"已匹配内置查询（{match.description}），跳过代码生成，正在加载数据...")
+        try:
+            # 关键词过滤需要日志文本列，此时不按列裁剪
+            projection = None if self.keyword_filter else match.projection()
+            data_dict = self.load_data(timer, projection, stage="加载数据(查询模板)", file_names=list(match.columns))
+            with timer.stage("执行查询模板"):
+                local_vars = match.run(data_dict)
+        except Exception as e:
+            self.update_signal.emit(f"内置查询执行失败，改为生成代码: {str(e)}")
+            return None
+        result = self.finalize_result(local_vars, data_dict)
+        result["query_template"] = match.name
+        return result
+
+    def dry_run_and_repair(self, cleaned_code, data_dict, timer):
+        """在抽样数据上试运行代码，出错时把错误反馈给模型修复（dry_run，默认开启）
+
+        缓存的代码试运行失败时删除该缓存并重新生成；新生成的代码最多修复code_repair_rounds轮。
+        修复后的代码可能用到之前按列裁剪时未加载的列，此时按新代码重新加载数据。
+
+        Returns:
+            (str, dict, str | None): 代码, 数据字典, 仍未解决的问题（None表示试运行通过）
+        """
+        if not self.processor.config.get("dry_run", True):
+            return cleaned_code, data_dict, None
+        max_rounds = self.processor.config.get("code_repair_rounds", 1)
+        repairs = 0
+        while True:
+            self.update_signal.emit("正在抽样数据上试运行代码...")
+            with timer.stage("样本试运行"):
+                problem = self.dry_run(cleaned_code, data_dict)
+            if problem is None:
+                return cleaned_code, data_dict, None
+
+            if self.code_from_cache:
+                self.update_signal.emit("缓存的代码在抽样数据上试运行失败，正在重新生成代码...")
+                self.processor.invalidate_cached_code(self.code_cache_key)
+                self.use_cache = False
+                code_block = self.generate_code(timer)
+            elif repairs < max_rounds:
+                repairs += 1
+                self.update_signal.emit(
+                    f"代码试运行失败，正在请求模型修复（第{repairs}轮）: "
+                    f"{self.processor.sensitive_processor.restore_sensitive_words(problem)}"
+                )
+                with timer.stage("修复代码"):
+                    code_block = self.processor.generate_processing_code(
+                        self.request, self.file_paths, self.time_range, use_cache=False,
+                        progress_callback=self.update_signal.emit, cancel_event=self.cancel_event,
+                        previous_attempt=(cleaned_code, problem)
+                    )
+            else:
+                return cleaned_code, data_dict, problem
+
+            cleaned_code = self.clean_code_block(code_block)
+            data_dict = self.reload_for_code(cleaned_code, data_dict, timer)
+
+    def dry_run(self, cleaned_code, data_dict):
+        """检查禁止的写法后，在每个数据表的分层抽样上试运行代码并校验结果变量
+
+        Returns:
+            str | None: 问题描述，None表示通过
+        """
+        problems = validate_generated_code(cleaned_code)
+        if problems:
+            return "代码包含不允许的写法: " + "；".join(problems)
+        rows = self.processor.config.get("dry_run_rows", 200)
+        sample = {name: stratified_sample(df, rows).copy() for name, df in data_dict.items()}
+        try:
+            local_vars = self.run_generated_code(
+                f"{cleaned_code}\n", sample, timeout=self.processor.config.get("dry_run_timeout", 60)
+            )
+        except ExecutionError as e:
+            return f"执行出错: {str(e)}"
+        except Exception as e:
+            return f"执行出错: {type(e).__name__}: {str(e)}"
+        return self.check_result_variables(local_vars)
+
+    @staticmethod
+    def check_result_variables(local_vars):
+        """校验result_table/summary/chart_info的类型和图表配置，返回问题描述（None表示通过）"""
+        problems = []
+        if not isinstance(local_vars.get('result_table'), pd.DataFrame):
+            problems.append("未定义result_table或其不是pandas.DataFrame")
+        if not isinstance(local_vars.get('summary'), str):
+            problems.append("未定义summary或其不是字符串")
+        chart_info = local_vars.get('chart_info')
+        if chart_info is not None:
+            if not isinstance(chart_info, dict):
+                problems.append("chart_info必须是字典或None")
+            else:
+                missing = [f for f in ("chart_type", "title", "data_prep") if f not in chart_info]
+                if missing:
+                    problems.append(f"chart_info缺少字段 {missing}")
+                if chart_info.get("chart_type") not in (None, "bar", "line", "pie", "scatter", "hist"):
+                    problems.append(f"不支持的chart_type: {chart_info.get('chart_type')}")
+                if "data_prep" in chart_info and not isinstance(chart_info["data_prep"], dict):
+                    problems.append("chart_info的data_prep必须是字典")
+        return "；".join(problems) if problems else None
+
+    def dry_run_failure(self, cleaned_code, problem):
+        """试运行和修复后仍有问题：不执行全量数据，直接返回错误"""
+        error_msg = f"代码在抽样数据上试运行失败（已跳过全量执行）: {problem}\n\n执行的代码:\n{cleaned_code}\n"
+        return {
+            "summary": self.processor.sensitive_processor.restore_sensitive_words(error_msg),
+            "result_table": None,
+            "chart_info": None,
+            "error": True
+        }
+
+    def reload_for_code(self, cleaned_code, data_dict, timer):
+        """代码变化后，若按列裁剪加载的数据缺少新代码用到的列，则重新加载"""
+        if self.projection is None:
+            return data_dict
+        projection = self.plan_projection(cleaned_code)
+        if projection is not None and all(
+                name in projection and set(projection[name]) <= set(cols) for name, cols in self.projection.items()):
+            return data_dict
+        if projection:
+            return self.load_projected(timer, projection)
+        self.projection = None
+        self.update_signal.emit("修复后的代码需要更多列，正在重新加载数据...")
+        return self.load_data(timer, stage="加载数据(修复后)")
+
+    def load_data(self, timer, columns=None, cancel_event=None, stage="加载数据", file_names=None):
+        """加载并脱敏数据（可按列裁剪，按时间范围截取、按关键词过滤）"""
+        with timer.stage(stage):
+            data_dict = self.processor.load_data_files(file_names or self.file_paths, columns, cancel_event)
+            data_dict = self.processor.apply_time_range(data_dict, self.time_range)
+            if self.keyword_filter:
+                data_dict = self.processor.filter_rows(data_dict, self.keyword_filter)
+            return data_dict
+
+    def generate_code(self, timer):
+        with timer.stage("生成代码"):
+            if self.use_cache and self.code_cache_key is not None:
+                code_block = self.processor.get_cached_code(self.code_cache_key)
+                if code_block is not None:
+                    self.code_from_cache = True
+                    self.update_signal.emit("已找到相同请求和数据结构的缓存代码，跳过代码生成...")
+                    return code_block
+            self.code_from_cache = False
+            return self.processor.generate_processing_code(
+                self.request, self.file_paths, self.time_range, use_cache=self.use_cache,
+                progress_callback=self.update_signal.emit, cancel_event=self.cancel_event
+            )
+
+    def plan_projection(self, code_block):
+        """分析生成代码实际使用的列（列裁剪关闭或无法确定时返回None）"""
+        if not self.processor.config.get("projection_pushdown", True) or self.keyword_filter:
+            return None  # 关键词过滤需要日志文本列，不按列裁剪
+        try:
+            return self.processor.plan_projection(self.clean_code_block(code_block), self.file_paths)
+        except Exception as e:
+            if self.processor.verbose:
+                print(f"列裁剪分析失败，加载全部列: {str(e)}")
+            return None
+
+    def load_projected(self, timer, projection):
+        self.projection = projection
+        self.update_signal.emit(f"代码仅使用部分列，正在按列加载数据（{self.format_projection(projection)}）...")
+        return self.load_data(timer, projection, stage="加载数据(列裁剪)")
+
+    @staticmethod
+    def format_projection(projection):
+        return "，".join(f"{name}: {len(cols)}列" for name, cols in projection.items())
+
+    def generate_and_load(self, timer):
+        """生成代码并加载数据，返回(代码, 数据字典)
+
+        开启流水线模式（pipeline_loading，默认开启）时，全量加载在后台线程中进行，
+        同时本线程基于文件样本构建prompt并等待API返回，两者都完成后再执行代码。
+        开启列裁剪（projection_pushdown，默认开启）时，代码返回后若后台加载尚未完成，
+        且静态分析能确定代码使用的列，则取消全量加载，只加载这些列。
+        """
+        self.projection = None
+        if not self.processor.config.get("pipeline_loading", True):
+            self.update_signal.emit("正在读取文件结构并生成代码...")
+            code_block = self.generate_code(timer)
+            projection = self.plan_projection(code_block)
+            if projection:
+                return code_block, self.load_projected(timer, projection)
+            self.update_signal.emit("代码生成完成，正在加载数据...")
+            return code_block, self.load_data(timer)
+
+        self.update_signal.emit("正在生成代码，同时在后台加载数据...")
+        cancel_event = threading.Event()
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            load_future = executor.submit(self.load_data, timer, None, cancel_event)
+            code_block = self.generate_code(timer)
+            if not load_future.done():
+                projection = self.plan_projection(code_block)
+                if projection and not load_future.done():
+                    cancel_event.set()
+                    try:
+                        # 等待后台全量加载在下一个检查点退出；若已在取消前完成则直接使用
+                        return code_block, load_future.result()
+                    except LoadCancelledError:
+                        return code_block, self.load_projected(timer, projection)
+                self.update_signal.emit("代码生成完成，等待数据加载...")
+            return code_block, load_future.result()
+        finally:
+            # 代码生成失败时不等待后台加载结束，直接返回错误
+            cancel_event.set()
+            executor.shutdown(wait=False)
+
     def clean_code_block(self, code_block):
         """清理代码块，移除三重反引号和语言标识"""
         if not code_block:
@@ -47,70 +337,101 @@ class AnalysisThread(QThread):
         cleaned = re.sub(r'```$', '', cleaned, flags=re.MULTILINE)
         return cleaned.strip()
 
-    def execute_cleaned_code(self, cleaned_code, data_dict):
-        """执行代码并简化图表配置校验，使用预加载的数据"""
-        full_code = f"{cleaned_code}\n"
+    def run_generated_code(self, full_code, data_dict, timeout=None, profile=False):
+        """执行代码，返回执行后的变量（result_table/summary/chart_info，profile为True时另有逐行性能报告）
+
+        开启子进程执行（subprocess_execution，默认开启）时在预热的执行进程中运行，
+        超时或超出内存限制时抛出ExecutionError；否则在本进程内执行。
+        """
+        if self.processor.execution_pool is not None:
+            return self.processor.execution_pool.run(full_code, data_dict, timeout, profile)
         local_vars = {
             'data_dict': data_dict,
             'pd': pd,
             'np': np
         }
-
-        try:
+        if profile:
+            local_vars['profile'] = profile_exec(full_code, globals(), local_vars)
+        else:
             exec(full_code, globals(), local_vars)
-            result_table = local_vars.get('result_table')
-            # 强制获取总结并进行敏感词还原（确保代码生成模式下必然执行）
-            summary = local_vars.get('summary', '分析完成但未生成总结')
-            # 关键修改：无论何种情况都对总结执行还原处理
-            summary = self.processor.sensitive_processor.restore_sensitive_words(summary)
-
-            chart_info = local_vars.get('chart_info', None)
-
-            # 还原表格数据（处理字符串列）
-            if result_table is not None and isinstance(result_table, pd.DataFrame):
-                for col in result_table.columns:
-                    if result_table[col].dtype == 'object':
-                        result_table[col] = result_table[col].apply(
-                            lambda x: self.processor.sensitive_processor.restore_sensitive_words(str(x)) if pd.notna(
-                                x) else x
-                        )
-
-            # 还原图表信息中的文本
-            if chart_info and isinstance(chart_info, dict):
-                if 'title' in chart_info:
-                    chart_info['title'] = self.processor.sensitive_processor.restore_sensitive_words(
-                        chart_info['title'])
-                if 'data_prep' in chart_info and isinstance(chart_info['data_prep'], dict):
-                    for key, value in chart_info['data_prep'].items():
-                        if isinstance(value, str):
-                            chart_info['data_prep'][key] = self.processor.sensitive_processor.restore_sensitive_words(
-                                value)
-
-            # 图表配置校验警告
-            if chart_info and isinstance(chart_info, dict):
-                top_required = ["chart_type", "title", "data_prep"]
-                missing_top = [f for f in top_required if f not in chart_info]
-                if missing_top:
-                    summary += f"\n警告：图表配置缺少顶级字段 {missing_top}"
-                data_prep = chart_info.get("data_prep", {})
-                if not isinstance(data_prep, dict):
-                    summary += "\n警告：data_prep必须是字典类型"
-                    chart_info["data_prep"] = {}
-
-            if result_table is None:
-                result_table = pd.concat(data_dict.values(), ignore_index=True)
-                summary = "未生成有效分析结果，返回原始数据合并表格\n" + summary
+        return local_vars
 
-            return {
-                "result_table": result_table,
-                "summary": summary,
-                "chart_info": chart_info
-            }
+    def execute_cleaned_code(self, cleaned_code, data_dict, profile=False):
+        """执行代码并简化图表配置校验，使用预加载的数据
+
+        profile为True时逐行统计代码的耗时和内存分配，报告放在结果的profile中并附在总结后，
+        发现的逐行执行热点（iterrows、apply等）记录下来，作为后续生成代码的提示。
+        """
+        full_code = f"{cleaned_code}\n"
+
+        try:
+            local_vars = self.run_generated_code(full_code, data_dict, profile=profile)
+            result = self.finalize_result(local_vars, data_dict)
+            report = local_vars.get('profile') if profile else None
+            if report:
+                self.processor.performance_feedback.record(report)
+                result["profile"] = report
+                result["summary"] += "\n\n性能分析:\n" + self.processor.sensitive_processor.restore_sensitive_words(
+                    format_profile(report))
+            return result
         except Exception as e:
             # 对错误信息也进行敏感词还原
             error_msg = f"代码执行错误: {str(e)}\n\n执行的代码:\n{full_code}"
             return {
                 "summary": self.processor.sensitive_processor.restore_sensitive_words(error_msg),
                 "result_table": None,
-                "chart_info": None
-            }
\ No newline at end of file
+                "chart_info": None,
+                "error": True
+            }
+
+    def finalize_result(self, local_vars, data_dict):
+        """整理执行结果：还原敏感词、校验图表配置，缺少结果表时返回原始数据合并表格"""
+        result_table = local_vars.get('result_table')
+        # 强制获取总结并进行敏感词还原（确保代码生成模式下必然执行）
+        summary = local_vars.get('summary', '分析完成但未生成总结')
+        # 关键修改：无论何种情况都对总结执行还原处理
+        summary = self.processor.sensitive_processor.restore_sensitive_words(summary)
+
+        chart_info = local_vars.get('chart_info', None)
+
+        # 还原表格数据（处理字符串列）
+        if result_table is not None and isinstance(result_table, pd.DataFrame):
+            for col in result_table.columns:
+                column_dtype = result_table[col].dtype
+                if column_dtype == 'object' or pd.api.types.is_string_dtype(column_dtype):
+                    result_table[col] = result_table[col].apply(
+                        lambda x: self.processor.sensitive_processor.restore_sensitive_words(str(x)) if pd.notna(
+                            x) else x
+                    )
+
+        # 还原图表信息中的文本
+        if chart_info and isinstance(chart_info, dict):
+            if 'title' in chart_info:
+                chart_info['title'] = self.processor.sensitive_processor.restore_sensitive_words(
+                    chart_info['title'])
+            if 'data_prep' in chart_info and isinstance(chart_info['data_prep'], dict):
+                for key, value in chart_info['data_prep'].items():
+                    if isinstance(value, str):
+                        chart_info['data_prep'][key] = self.processor.sensitive_processor.restore_sensitive_words(
+                            value)
+
+        # 图表配置校验警告
+        if chart_info and isinstance(chart_info, dict):
+            top_required = ["chart_type", "title", "data_prep"]
+            missing_top = [f for f in top_required if f not in chart_info]
+            if missing_top:
+                summary += f"\n警告：图表配置缺少顶级字段 {missing_top}"
+            data_prep = chart_info.get("data_prep", {})
+            if not isinstance(data_prep, dict):
+                summary += "\n警告：data_prep必须是字典类型"
+                chart_info["data_prep"] = {}
+
+        if result_table is None:
+            result_table = pd.concat(data_dict.values(), ignore_index=True)
+            summary = "未生成有效分析结果，返回原始数据合并表格\n" + summary
+
+        return {
+            "result_table": result_table,
+            "summary": summary,
+            "chart_info": chart_info
+        }
\ No newline at end of file
@@ -1,20 +1,103 @@
 import time
 import json
 import os
+import types
+import asyncio
+import threading
 from datetime import datetime
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
+from core.token_estimator import TokenEstimator
+from core.response_cache import make_cache_key
+from core.rate_limiter import RateLimiter, CircuitBreaker, classify_error, backoff_delay
 
-class DeepSeekAPI:
-    def __init__(self, api_key, sensitive_processor=None):
+DEFAULT_BASE_URL = "https://api.deepseek.com"
+
+# 等待响应期间检查取消标志的间隔（秒）
+CANCEL_POLL_INTERVAL = 0.2
+
+SYSTEM_PROMPT = "你是专业的信息安全日志分析专家，根据用户要求解决日志分析问题。用户提供的数据中形如PROTECTEDXXXXXXXX的内容是受保护的字段，使用时保持完整，不影响语义理解"
+
+
+class RequestCancelledError(RuntimeError):
+    """请求被用户取消"""
+
+    def __init__(self, message="请求已取消"):
+        super().__init__(message)
+
+
+class _EventLoopThread:
+    """后台事件循环线程：同步调用方通过它把协程提交到同一个事件循环执行"""
+
+    def __init__(self):
+        self.loop = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self.loop = asyncio.new_event_loop()
+                self._thread = threading.Thread(target=self.loop.run_forever, name="api-event-loop", daemon=True)
+                self._thread.start()
+        return self.loop
+
+    def run(self, coro):
+        """在后台事件循环中执行协程并阻塞等待结果"""
+        loop = self._ensure_started()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+
+class AsyncDeepSeekAPI:
+    """基于AsyncOpenAI的异步客户端
+
+    所有请求共用一个客户端（HTTP连接池保持长连接），并发请求数由信号量限制，每个请求单独设置超时。
+    同一实例只应在一个事件循环中使用（连接池与事件循环绑定）。
+    """
+
+    def __init__(self, api_key, sensitive_processor=None, token_estimator=None,
+                 max_concurrency=8, timeout=300.0, base_url=DEFAULT_BASE_URL, response_cache=None,
+                 rate_limiter=None, circuit_breaker=None, prompt_cache_stats=None):
         self.api_key = api_key
-        self.sensitive_processor = sensitive_processor  # 添加敏感词处理器
-        # 官方示例的客户端初始化
-        self.client = OpenAI(
+        self.sensitive_processor = sensitive_processor
+        self.response_cache = response_cache  # 可选的响应缓存（ResponseCache），仅缓存脱敏内容
+        # 请求前估算prompt长度，超出模型上下文预算时直接报错，不上传
+        self.token_estimator = token_estimator or TokenEstimator()
+        self.timeout = timeout  # 单个请求的超时时间（秒）
+        self.last_usage = None  # 最近一次请求的估算与实际token数
+        self.max_concurrency = max(1, max_concurrency)
+        # 在事件循环线程中首次请求时创建（Python 3.8/3.9的asyncio原语创建时即绑定当前线程的事件循环）
+        self._semaphore = None
+        # 全局限流（RPM/TPM，收到429时整体暂停）和熔断（服务连续故障时暂停请求）
+        self.rate_limiter = rate_limiter or RateLimiter()
+        self.circuit_breaker = circuit_breaker or CircuitBreaker()
+        # 可选的服务端prompt缓存命中统计（PromptCacheStats），按业务流程记录
+        self.prompt_cache_stats = prompt_cache_stats
+        # 重试由completions_create统一处理，关闭SDK内置重试
+        self.client = AsyncOpenAI(
             api_key=api_key,
-            base_url="https://api.deepseek.com"
+            base_url=base_url,
+            timeout=timeout,
+            max_retries=0
         )
 
-    def completions_create(self, model="deepseek-reasoner", prompt=None, max_tokens=10000, temperature=1.0, retry=3):
+    def set_api_key(self, api_key):
+        """更新API Key（保留已有连接池，无需重建客户端）"""
+        self.api_key = api_key
+        self.client.api_key = api_key
+
+    async def completions_create(self, model="deepseek-reasoner", prompt=None, max_tokens=10000, temperature=1.0,
+                                 retry=3, timeout=None, use_cache=True, stream=False, on_delta=None,
+                                 stop_when=None, cancel_event=None, workflow="default"):
+        """调用对话接口
+
+        Args:
+            use_cache: 为False时跳过响应缓存（不读取缓存，但成功的响应仍会写入）
+            stream: 是否以流式方式接收响应
+            on_delta: 流式模式下每收到一段内容时的回调，参数为(类型"reasoning"/"content", 文本)
+            stop_when: 流式模式下的提前结束条件，参数为已接收的全部回答内容，返回True时停止接收
+            cancel_event: 可选的threading.Event，置位后中止等待中的请求并抛出RequestCancelledError
+            workflow: 业务流程名称，用于分流程统计服务端prompt缓存命中率
+        """
         if not prompt:
             raise ValueError("prompt不能为空")
 
@@ -23,20 +106,54 @@ class DeepSeekAPI:
         if self.sensitive_processor:
             processed_prompt = self.sensitive_processor.normalize_to_replacement(prompt)
 
+        messages = [
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": processed_prompt}
+        ]
+
+        # 按模型上下文和输出上限检查并收紧max_tokens（超出时抛出PromptTooLargeError，不重试）
+        estimated, raw_estimate, max_tokens = self.token_estimator.check_budget(model, messages, max_tokens)
+        timeout = timeout or self.timeout
+
+        # 相同的脱敏请求直接返回缓存的响应
+        cache_key = None
+        if self.response_cache is not None:
+            cache_key = make_cache_key(messages, model, temperature, max_tokens)
+            if use_cache:
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    return cached
+
         attempt = 0
         while attempt < retry:
+            if cancel_event is not None and cancel_event.is_set():
+                raise RequestCancelledError()
+            # 熔断器打开时直接抛出CircuitOpenError，不再发送请求
+            trial = self.circuit_breaker.before_request()
+            if self._semaphore is None:
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
             try:
-                response = self.client.chat.completions.create(
-                    model=model,
-                    messages=[
-                        {"role": "system",
-                         "content": "你是专业的信息安全日志分析专家，根据用户要求解决日志分析问题。用户提供的数据中形如PROTECTEDXXXXXXXX的内容是受保护的字段，使用时保持完整，不影响语义理解"},
-                        {"role": "user", "content": processed_prompt}
-                    ],
-                    max_tokens=max_tokens,
-                    temperature=temperature,
-                    stream=False
-                )
+                async with self._semaphore:
+                    await self.rate_limiter.acquire(estimated)
+                    if stream:
+                        request = self._consume_stream(
+                            model, messages, max_tokens, temperature, timeout, on_delta, stop_when, cancel_event
+                        )
+                    else:
+                        request = self.client.chat.completions.create(
+                            model=model,
+                            messages=messages,
+                            max_tokens=max_tokens,
+                            temperature=temperature,
+                            stream=False,
+                            timeout=timeout
+                        )
+                    response = await self._await_cancellable(asyncio.wait_for(request, timeout), cancel_event)
+                self.circuit_breaker.record_success()
+                self.rate_limiter.record_usage(estimated, getattr(response, "usage", None))
+                self._record_usage(model, estimated, raw_estimate, max_tokens, response, workflow)
+                if cache_key is not None:
+                    self._cache_response(cache_key, model, response)
 
                 # 移除API响应的提前还原，统一在结果处理时还原
                 # 原来的还原代码注释掉：
@@ -46,12 +163,206 @@ class DeepSeekAPI:
                 #     )
 
                 return response
+            except RequestCancelledError:
+                raise
             except Exception as e:
                 attempt += 1
-                error_msg = f"API调用出错 (尝试 {attempt}/{retry}): {str(e)}"
+                reason = f"请求超时（{timeout}秒）" if isinstance(e, asyncio.TimeoutError) else str(e)
+                error_msg = f"API调用出错 (尝试 {attempt}/{retry}): {reason}"
                 print(error_msg)
 
+                retryable, server_failure, retry_after = classify_error(e)
+                if server_failure:
+                    self.circuit_breaker.record_failure()
+                elif trial:
+                    # 试探请求收到非服务端故障的错误（如429、400、401），说明服务已恢复响应
+                    self.circuit_breaker.release_trial(service_reachable=True)
+                if retry_after is not None:
+                    # 服务端限流：所有请求一起等待，避免继续触发429
+                    self.rate_limiter.pause(retry_after)
+                if not retryable:
+                    raise Exception(f"API调用失败（不可重试的错误）: {reason}") from e
+
                 if attempt < retry:
-                    time.sleep(2)
+                    await asyncio.sleep(backoff_delay(attempt, retry_after))
+            finally:
+                if trial:
+                    # 试探请求被取消等未记录结果的情况：重新打开熔断，避免一直停在试探状态
+                    self.circuit_breaker.release_trial()
+
+        raise Exception(f"API调用失败，已达到最大重试次数 ({retry}次)")
+
+    @staticmethod
+    async def _await_cancellable(request, cancel_event):
+        """等待请求完成，期间cancel_event置位时取消请求并抛出RequestCancelledError（非流式响应也能及时中止）"""
+        if cancel_event is None:
+            return await request
+        task = asyncio.ensure_future(request)
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=CANCEL_POLL_INTERVAL)
+            if done:
+                return task.result()
+            if cancel_event.is_set():
+                task.cancel()
+                raise RequestCancelledError()
+
+    async def _consume_stream(self, model, messages, max_tokens, temperature, timeout, on_delta, stop_when,
+                              cancel_event):
+        """逐块接收流式响应，拼装为与非流式响应结构一致的对象"""
+        stream = await self.client.chat.completions.create(
+            model=model,
+            messages=messages,
+            max_tokens=max_tokens,
+            temperature=temperature,
+            stream=True,
+            stream_options={"include_usage": True},
+            timeout=timeout
+        )
+        content, reasoning = [], []
+        usage = None
+        finish_reason = None
+        stopped_early = False
+        try:
+            async for chunk in stream:
+                if cancel_event is not None and cancel_event.is_set():
+                    raise RequestCancelledError()
+                if getattr(chunk, "usage", None):
+                    usage = chunk.usage
+                if not chunk.choices:
+                    continue
+                choice = chunk.choices[0]
+                delta = choice.delta
+                reasoning_text = getattr(delta, "reasoning_content", None)
+                if reasoning_text:
+                    reasoning.append(reasoning_text)
+                    if on_delta:
+                        on_delta("reasoning", reasoning_text)
+                if delta.content:
+                    content.append(delta.content)
+                    if on_delta:
+                        on_delta("content", delta.content)
+                    # 只在收到反引号时检查结束条件，避免每块都拼接全文
+                    if stop_when and '`' in delta.content and stop_when("".join(content)):
+                        stopped_early = True
+                        finish_reason = "stop"
+                        break
+                if choice.finish_reason:
+                    finish_reason = choice.finish_reason
+        finally:
+            close = getattr(stream, "close", None)
+            if close is not None:
+                await close()
+
+        message = types.SimpleNamespace(content="".join(content), reasoning_content="".join(reasoning) or None)
+        choice = types.SimpleNamespace(message=message, finish_reason=finish_reason, index=0)
+        return types.SimpleNamespace(choices=[choice], usage=usage, stopped_early=stopped_early)
+
+    async def completions_batch(self, requests, max_concurrency=None, progress_callback=None):
+        """并发执行多个请求
+
+        Args:
+            requests: 请求参数字典列表（与completions_create的参数相同）
+            max_concurrency: 本批次的并发上限（同时受客户端全局并发上限限制）
+            progress_callback: 可选的回调，参数为(已完成数, 总数)
+        Returns:
+            list: 与requests顺序一致的响应，失败的请求对应位置为异常对象
+        """
+        limit = asyncio.Semaphore(max(1, max_concurrency or len(requests) or 1))
+        done = 0
+
+        async def run(kwargs):
+            nonlocal done
+            async with limit:
+                try:
+                    return await self.completions_create(**kwargs)
+                finally:
+                    done += 1
+                    if progress_callback:
+                        progress_callback(done, len(requests))
+
+        return await asyncio.gather(*(run(kwargs) for kwargs in requests), return_exceptions=True)
+
+    def _cache_response(self, cache_key, model, response):
+        """写入响应缓存（回答或推理内容中出现未脱敏的敏感词时不缓存）"""
+        message = response.choices[0].message
+        content = message.content
+        if not content:
+            return
+        if self.sensitive_processor:
+            for text in (content, getattr(message, "reasoning_content", None)):
+                if text and self.sensitive_processor.replace_sensitive_words(text)[1]:
+                    return
+        try:
+            self.response_cache.put(cache_key, model, response)
+        except Exception as e:
+            print(f"写入响应缓存失败: {str(e)}")
+
+    def _record_usage(self, model, estimated, raw_estimate, max_tokens, response, workflow="default"):
+        """记录估算与API返回的token用量（用于校准估算）及服务端prompt缓存命中情况"""
+        usage = getattr(response, "usage", None)
+        self.token_estimator.record_usage(model, raw_estimate, usage)
+        if self.prompt_cache_stats is not None:
+            self.prompt_cache_stats.record(workflow, usage)
+        self.last_usage = {
+            "model": model,
+            "workflow": workflow,
+            "estimated_prompt_tokens": estimated,
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            "prompt_cache_hit_tokens": getattr(usage, "prompt_cache_hit_tokens", None),
+            "prompt_cache_miss_tokens": getattr(usage, "prompt_cache_miss_tokens", None),
+            "max_tokens": max_tokens
+        }
+
+
+class DeepSeekAPI:
+    """同步客户端：AsyncDeepSeekAPI的简单封装
+
+    请求提交到后台事件循环线程执行，多个线程同时调用时共用同一个连接池和并发上限。
+    """
+
+    def __init__(self, api_key, sensitive_processor=None, token_estimator=None, **options):
+        """
+        Args:
+            options: 传给AsyncDeepSeekAPI的其他参数（并发上限、超时、响应缓存、限流器、熔断器等）
+        """
+        self.async_client = AsyncDeepSeekAPI(
+            api_key,
+            sensitive_processor=sensitive_processor,
+            token_estimator=token_estimator,
+            **options
+        )
+        self._runner = _EventLoopThread()
+
+    @property
+    def api_key(self):
+        return self.async_client.api_key
+
+    @property
+    def sensitive_processor(self):
+        return self.async_client.sensitive_processor
+
+    @property
+    def token_estimator(self):
+        return self.async_client.token_estimator
+
+    @property
+    def last_usage(self):
+        return self.async_client.last_usage
+
+    def set_api_key(self, api_key):
+        self.async_client.set_api_key(api_key)
+
+    def completions_create(self, model="deepseek-reasoner", prompt=None, max_tokens=10000, temperature=1.0, retry=3,
+                           timeout=None, use_cache=True, stream=False, on_delta=None, stop_when=None, cancel_event=None,
+                           workflow="default"):
+        """同步调用对话接口（参数同AsyncDeepSeekAPI.completions_create，流式回调在后台事件循环线程中执行）"""
+        return self._runner.run(self.async_client.completions_create(
+            model=model, prompt=prompt, max_tokens=max_tokens, temperature=temperature, retry=retry, timeout=timeout,
+            use_cache=use_cache, stream=stream, on_delta=on_delta, stop_when=stop_when, cancel_event=cancel_event,
+            workflow=workflow
+        ))
 
-        raise Exception(f"API调用失败，已达到最大重试次数 ({retry}次)")
\ No newline at end of file
+    def completions_batch(self, requests, max_concurrency=None, progress_callback=None):
+        """在同一事件循环中并发执行多个请求，返回与requests顺序一致的结果（失败项为异常对象）"""
+        return self._runner.run(self.async_client.completions_batch(requests, max_concurrency, progress_callback))
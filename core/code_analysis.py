@@ -0,0 +1,285 @@
+import ast
+import re
+
+
+# 生成代码允许导入的模块（执行环境已提供或只做计算的标准库模块）
+ALLOWED_IMPORTS = {
+    'pandas', 'numpy', 're', 'math', 'statistics', 'datetime', 'time', 'collections', 'itertools',
+    'functools', 'json', 'string', 'ipaddress'
+}
+# 禁止调用的内置函数（动态执行代码、读写文件、交互输入、退出进程等）
+FORBIDDEN_CALLS = {
+    'eval', 'exec', 'compile', 'open', '__import__', 'input', 'breakpoint', 'exit', 'quit',
+    'globals', 'locals', 'vars', 'setattr', 'delattr'
+}
+# 返回结果仍是同列DataFrame的方法（行筛选/排序等），参数中的字符串视为列引用
+FRAME_PRESERVING_METHODS = {
+    'copy', 'head', 'tail', 'sort_values', 'sort_index', 'reset_index', 'set_index',
+    'sample', 'nlargest', 'nsmallest', 'query', 'rename', 'where', 'mask'
+}
+# groupby及保持列不变的方法中传列名的参数：{方法名: (位置参数序号, 关键字参数名...)}
+COLUMN_ARGUMENTS = {
+    'groupby': (0, 'by'),
+    'sort_values': (0, 'by'),
+    'set_index': (0, 'keys'),
+    'nlargest': (1, 'columns'),
+    'nsmallest': (1, 'columns'),
+    'query': (0, 'expr'),
+    'rename': (0, 'mapper', 'columns'),
+}
+# 只读取行数/索引等元信息、不依赖列内容的属性和方法
+META_ATTRIBUTES = {'shape', 'index', 'empty', 'size', 'ndim'}
+# groupby之后不依赖其他列的聚合方法
+GROUP_META_METHODS = {'size', 'ngroups', 'groups', 'indices'}
+
+IDENTIFIER_PATTERN = re.compile(r'`([^`]+)`|([A-Za-z_\u4e00-\u9fff][\w\u4e00-\u9fff]*)')
+
+
+class _Unsure(Exception):
+    """无法确定代码使用的列"""
+
+
+class ColumnReferenceAnalyzer:
+    """静态分析生成代码中 data_dict[...] 的列引用
+
+    只跟踪能确定语义的用法（按列名选列、行筛选、排序、groupby选列等），
+    任何无法确定的整表用法（遍历行、访问columns、整表聚合、作为函数参数等）都视为不确定。
+    """
+
+    def __init__(self, code, columns_by_file):
+        """
+        Args:
+            code: 清理后的代码
+            columns_by_file: {文件名: {代码中的列名: 实际列名}}
+        """
+        self.code = code
+        self.columns_by_file = columns_by_file
+        self.aliases = {}  # 格式: {变量名: 文件名}
+        self.references = {}  # 格式: {文件名: set(实际列名)}
+
+    def analyze(self):
+        """返回{文件名: 排序后的列名列表}，不确定时返回None"""
+        try:
+            tree = ast.parse(self.code)
+        except SyntaxError:
+            return None
+
+        for node in ast.walk(tree):
+            for child in ast.iter_child_nodes(node):
+                child._parent = node
+
+        try:
+            # 迭代直到变量别名不再增加（别名可由其他别名派生）
+            while True:
+                alias_count = len(self.aliases)
+                self.references = {}
+                for node in ast.walk(tree):
+                    file_name = self._frame_root(node)
+                    if file_name is not None:
+                        self._classify_use(node, file_name)
+                if len(self.aliases) == alias_count:
+                    break
+        except _Unsure:
+            return None
+
+        if 'result_table' in self.aliases:
+            # 结果表直接返回原始整表，所有列都会被输出
+            return None
+        return {name: sorted(cols) for name, cols in self.references.items()}
+
+    def _frame_root(self, node):
+        """判断节点是否为数据表来源（data_dict['文件名'] 或其别名），返回文件名"""
+        if isinstance(node, ast.Name) and isinstance(node.ctx, ast.Load):
+            if node.id == 'data_dict':
+                parent = getattr(node, '_parent', None)
+                is_lookup = (
+                    isinstance(parent, ast.Subscript) and parent.value is node
+                    or isinstance(parent, ast.Attribute) and parent.value is node and parent.attr == 'get'
+                )
+                if not is_lookup:
+                    # data_dict.values()/items()/遍历/作为参数等整体用法
+                    raise _Unsure()
+                return None
+            return self.aliases.get(node.id)
+
+        if isinstance(node, ast.Subscript) and self._is_data_dict(node.value):
+            return self._literal_file_name(node.slice)
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr == 'get' and self._is_data_dict(node.func.value)):
+            return self._literal_file_name(node.args[0] if node.args else None)
+        return None
+
+    @staticmethod
+    def _is_data_dict(node):
+        return isinstance(node, ast.Name) and node.id == 'data_dict'
+
+    def _literal_file_name(self, node):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str) and node.value in self.columns_by_file:
+            return node.value
+        raise _Unsure()
+
+    def _record(self, file_name, column):
+        real = self.columns_by_file[file_name].get(column)
+        if real is not None:
+            self.references.setdefault(file_name, set()).add(real)
+
+    def _record_strings(self, file_name, node):
+        """记录节点内所有与列名匹配的字符串常量（含query表达式中的标识符）"""
+        for sub in ast.walk(node):
+            if isinstance(sub, ast.Constant) and isinstance(sub.value, str):
+                self._record(file_name, sub.value)
+                for quoted, name in IDENTIFIER_PATTERN.findall(sub.value):
+                    self._record(file_name, quoted or name)
+
+    def _check_column_arguments(self, call, method):
+        """列名参数必须是字面量（或由数据表派生的Series），列名放在变量中时无法确定用到哪些列"""
+        spec = COLUMN_ARGUMENTS.get(method)
+        if not spec:
+            return
+        position, keywords = spec[0], spec[1:]
+        if len(call.args) > position:
+            self._check_column_argument(call.args[position])
+        for keyword in call.keywords:
+            if keyword.arg is None or keyword.arg in keywords:
+                self._check_column_argument(keyword.value)
+
+    def _check_column_argument(self, node):
+        if isinstance(node, (ast.Constant, ast.Lambda)):
+            return
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            for element in node.elts:
+                self._check_column_argument(element)
+            return
+        if isinstance(node, ast.Dict):
+            for element in node.keys + node.values:
+                if element is None:  # {**mapping}
+                    raise _Unsure()
+                self._check_column_argument(element)
+            return
+        # df['time'].dt.hour 这类派生自数据表的键：其中的列引用由数据表自身的用法分析记录
+        if any(
+            isinstance(sub, ast.Name) and (sub.id == 'data_dict' or sub.id in self.aliases)
+            for sub in ast.walk(node)
+        ):
+            return
+        raise _Unsure()
+
+    def _string_list(self, node):
+        """解析字符串常量或字符串常量列表，否则返回None"""
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            return [node.value]
+        if isinstance(node, (ast.List, ast.Tuple)) and node.elts and all(
+                isinstance(e, ast.Constant) and isinstance(e.value, str) for e in node.elts):
+            return [e.value for e in node.elts]
+        return None
+
+    @staticmethod
+    def _is_row_filter(node):
+        """判断下标是否为行筛选（布尔条件或切片）"""
+        if isinstance(node, ast.Slice):
+            return True
+        return isinstance(node, (ast.Compare, ast.BoolOp, ast.UnaryOp, ast.BinOp, ast.Call, ast.Subscript))
+
+    def _classify_use(self, node, file_name):
+        """沿父节点向上追踪数据表的用法，直到选出具体列或确定为安全用法"""
+        grouped = False
+        while True:
+            parent = getattr(node, '_parent', None)
+
+            if isinstance(parent, ast.Subscript) and parent.value is node:
+                columns = self._string_list(parent.slice)
+                if columns is not None:
+                    for col in columns:
+                        self._record(file_name, col)
+                    return
+                if grouped or not self._is_row_filter(parent.slice):
+                    raise _Unsure()
+                node = parent  # 行筛选后仍是同列数据表
+                continue
+
+            if isinstance(parent, ast.Attribute) and parent.value is node:
+                attr = parent.attr
+                call = getattr(parent, '_parent', None)
+                is_call = isinstance(call, ast.Call) and call.func is parent
+
+                if not grouped and attr in self.columns_by_file[file_name] and not is_call:
+                    self._record(file_name, attr)  # df.列名
+                    return
+                if attr in META_ATTRIBUTES and not is_call:
+                    return
+                if grouped and attr in GROUP_META_METHODS:
+                    return
+                if attr == 'loc' and not grouped:
+                    subscript = getattr(parent, '_parent', None)
+                    if not isinstance(subscript, ast.Subscript):
+                        raise _Unsure()
+                    key = subscript.slice
+                    if isinstance(key, ast.Tuple) and len(key.elts) == 2:
+                        columns = self._string_list(key.elts[1])
+                        if columns is None:
+                            raise _Unsure()
+                        for col in columns:
+                            self._record(file_name, col)
+                        return
+                    node = subscript
+                    continue
+                if is_call and not grouped and attr in FRAME_PRESERVING_METHODS:
+                    self._check_column_arguments(call, attr)
+                    self._record_strings(file_name, call)
+                    node = call
+                    continue
+                if is_call and not grouped and attr == 'groupby':
+                    self._check_column_arguments(call, attr)
+                    self._record_strings(file_name, call)
+                    grouped = True
+                    node = call
+                    continue
+                if is_call and grouped and attr in ('agg', 'aggregate') and call.args and isinstance(call.args[0], ast.Dict):
+                    # 按列指定的聚合：{列名: 聚合方式}
+                    self._record_strings(file_name, call.args[0])
+                    return
+                raise _Unsure()
+
+            if isinstance(parent, ast.Call) and isinstance(parent.func, ast.Name) and parent.func.id == 'len' \
+                    and node in parent.args and not grouped:
+                return
+
+            if isinstance(parent, ast.Assign) and parent.value is node and not grouped:
+                # 变量别名：后续对该变量的用法同样需要分析
+                for target in parent.targets:
+                    if not isinstance(target, ast.Name):
+                        raise _Unsure()
+                    self.aliases[target.id] = file_name
+                return
+
+            raise _Unsure()
+
+
+def find_column_references(code, columns_by_file):
+    """分析生成代码实际使用的列，返回{文件名: 列名列表}，无法确定时返回None"""
+    return ColumnReferenceAnalyzer(code, columns_by_file).analyze()
+
+
+def validate_generated_code(code):
+    """检查生成代码中不允许的写法（语法错误、导入其他模块、危险的内置函数、双下划线属性）
+
+    Returns:
+        list: 问题描述列表，为空表示通过
+    """
+    try:
+        tree = ast.parse(code)
+    except SyntaxError as e:
+        return [f"语法错误（第{e.lineno}行）: {e.msg}"]
+
+    problems = []
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.Import, ast.ImportFrom)):
+            modules = [alias.name for alias in node.names] if isinstance(node, ast.Import) else [node.module or '']
+            for module in modules:
+                if module.split('.')[0] not in ALLOWED_IMPORTS:
+                    problems.append(f"第{node.lineno}行: 不允许导入模块 {module}")
+        elif isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and node.func.id in FORBIDDEN_CALLS:
+            problems.append(f"第{node.lineno}行: 不允许调用 {node.func.id}()")
+        elif isinstance(node, ast.Attribute) and node.attr.startswith('__') and node.attr.endswith('__'):
+            problems.append(f"第{node.lineno}行: 不允许访问属性 {node.attr}")
+    return problems
@@ -0,0 +1,154 @@
+import io
+import os
+import re
+import ast
+import json
+import time
+import hashlib
+import tokenize
+import unicodedata
+import pandas as pd
+
+
+def normalize_request(text):
+    """规范化分析请求：全角转半角、统一大小写、合并空白、去掉末尾标点"""
+    text = unicodedata.normalize('NFKC', text or '').lower()
+    text = re.sub(r'\s+', ' ', text).strip()
+    return text.rstrip('。.！!？?；;，, ')
+
+
+def file_role(file_name):
+    """文件角色：文件名中的数字（日期、序号等）替换为#，同一类定期导出的文件角色相同"""
+    return re.sub(r'\d+', '#', os.path.basename(str(file_name)).lower())
+
+
+def _dtype_family(dtype):
+    if pd.api.types.is_bool_dtype(dtype):
+        return "bool"
+    if pd.api.types.is_numeric_dtype(dtype):
+        return "number"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "datetime"
+    return "text"
+
+
+def schema_fingerprint(samples):
+    """计算数据结构指纹
+
+    Args:
+        samples: {文件名: 样本DataFrame}
+    Returns:
+        (str, list): 指纹, 按角色排序的文件名列表（缓存命中时按此顺序对应新旧文件）
+    """
+    ordered = sorted(samples, key=lambda name: (file_role(name), name))
+    schema = [
+        [file_role(name), [[str(col), _dtype_family(dtype)] for col, dtype in samples[name].dtypes.items()]]
+        for name in ordered
+    ]
+    payload = json.dumps(schema, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest(), ordered
+
+
+def rename_file_literals(code, mapping):
+    """把代码中等于旧文件名的字符串常量替换为新文件名（只改字符串常量，不影响其他代码）"""
+    if not mapping or all(old == new for old, new in mapping.items()):
+        return code
+    lines = code.splitlines(keepends=True)
+    offsets = [0]
+    for line in lines:
+        offsets.append(offsets[-1] + len(line))
+
+    edits = []
+    for token in tokenize.generate_tokens(io.StringIO(code).readline):
+        if token.type != tokenize.STRING:
+            continue
+        try:
+            value = ast.literal_eval(token.string)
+        except (ValueError, SyntaxError):
+            continue  # f-string等非常量字符串
+        if isinstance(value, str) and value in mapping:
+            start = offsets[token.start[0] - 1] + token.start[1]
+            end = offsets[token.end[0] - 1] + token.end[1]
+            edits.append((start, end, repr(mapping[value])))
+
+    for start, end, text in reversed(edits):
+        code = code[:start] + text + code[end:]
+    return code
+
+
+class CodeCache:
+    """生成代码缓存：以规范化请求+数据结构指纹为键，每个条目一个JSON文件
+
+    缓存的是基于脱敏数据生成的代码，不包含原始敏感内容。
+    """
+
+    def __init__(self, cache_dir, max_entries=500):
+        self.cache_dir = os.path.join(cache_dir, 'code')
+        self.max_entries = max_entries
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+    @staticmethod
+    def make_key(request, fingerprint):
+        payload = json.dumps([normalize_request(request), fingerprint], ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key, file_names):
+        """返回缓存的代码（文件名已替换为本次的文件），未命中时返回None
+
+        Args:
+            file_names: 本次按角色排序的文件名列表
+        """
+        path = self._path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                entry = json.load(f)
+            code = rename_file_literals(entry["code"], dict(zip(entry["files"], file_names)))
+        except (OSError, ValueError, KeyError, tokenize.TokenError) as e:
+            print(f"读取代码缓存失败: {str(e)}")
+            return None
+
+        entry["hits"] = entry.get("hits", 0) + 1
+        entry["last_used"] = time.time()
+        self._write(path, entry)
+        return code
+
+    def put(self, key, request, file_names, code):
+        entry = {
+            "request": request,
+            "files": list(file_names),
+            "code": code,
+            "created": time.time(),
+            "last_used": time.time(),
+            "hits": 0
+        }
+        self._write(self._path(key), entry)
+        self._evict()
+
+    def invalidate(self, key):
+        path = self._path(key)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _write(self, path, entry):
+        try:
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(entry, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"保存代码缓存失败: {str(e)}")
+
+    def _evict(self):
+        """条目数超过上限时删除最久未使用的条目（按文件修改时间）"""
+        entries = [e for e in os.scandir(self.cache_dir) if e.name.endswith('.json')]
+        if len(entries) <= self.max_entries:
+            return
+        entries.sort(key=lambda e: e.stat().st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
@@ -0,0 +1,289 @@
+import os
+import ast
+import sys
+import json
+import time
+import threading
+import tracemalloc
+
+
+# 生成代码编译时使用的文件名，用于在跟踪事件中区分生成代码与库代码
+GENERATED_FILENAME = "<generated>"
+
+# 逐行执行Python代码的写法及改进建议
+ROW_WISE_SUGGESTIONS = {
+    "iterrows": "避免用iterrows逐行遍历，改用列的向量化运算、groupby或merge",
+    "itertuples": "避免用itertuples逐行遍历，改用列的向量化运算、groupby或merge",
+    "apply_axis1": "避免apply(axis=1)逐行调用函数，改用列之间的向量化运算或np.where/np.select",
+    "apply": "Series.apply/map逐元素调用Python函数较慢，优先使用.str/.dt访问器或向量化运算",
+    "row_loop": "避免按行号循环并用iloc/loc取值，改用整列运算"
+}
+
+# 耗时占比超过该值的行视为热点
+HOTSPOT_SHARE = 0.2
+# 逐行写法所在行的耗时占比超过该值时提示（耗时很少的逐行写法不值得改写）
+ROW_WISE_MIN_SHARE = 0.05
+# 耗时低于该秒数的行不视为热点（数据量很小时耗时占比没有参考意义）
+HOTSPOT_MIN_SECONDS = 0.05
+
+
+def find_row_wise_patterns(code):
+    """静态查找代码中逐行执行的写法，返回{行号: [写法]}"""
+    try:
+        tree = ast.parse(code)
+    except SyntaxError:
+        return {}
+    patterns = {}
+
+    def add(node, kind):
+        patterns.setdefault(node.lineno, [])
+        if kind not in patterns[node.lineno]:
+            patterns[node.lineno].append(kind)
+
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute):
+            attr = node.func.attr
+            if attr in ("iterrows", "itertuples"):
+                add(node, attr)
+            elif attr in ("apply", "map", "applymap"):
+                axis_one = any(
+                    k.arg == "axis" and isinstance(k.value, ast.Constant) and k.value.value in (1, "columns")
+                    for k in node.keywords
+                )
+                add(node, "apply_axis1" if axis_one else "apply")
+        elif isinstance(node, ast.For) and isinstance(node.iter, ast.Call) \
+                and isinstance(node.iter.func, ast.Name) and node.iter.func.id == "range":
+            # for i in range(len(df)) 之类的按行号循环
+            if any(isinstance(sub, ast.Call) and isinstance(sub.func, ast.Name) and sub.func.id == "len"
+                   for sub in ast.walk(node.iter)):
+                add(node, "row_loop")
+    return patterns
+
+
+class LineProfiler:
+    """逐行统计生成代码的耗时和内存分配，并按pandas方法汇总耗时
+
+    通过sys.settrace只跟踪生成代码的帧（库内部不逐行跟踪）；行耗时包含该行调用的函数。
+    生成代码直接调用的pandas方法（如DataFrame.groupby、Series.apply）单独计时。
+    内存使用tracemalloc统计每行的净分配量和执行期间的峰值增量（numpy数组也会被统计）。
+    """
+
+    def __init__(self, code, track_memory=True):
+        self.code = code
+        self.track_memory = track_memory
+        self.lines = {}  # 格式: {行号: [执行次数, 耗时, 净分配字节, 峰值增量字节]}
+        self.pandas_calls = {}  # 格式: {方法名: [调用次数, 耗时]}
+        self.total_seconds = 0.0
+        self._open = {}  # 格式: {帧: [行号, 开始时间, 开始时的已分配字节, 期间峰值]}
+
+    def _memory(self):
+        if not self.track_memory:
+            return 0, 0
+        return tracemalloc.get_traced_memory()
+
+    def _close_line(self, frame, now, current):
+        state = self._open.pop(frame, None)
+        if state is None:
+            return
+        lineno, start, start_memory, peak = state
+        entry = self.lines.setdefault(lineno, [0, 0.0, 0, 0])
+        entry[0] += 1
+        entry[1] += now - start
+        entry[2] += current - start_memory
+        entry[3] = max(entry[3], peak - start_memory)
+
+    def _update_peaks(self):
+        """把自上次事件以来的内存峰值计入所有未结束的行（外层行包含内层调用的分配）"""
+        current, peak = self._memory()
+        if self.track_memory:
+            if not hasattr(tracemalloc, "reset_peak"):
+                peak = current  # Python 3.8没有reset_peak，只能按跟踪事件时刻的占用估计峰值
+            for state in self._open.values():
+                state[3] = max(state[3], peak)
+            if hasattr(tracemalloc, "reset_peak"):
+                tracemalloc.reset_peak()
+        return current
+
+    def _trace_generated(self, frame, event, arg):
+        now = time.perf_counter()
+        current = self._update_peaks()
+        if event == "line":
+            self._close_line(frame, now, current)
+            self._open[frame] = [frame.f_lineno, now, current, current]
+        elif event == "return":
+            self._close_line(frame, now, current)
+        return self._trace_generated
+
+    def _trace_call(self, frame, event, arg):
+        if event != "call":
+            return None
+        if frame.f_code.co_filename == GENERATED_FILENAME:
+            return self._trace_generated
+        caller = frame.f_back
+        if caller is not None and caller.f_code.co_filename == GENERATED_FILENAME \
+                and f"{os.sep}pandas{os.sep}" in frame.f_code.co_filename:
+            frame.f_trace_lines = False  # 只需要返回事件，不逐行跟踪库代码
+            # co_qualname从Python 3.11开始才有
+            return self._pandas_call_tracer(getattr(frame.f_code, "co_qualname", frame.f_code.co_name))
+        return None
+
+    def _pandas_call_tracer(self, name):
+        start = time.perf_counter()
+
+        def tracer(frame, event, arg):
+            if event == "return":
+                entry = self.pandas_calls.setdefault(name, [0, 0.0])
+                entry[0] += 1
+                entry[1] += time.perf_counter() - start
+            return tracer if event != "return" else None
+
+        return tracer
+
+    def run(self, globals_, locals_=None):
+        """执行代码并统计（代码抛出的异常照常抛出）"""
+        compiled = compile(self.code, GENERATED_FILENAME, "exec")
+        started_tracemalloc = False
+        if self.track_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            started_tracemalloc = True
+        previous = sys.gettrace()
+        start = time.perf_counter()
+        sys.settrace(self._trace_call)
+        try:
+            exec(compiled, globals_, locals_ if locals_ is not None else globals_)
+        finally:
+            sys.settrace(previous)
+            self.total_seconds = time.perf_counter() - start
+            now = time.perf_counter()
+            current = self._update_peaks()
+            for frame in list(self._open):
+                self._close_line(frame, now, current)
+            if started_tracemalloc:
+                tracemalloc.stop()
+
+    def report(self, top=10):
+        """生成报告：最耗时的行、pandas方法耗时汇总、逐行执行写法导致的热点"""
+        source_lines = self.code.splitlines()
+        total = self.total_seconds or 1e-9
+        patterns = find_row_wise_patterns(self.code)
+
+        def source(lineno):
+            return source_lines[lineno - 1].strip() if 0 < lineno <= len(source_lines) else ""
+
+        lines = [
+            {
+                "line": lineno,
+                "source": source(lineno),
+                "hits": hits,
+                "seconds": round(seconds, 4),
+                "share": round(seconds / total, 4),
+                "alloc_kb": round(alloc / 1024, 1),
+                "peak_kb": round(peak / 1024, 1)
+            }
+            for lineno, (hits, seconds, alloc, peak) in self.lines.items()
+        ]
+        lines.sort(key=lambda item: item["seconds"], reverse=True)
+
+        hotspots = []
+        for item in lines:
+            kinds = patterns.get(item["line"], []) if item["share"] >= ROW_WISE_MIN_SHARE else []
+            # 逐行写法只要有一定耗时就提示；其他行只在耗时占比较高时提示
+            if item["seconds"] >= HOTSPOT_MIN_SECONDS and (kinds or item["share"] >= HOTSPOT_SHARE):
+                hotspots.append({
+                    "line": item["line"],
+                    "source": item["source"],
+                    "seconds": item["seconds"],
+                    "share": item["share"],
+                    "patterns": kinds,
+                    "suggestions": [ROW_WISE_SUGGESTIONS[kind] for kind in kinds]
+                })
+
+        pandas_calls = sorted(
+            ({"name": name, "calls": calls, "seconds": round(seconds, 4)}
+             for name, (calls, seconds) in self.pandas_calls.items()),
+            key=lambda item: item["seconds"], reverse=True
+        )
+        return {
+            "total_seconds": round(self.total_seconds, 4),
+            "memory_tracked": self.track_memory,
+            "lines": lines[:top],
+            "pandas_calls": pandas_calls[:top],
+            "hotspots": hotspots
+        }
+
+
+def profile_exec(code, globals_, locals_=None, track_memory=True, top=10):
+    """逐行统计执行代码，返回报告（结构见LineProfiler.report）"""
+    profiler = LineProfiler(code, track_memory)
+    profiler.run(globals_, locals_)
+    return profiler.report(top)
+
+
+def format_profile(report, top=5):
+    """格式化性能报告用于结果展示"""
+    if not report:
+        return ""
+    parts = [f"代码执行耗时 {report['total_seconds']:.2f}s，最耗时的行:"]
+    for item in report["lines"][:top]:
+        memory = f"，分配 {item['alloc_kb']:.0f}KB，峰值 {item['peak_kb']:.0f}KB" if report.get("memory_tracked") else ""
+        parts.append(f"  第{item['line']}行 {item['seconds']:.3f}s（{item['share']:.0%}，执行{item['hits']}次{memory}）: "
+                     f"{item['source'][:80]}")
+    if report["pandas_calls"]:
+        calls = "，".join(f"{c['name']} {c['seconds']:.3f}s/{c['calls']}次" for c in report["pandas_calls"][:top])
+        parts.append(f"pandas方法耗时: {calls}")
+    for item in report["hotspots"]:
+        suggestion = "；".join(item["suggestions"]) or f"该行耗时占比较高: {item['source'][:80]}"
+        parts.append(f"热点 第{item['line']}行（{item['share']:.0%}）: {suggestion}")
+    return "\n".join(parts)
+
+
+class PerformanceFeedback:
+    """积累性能分析发现的热点写法，作为后续代码生成的提示（持久化到缓存目录）"""
+
+    def __init__(self, cache_dir=None, max_notes=5):
+        self.notes_file = os.path.join(cache_dir, 'code_performance_notes.json') if cache_dir else None
+        self.max_notes = max_notes
+        self.notes = {}  # 格式: {写法: {"suggestion", "count", "seconds", "last_seen"}}
+        self._lock = threading.Lock()
+        if self.notes_file and os.path.exists(self.notes_file):
+            try:
+                with open(self.notes_file, 'r', encoding='utf-8') as f:
+                    self.notes = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"加载代码性能提示失败: {str(e)}")
+
+    def record(self, report):
+        """记录报告中的逐行写法热点，返回是否有新增"""
+        if not report:
+            return False
+        changed = False
+        with self._lock:
+            for item in report.get("hotspots", []):
+                for kind, suggestion in zip(item["patterns"], item["suggestions"]):
+                    note = self.notes.setdefault(kind, {"suggestion": suggestion, "count": 0, "seconds": 0.0})
+                    note["count"] += 1
+                    note["seconds"] = round(note["seconds"] + item["seconds"], 3)
+                    note["last_seen"] = time.time()
+                    changed = True
+            if changed:
+                self._save()
+        return changed
+
+    def _save(self):
+        if not self.notes_file:
+            return
+        try:
+            with open(self.notes_file, 'w', encoding='utf-8') as f:
+                json.dump(self.notes, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"保存代码性能提示失败: {str(e)}")
+
+    def prompt_text(self):
+        """按累计耗时排序的性能提示，没有记录时返回空字符串"""
+        with self._lock:
+            notes = sorted(self.notes.values(), key=lambda note: note["seconds"], reverse=True)[:self.max_notes]
+        if not notes:
+            return ""
+        lines = [f"- {note['suggestion']}（以往生成的代码中出现{note['count']}次，累计耗时{note['seconds']:.1f}秒）"
+                 for note in notes]
+        return "性能提示（来自以往执行的性能分析）：\n" + "\n".join(lines)
@@ -0,0 +1,194 @@
+import pandas as pd
+from core.sketches import HyperLogLog, CountMinSketch, SpaceSaving, hash_values
+
+
+# 平均长度超过该值的文本列视为原始日志文本，不统计常见值和频次
+MAX_TOP_VALUE_LENGTH = 200
+# Space-Saving保留的计数器个数为top_k的倍数（计数器越多，前top_k个的计数越准确）
+TOP_CANDIDATE_FACTOR = 5
+# 逐块统计时每块的行数（value_counts的内存占用以块为上限）
+PROFILE_CHUNK_ROWS = 1000000
+# 不同值数低于该值时HyperLogLog的线性计数结果视为精确
+EXACT_DISTINCT_LIMIT = 100
+
+
+def _dtype_kind(dtype):
+    if pd.api.types.is_bool_dtype(dtype):
+        return "bool"
+    if pd.api.types.is_numeric_dtype(dtype):
+        return "number"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "datetime"
+    return "text"
+
+
+class ColumnProfile:
+    """单列统计：类型、空值率、近似不同值数、常见值及数值范围
+
+    不同值数用HyperLogLog、常见值用Space-Saving、任意取值的次数用Count-Min估计，内存占用固定，
+    追加数据时增量更新，同一列在多个文件（或多个数据块）上的统计可以合并。
+    """
+
+    def __init__(self, name, top_k=10):
+        self.name = name
+        self.top_k = top_k
+        self.dtype = None
+        self.kind = None
+        self.count = 0
+        self.nulls = 0
+        self.min = None
+        self.max = None
+        self.avg_length = None  # 文本列的平均长度
+        self.distinct_sketch = HyperLogLog()
+        self.heavy_hitters = SpaceSaving(top_k * TOP_CANDIDATE_FACTOR)
+        self.frequency = None  # Count-Min，原始日志文本列不统计
+
+    def update(self, series):
+        """用一批数据（整列或追加的行）更新统计"""
+        self.dtype = str(series.dtype)
+        self.kind = _dtype_kind(series.dtype)
+        self.count += len(series)
+        valid = series.dropna()
+        self.nulls += len(series) - len(valid)
+        if valid.empty:
+            return
+
+        if self.kind == "number":
+            low, high = valid.min(), valid.max()
+            self.min = low if self.min is None else min(self.min, low)
+            self.max = high if self.max is None else max(self.max, high)
+
+        text_length = None
+        if self.kind == "text":
+            text_length = float(valid.astype(str).str.len().mean())
+            previous = self.count - len(series) - (self.nulls - (len(series) - len(valid)))  # 之前的非空值个数
+            self.avg_length = text_length if self.avg_length is None else (
+                (self.avg_length * previous + text_length * len(valid)) / (previous + len(valid))
+            )
+
+        if text_length is not None and text_length > MAX_TOP_VALUE_LENGTH:
+            self.distinct_sketch.add(valid.to_numpy())
+            return
+
+        # 先在块内精确计数，再以不同值为单位更新各sketch
+        counts = valid.value_counts()
+        hashes = hash_values(counts.index.to_numpy())
+        self.distinct_sketch.add_hashes(hashes)
+        if self.frequency is None:
+            self.frequency = CountMinSketch()
+        self.frequency.add_hashes(hashes, counts.to_numpy())
+        self.heavy_hitters.update(counts)
+
+    def merge(self, other):
+        """合并同一列在另一文件（或数据块）上的统计"""
+        self.count += other.count
+        self.nulls += other.nulls
+        self.dtype = self.dtype or other.dtype
+        self.kind = self.kind or other.kind
+        if other.min is not None:
+            self.min = other.min if self.min is None else min(self.min, other.min)
+            self.max = other.max if self.max is None else max(self.max, other.max)
+        if other.avg_length is not None:
+            mine, theirs = self.count - self.nulls - (other.count - other.nulls), other.count - other.nulls
+            self.avg_length = other.avg_length if self.avg_length is None else (
+                (self.avg_length * mine + other.avg_length * theirs) / max(1, mine + theirs)
+            )
+        self.distinct_sketch.merge(other.distinct_sketch)
+        self.heavy_hitters.merge(other.heavy_hitters)
+        if other.frequency is not None:
+            if self.frequency is None:
+                self.frequency = CountMinSketch(other.frequency.width, other.frequency.depth)
+            self.frequency.merge(other.frequency)
+        return self
+
+    def copy(self):
+        return ColumnProfile(self.name, self.top_k).merge(self)
+
+    def estimate_count(self, value):
+        """估计某个取值出现的次数（上界，原始日志文本列返回None）"""
+        if self.frequency is None:
+            return None
+        return int(self.frequency.estimate([value])[0])
+
+    @property
+    def null_rate(self):
+        return self.nulls / self.count if self.count else 0.0
+
+    @property
+    def distinct(self):
+        """近似不同值数（HyperLogLog估计）"""
+        return self.distinct_sketch.count()
+
+    def top(self, k=None):
+        """出现次数最多的取值，返回[(取值, 次数上界, 高估量)]"""
+        return self.heavy_hitters.top(k or self.top_k)
+
+    def to_dict(self):
+        top = self.top()
+        return {
+            "name": str(self.name),
+            "dtype": self.dtype,
+            "kind": self.kind,
+            "count": self.count,
+            "null_rate": round(self.null_rate, 4),
+            "distinct": self.distinct,
+            "distinct_exact": self.distinct < EXACT_DISTINCT_LIMIT,
+            "min": self.min,
+            "max": self.max,
+            "avg_length": round(self.avg_length, 1) if self.avg_length is not None else None,
+            "top_values": [[value, count] for value, count, _ in top],
+            "top_exact": all(error == 0 for _, _, error in top)
+        }
+
+
+def profile_dataframe(df, top_k=10, profiles=None, chunk_rows=PROFILE_CHUNK_ROWS):
+    """按块计算（或用新数据增量更新）DataFrame各列的统计，返回{列名: ColumnProfile}"""
+    profiles = profiles if profiles is not None else {}
+    for col in df.columns:
+        if not isinstance(df[col], pd.Series):
+            continue  # 重复列名
+        profile = profiles.get(col)
+        if profile is None:
+            profile = profiles[col] = ColumnProfile(col, top_k)
+        for start in range(0, max(len(df), 1), chunk_rows):
+            profile.update(df[col].iloc[start:start + chunk_rows])
+    return profiles
+
+
+def merge_profiles(profiles):
+    """合并多个文件（或数据块）中同一列的统计，不修改原统计；列表为空或其中有None时返回None"""
+    merged = None
+    for profile in profiles:
+        if profile is None:
+            return None
+        merged = profile.copy() if merged is None else merged.merge(profile)
+    return merged
+
+
+def _short(value, limit=30):
+    text = str(value)
+    return text if len(text) <= limit else text[:limit] + "..."
+
+
+def format_profiles(profiles, top=5, value_transform=None):
+    """格式化列统计用于prompt或界面提示，每列一行"""
+    transform = value_transform or (lambda text: text)
+    lines = []
+    for profile in profiles.values():
+        info = profile.to_dict()
+        parts = [f"{transform(info['name'])}: {info['kind']}({info['dtype']})",
+                 f"空值率{info['null_rate']:.1%}",
+                 f"{'' if info['distinct_exact'] else '约'}{info['distinct']}个不同值"]
+        if info["min"] is not None:
+            parts.append(f"范围{_short(info['min'])}~{_short(info['max'])}")
+        if info["avg_length"] is not None and info["avg_length"] > MAX_TOP_VALUE_LENGTH:
+            parts.append(f"平均长度{info['avg_length']:.0f}")
+        elif info["distinct"] > 1:
+            # 只出现一次的值不算常见值（如唯一的时间戳、ID）；按次数下界判断，近似计数加"≈"
+            top_values = [(value, count, error) for value, count, error in profile.top(top) if count - error > 1]
+            if top_values:
+                values = "，".join(f"{transform(_short(value))}({'≈' if error else ''}{count})"
+                                  for value, count, error in top_values)
+                parts.append(f"常见值: {values}")
+        lines.append("; ".join(parts))
+    return "\n".join(lines)
@@ -0,0 +1,196 @@
+import json
+import numpy as np
+import pandas as pd
+from core.token_estimator import estimate_tokens
+from utils.helpers import json_default
+
+
+COUNT_COLUMN = "_count"
+
+
+def stratified_sample(df, rows=200, max_strata=50):
+    """按低基数列分层抽取少量行（保持原始行顺序），用于在样本上快速试运行代码
+
+    分层列为不同值最少（2到max_strata个）的列，每层至少保留1行，其余配额按各层行数占比分配；
+    分层列按前10000行的不同值数量选择，避免对全表逐列计数。
+    """
+    if len(df) <= rows:
+        return df
+    head = df.head(10000)
+    cardinalities = {}
+    for col in df.columns:
+        try:
+            n = head[col].nunique(dropna=False)
+        except TypeError:
+            continue  # 列表、字典等不可哈希的值
+        if 2 <= n <= max_strata:
+            cardinalities[col] = n
+    if not cardinalities:
+        step = len(df) / rows
+        return df.iloc[(np.arange(rows) * step).astype(int)]
+
+    strata_col = min(cardinalities, key=cardinalities.get)
+    groups = df.groupby(strata_col, dropna=False, sort=False)[strata_col]
+    share = groups.transform('size') / len(df)
+    quota = np.maximum(1, np.floor(share * rows)).astype(int)
+    # 各层内均匀间隔抽取，而不是只取每层的前几行
+    stride = np.maximum(1, groups.transform('size') // quota)
+    rank = groups.cumcount()
+    return df[(rank % stride == 0) & (rank // stride < quota)]
+
+
+class DataCompactor:
+    """按token预算压缩数据表，用于直接回答模式的prompt
+
+    依次执行：删除常量列 -> 高基数列改为top-k摘要 -> 完全重复的行合并计数 -> 分层抽样直到满足预算
+    """
+
+    def __init__(self, token_budget=24000, top_k=10, high_cardinality_ratio=0.5,
+                 min_high_cardinality=50, max_value_length=200, token_estimator=None,
+                 table_token_estimator=None):
+        self.token_budget = token_budget
+        self.top_k = top_k
+        # 不同值数量超过行数的该比例（且不少于min_high_cardinality）时视为高基数列
+        self.high_cardinality_ratio = high_cardinality_ratio
+        self.min_high_cardinality = min_high_cardinality
+        self.max_value_length = max_value_length
+        self.estimate_tokens = token_estimator or estimate_tokens
+        # 估算记录表序列化后token数的函数（参数为DataFrame），默认按逐行JSON估算
+        self.table_token_estimator = table_token_estimator
+
+    def compact(self, df, token_budget=None, summarize_high_cardinality=True):
+        """压缩单个数据表
+
+        Args:
+            summarize_high_cardinality: 为False时高基数列保留在记录中，不改为top-k摘要
+        Returns:
+            dict: {
+                "row_count": 原始行数,
+                "constant_columns": {列名: 唯一值},
+                "column_summaries": {列名: {"distinct": 不同值数量, "top": [[值, 次数], ...]}},
+                "records": 去重（含_count计数）并抽样后的记录（DataFrame）,
+                "distinct_rows": 去重后的行数,
+                "sampled": 是否经过抽样
+            }
+        """
+        budget = token_budget or self.token_budget
+        result = {
+            "row_count": int(len(df)),
+            "constant_columns": {},
+            "column_summaries": {},
+            "records": pd.DataFrame(),
+            "distinct_rows": 0,
+            "sampled": False
+        }
+        if df.empty:
+            return result
+
+        df = df.copy()
+        # 超长文本截断，避免单个值占用过多预算
+        for col in df.columns:
+            if df[col].dtype == 'object' or pd.api.types.is_string_dtype(df[col].dtype):
+                df[col] = df[col].astype(str).str.slice(0, self.max_value_length)
+
+        keep_columns = []
+        for col in df.columns:
+            series = df[col]
+            distinct = int(series.nunique(dropna=False))
+            if distinct <= 1:
+                value = series.iloc[0]
+                result["constant_columns"][str(col)] = None if pd.isna(value) else value
+            elif summarize_high_cardinality and \
+                    distinct > max(self.min_high_cardinality, self.high_cardinality_ratio * len(df)):
+                top = series.value_counts(dropna=False).head(self.top_k)
+                result["column_summaries"][str(col)] = {
+                    "distinct": distinct,
+                    "top": [[None if pd.isna(v) else v, int(c)] for v, c in top.items()]
+                }
+            else:
+                keep_columns.append(col)
+
+        if keep_columns:
+            deduped = (
+                df.groupby(keep_columns, dropna=False, sort=False)
+                .size()
+                .reset_index(name=COUNT_COLUMN)
+                .sort_values(COUNT_COLUMN, ascending=False, kind='stable')
+                .reset_index(drop=True)
+            )
+            result["distinct_rows"] = int(len(deduped))
+
+            overhead = self.estimate_tokens(self._dumps({k: v for k, v in result.items() if k != "records"}))
+            records_budget = max(0, budget - overhead)
+            sampled = self._stratified_sample(deduped, keep_columns, records_budget)
+            result["sampled"] = len(sampled) < len(deduped)
+            result["records"] = sampled.reset_index(drop=True)
+        return result
+
+    def compact_all(self, data_dict):
+        """压缩多个数据表，预算按各表行数比例分配（每个表至少分到平均预算的1/4）"""
+        total_rows = sum(len(df) for df in data_dict.values()) or 1
+        floor = self.token_budget / max(1, len(data_dict)) / 4
+        return {
+            name: self.compact(df, int(max(floor, self.token_budget * len(df) / total_rows)))
+            for name, df in data_dict.items()
+        }
+
+    def compact_chunks(self, df, chunk_budget, max_chunks=None):
+        """压缩后按预算把记录切分为多块（用于map-reduce直接回答）
+
+        去重和常量列处理与compact相同，但不抽样（超出max_chunks块的总预算时才抽样）；
+        高基数列（日志文本、IP、URL等）保留在记录中随块发送，块大小已由预算限制。
+
+        Returns:
+            (dict, list): 不含records的压缩元信息, 记录块列表（DataFrame）
+        """
+        total_budget = chunk_budget * max_chunks if max_chunks else float('inf')
+        result = self.compact(df, token_budget=total_budget, summarize_high_cardinality=False)
+        records = result.pop("records")
+        if records.empty:
+            return result, []
+
+        per_row = max(1e-6, self._estimate_records_tokens(records) / len(records))
+        rows_per_chunk = max(1, int(chunk_budget / per_row))
+        chunks = [records.iloc[start:start + rows_per_chunk] for start in range(0, len(records), rows_per_chunk)]
+        return result, chunks
+
+    def _dumps(self, obj):
+        return json.dumps(obj, ensure_ascii=False, default=json_default)
+
+    def _estimate_records_tokens(self, df):
+        """按前若干行的平均长度估算全部记录序列化后的token数"""
+        if df.empty:
+            return 0
+        if self.table_token_estimator:
+            return self.table_token_estimator(df)
+        head = df.head(200).to_dict(orient='records')
+        per_row = self.estimate_tokens(self._dumps(head)) / len(head)
+        return int(per_row * len(df))
+
+    def _stratified_sample(self, deduped, columns, budget):
+        """按低基数列分层，每层按出现次数优先保留，逐步缩小行数直到满足预算"""
+        estimated = self._estimate_records_tokens(deduped)
+        if estimated <= budget:
+            return deduped
+
+        # 选择不同值最少（至少2个）的列作为分层依据
+        strata_col = None
+        cardinalities = {col: deduped[col].nunique(dropna=False) for col in columns}
+        candidates = [col for col, n in cardinalities.items() if n >= 2]
+        if candidates:
+            strata_col = min(candidates, key=lambda c: cardinalities[c])
+
+        target = max(1, int(len(deduped) * budget / estimated))
+        while True:
+            if strata_col is None:
+                sample = deduped.head(target)
+            else:
+                # 各层配额按该层的总出现次数占比分配，每层至少保留1行
+                weights = deduped.groupby(strata_col, dropna=False, sort=False)[COUNT_COLUMN].transform('sum')
+                share = weights / deduped[COUNT_COLUMN].sum()
+                quota = np.maximum(1, np.floor(share * target)).astype(int)
+                rank = deduped.groupby(strata_col, dropna=False, sort=False).cumcount()
+                sample = deduped[rank < quota]
+            if target <= 1 or self._estimate_records_tokens(sample) <= budget:
+                return sample
+            target = max(1, int(target * 0.7))
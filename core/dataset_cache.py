@@ -0,0 +1,154 @@
+import os
+import pickle
+import hashlib
+import threading
+from collections import OrderedDict
+
+
+# 文件头部校验长度，用于识别日志轮转（文件被替换或截断后重新写入）
+HEAD_CHECKSUM_BYTES = 4096
+
+# 文件状态检查结果
+STATE_UNCHANGED = "unchanged"
+STATE_APPENDED = "appended"
+STATE_RELOAD = "reload"
+
+
+def head_checksum(path, length=HEAD_CHECKSUM_BYTES):
+    """计算文件头部的校验值，返回(校验值, 实际参与校验的字节数)"""
+    with open(path, 'rb') as f:
+        head = f.read(length)
+    return hashlib.sha1(head).hexdigest(), len(head)
+
+
+class DatasetEntry:
+    """单个文件的缓存数据集：脱敏后的DataFrame及增量读取状态"""
+
+    def __init__(self, file_name, path, df, mask_signature, encoding=None):
+        self.file_name = file_name
+        self.path = path
+        self.df = df
+        self.mask_signature = mask_signature  # 加载时的敏感词签名，敏感词变化后缓存失效
+        self.encoding = encoding
+        self.columns = None  # 列裁剪加载时只包含的列，None表示全部列
+        self.all_columns = list(df.columns)  # 文件的完整列名（增量读取无表头的追加内容时使用）
+        self.offset = None  # 已解析到的字节偏移，None表示不支持增量读取
+        self.size = 0
+        self.mtime_ns = 0
+        self.inode = None
+        self.head_checksum = None
+        self.head_length = 0
+        self.extras = {}  # 数据集派生结构（随数据集一起缓存）
+
+    def covers(self, usecols):
+        """缓存的数据是否包含所需的列（usecols为None表示需要全部列）"""
+        if self.columns is None:
+            return True
+        return usecols is not None and set(usecols) <= set(self.columns)
+
+    def update_file_state(self, st, offset=None):
+        """记录文件状态（大小、修改时间、inode、头部校验）"""
+        self.size = st.st_size
+        self.mtime_ns = st.st_mtime_ns
+        self.inode = st.st_ino
+        self.offset = offset
+        self.head_checksum, self.head_length = head_checksum(self.path)
+
+    def check_file_state(self, st, mask_signature):
+        """比对当前文件状态，判断缓存可直接使用、可增量追加还是需要全量重载"""
+        if mask_signature != self.mask_signature:
+            return STATE_RELOAD
+        if st.st_ino != self.inode:
+            return STATE_RELOAD
+        if st.st_size == self.size and st.st_mtime_ns == self.mtime_ns:
+            return STATE_UNCHANGED
+        if self.offset is None or st.st_size < self.offset:
+            return STATE_RELOAD
+
+        # 头部内容变化说明文件已被轮转或重写
+        try:
+            checksum, _ = head_checksum(self.path, self.head_length)
+        except OSError:
+            return STATE_RELOAD
+        if checksum != self.head_checksum:
+            return STATE_RELOAD
+        return STATE_APPENDED if st.st_size > self.offset else STATE_UNCHANGED
+
+
+class DatasetCache:
+    """脱敏后数据集的缓存（内存LRU，可选持久化到缓存目录）"""
+
+    def __init__(self, cache_dir=None, max_entries=16, persist=False):
+        self.cache_dir = os.path.join(cache_dir, 'datasets') if cache_dir else None
+        self.max_entries = max_entries
+        self.persist = persist and self.cache_dir is not None
+        self._entries = OrderedDict()  # 格式: {文件绝对路径: DatasetEntry}
+        self._lock = threading.RLock()
+
+    def _disk_path(self, path):
+        digest = hashlib.sha1(os.path.abspath(path).encode('utf-8')).hexdigest()
+        return os.path.join(self.cache_dir, f"{digest}.pkl")
+
+    def get(self, path, from_disk=True):
+        """获取文件对应的缓存数据集，内存中没有时尝试从磁盘加载（from_disk为False时只查内存）"""
+        path = os.path.abspath(path)
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is not None:
+                self._entries.move_to_end(path)
+                return entry
+
+        if not self.persist or not from_disk:
+            return None
+        try:
+            with open(self._disk_path(path), 'rb') as f:
+                entry = pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ImportError):
+            return None
+        if not isinstance(entry, DatasetEntry) or entry.path != path:
+            return None
+        self._put_memory(path, entry)
+        return entry
+
+    def put(self, entry):
+        """写入缓存数据集（开启持久化时同步写入磁盘）"""
+        entry.path = os.path.abspath(entry.path)
+        self._put_memory(entry.path, entry)
+        if self.persist:
+            self.save(entry)
+
+    def save(self, entry):
+        """持久化单个缓存数据集"""
+        if not self.persist:
+            return
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            disk_path = self._disk_path(entry.path)
+            with open(disk_path + '.tmp', 'wb') as f:
+                pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(disk_path + '.tmp', disk_path)
+        except (OSError, pickle.PicklingError) as e:
+            print(f"保存数据集缓存失败: {str(e)}")
+
+    def _put_memory(self, path, entry):
+        with self._lock:
+            self._entries[path] = entry
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, path=None):
+        """清除指定文件（默认全部）的缓存"""
+        with self._lock:
+            if path is None:
+                paths = list(self._entries.keys())
+                self._entries.clear()
+            else:
+                paths = [os.path.abspath(path)]
+                self._entries.pop(paths[0], None)
+        if self.persist:
+            for p in paths:
+                try:
+                    os.remove(self._disk_path(p))
+                except OSError:
+                    pass
@@ -0,0 +1,246 @@
+import os
+import re
+import gc
+import pickle
+import builtins
+import threading
+import traceback
+import queue
+import multiprocessing
+from multiprocessing import shared_memory
+from concurrent.futures import ThreadPoolExecutor
+import pandas as pd
+import numpy as np
+from core.code_profiler import profile_exec
+
+try:
+    import resource  # 仅类Unix系统可用，用于限制子进程内存
+except ImportError:
+    resource = None
+
+
+# 子进程执行结束后需要取回的变量
+RESULT_VARIABLES = ("result_table", "summary", "chart_info")
+
+
+class ExecutionError(RuntimeError):
+    """生成代码在子进程中执行失败（代码异常、超时、超出内存限制或子进程崩溃）"""
+
+
+def share_frames(data_dict):
+    """把数据字典写入一块共享内存
+
+    使用pickle协议5的带外缓冲区：数值列等连续数组的数据直接复制到共享内存，
+    子进程按偏移量映射后零拷贝还原为DataFrame，只有对象列等不支持带外的部分随pickle数据写入。
+    文本列（object或python存储的str类型）的每个值都是独立的Python对象，不能带外传递，
+    会完整序列化并在子进程中重新创建，文本列很大时子进程的内存和还原耗时随之增长。
+
+    Returns:
+        (SharedMemory, dict): 共享内存（由调用方负责释放）, 子进程还原数据所需的描述信息
+    """
+    buffers = []
+    payload = pickle.dumps(data_dict, protocol=5, buffer_callback=buffers.append)
+    raws = [buffer.raw() for buffer in buffers]
+    total = len(payload) + sum(raw.nbytes for raw in raws)
+    shm = shared_memory.SharedMemory(create=True, size=max(1, total))
+    shm.buf[:len(payload)] = payload
+    offset = len(payload)
+    segments = []
+    for raw in raws:
+        shm.buf[offset:offset + raw.nbytes] = raw
+        segments.append((offset, raw.nbytes))
+        offset += raw.nbytes
+    return shm, {"name": shm.name, "payload": len(payload), "segments": segments, "size": total}
+
+
+def _attach_frames(descriptor):
+    """子进程中映射共享内存并还原数据字典（数组直接引用共享内存，不复制）"""
+    shm = shared_memory.SharedMemory(name=descriptor["name"])
+    buffers = [shm.buf[offset:offset + length] for offset, length in descriptor["segments"]]
+    data_dict = pickle.loads(shm.buf[:descriptor["payload"]], buffers=buffers)
+    return shm, data_dict
+
+
+def _virtual_memory_bytes():
+    """当前进程的虚拟内存大小（仅Linux可读取，其他系统返回None）"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        return None
+
+
+def _set_memory_limit(limit_bytes):
+    """设置本进程的地址空间上限，返回原上限；系统不支持时返回None（不限制）"""
+    if resource is None or not limit_bytes:
+        return None
+    current = _virtual_memory_bytes()
+    if current is None:
+        return None
+    soft, hard = resource.getrlimit(resource.RLIMIT_AS)
+    limit = current + limit_bytes
+    if hard != resource.RLIM_INFINITY:
+        limit = min(limit, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (limit, hard))
+    return soft, hard
+
+
+def _run_job(code, descriptor, memory_limit_bytes, profile):
+    shm, data_dict = _attach_frames(descriptor)
+    namespace = {"__builtins__": builtins, "data_dict": data_dict, "pd": pd, "np": np, "re": re}
+    previous_limit = _set_memory_limit(memory_limit_bytes)
+    try:
+        report = None
+        if profile:
+            report = profile_exec(code, namespace)
+        else:
+            exec(code, namespace)
+        result = {name: namespace[name] for name in RESULT_VARIABLES if name in namespace}
+        if report is not None:
+            result["profile"] = report
+        # 结果可能引用共享内存中的数据（如直接返回原表），先序列化再释放
+        return pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+    except MemoryError:
+        raise ExecutionError(f"代码执行超出内存限制（{memory_limit_bytes // (1024 * 1024)} MB）")
+    finally:
+        if previous_limit is not None:
+            resource.setrlimit(resource.RLIMIT_AS, previous_limit)
+        namespace.clear()
+        del data_dict
+        gc.collect()
+        try:
+            shm.close()
+        except BufferError:
+            pass  # 仍有对象引用共享内存，进程内映射随这些对象回收
+
+
+def _worker_main(conn):
+    """子进程入口：pandas/numpy已在导入本模块时加载，循环接收并执行任务"""
+    while True:
+        try:
+            message = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            return
+        if message is None:
+            return
+        code, descriptor, memory_limit_bytes, profile = message
+        try:
+            conn.send(("ok", _run_job(code, descriptor, memory_limit_bytes, profile)))
+        except Exception as e:
+            detail = "".join(traceback.format_exception_only(type(e), e)).strip()
+            conn.send(("error", str(e) if isinstance(e, ExecutionError) else detail))
+
+
+class _Worker:
+    """一个常驻子进程及其通信管道"""
+
+    def __init__(self, context):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn,), daemon=True,
+                                       name="code-execution-worker")
+        self.process.start()
+        child_conn.close()
+
+    def alive(self):
+        return self.process.is_alive()
+
+    def stop(self, force=False):
+        try:
+            if not force:
+                self.conn.send(None)
+                self.process.join(1)
+        except (OSError, ValueError):
+            pass
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join(1)
+        self.conn.close()
+
+
+class ExecutionPool:
+    """预热的子进程池，用于隔离执行生成代码
+
+    子进程启动时即导入pandas/numpy，任务到来时无需等待导入；数据通过共享内存传递。
+    每个任务有墙钟时间上限（超时后终止该子进程并补充新进程），
+    类Unix系统上还可限制每个任务的内存（地址空间）。多个任务在不同子进程中并行执行。
+    """
+
+    def __init__(self, workers=2, timeout=600.0, memory_limit_mb=None):
+        self.size = max(1, int(workers))
+        self.timeout = timeout
+        self.memory_limit_bytes = int(memory_limit_mb * 1024 * 1024) if memory_limit_mb else None
+        # 使用spawn启动：不继承GUI进程的线程和Qt状态，各平台行为一致
+        self._context = multiprocessing.get_context("spawn")
+        self._idle = queue.Queue()
+        self._workers = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self._dispatcher = ThreadPoolExecutor(max_workers=self.size, thread_name_prefix="execution-pool")
+
+    def start(self):
+        """启动（预热）全部子进程，可重复调用"""
+        with self._lock:
+            while len(self._workers) < self.size and not self._closed:
+                worker = _Worker(self._context)
+                self._workers.append(worker)
+                self._idle.put(worker)
+        return self
+
+    def _replace(self, worker):
+        """终止出错或超时的子进程并启动新进程补充"""
+        worker.stop(force=True)
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+            if self._closed:
+                return
+            replacement = _Worker(self._context)
+            self._workers.append(replacement)
+        self._idle.put(replacement)
+
+    def submit(self, code, data_dict, timeout=None, profile=False):
+        """提交任务，返回Future，结果为{变量名: 值}（result_table/summary/chart_info，开启profile时另有profile报告）"""
+        if self._closed:
+            raise ExecutionError("执行进程池已关闭")
+        self.start()
+        return self._dispatcher.submit(self._run, code, data_dict, timeout or self.timeout, profile)
+
+    def run(self, code, data_dict, timeout=None, profile=False):
+        return self.submit(code, data_dict, timeout, profile).result()
+
+    def _run(self, code, data_dict, timeout, profile):
+        shm, descriptor = share_frames(data_dict)
+        worker = self._idle.get()
+        try:
+            if not worker.alive():
+                self._replace(worker)
+                worker = self._idle.get()
+            try:
+                worker.conn.send((code, descriptor, self.memory_limit_bytes, profile))
+                if not worker.conn.poll(timeout):
+                    self._replace(worker)
+                    worker = None
+                    raise ExecutionError(f"代码执行超时（超过 {timeout:g} 秒），已终止执行进程")
+                status, payload = worker.conn.recv()
+            except (EOFError, OSError) as e:
+                self._replace(worker)
+                worker = None
+                raise ExecutionError(f"代码执行进程异常退出（可能超出内存限制）: {str(e) or type(e).__name__}")
+        finally:
+            if worker is not None:
+                self._idle.put(worker)
+            shm.close()
+            shm.unlink()
+
+        if status != "ok":
+            raise ExecutionError(payload)
+        return pickle.loads(payload)
+
+    def shutdown(self):
+        with self._lock:
+            self._closed = True
+            workers, self._workers = self._workers, []
+        self._dispatcher.shutdown(wait=False)
+        for worker in workers:
+            worker.stop()
+
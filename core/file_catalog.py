@@ -0,0 +1,258 @@
+import os
+import json
+import codecs
+import hashlib
+import threading
+
+
+class FileCatalog:
+    """数据目录索引：基于os.scandir构建并持久化，列表/筛选/排序查询不再访问文件系统
+
+    每个文件记录: name, size, mtime_ns, format, encoding, est_rows
+    其中encoding和est_rows需要读取文件头部，放在fill_details中按需补全（可在后台线程执行）
+    """
+
+    # 估算行数和检测编码时读取的文件头部字节数
+    SAMPLE_BYTES = 64 * 1024
+    # 二进制格式不检测编码
+    BINARY_FORMATS = {'excel'}
+
+    def __init__(self, cache_dir, extension_map, encodings=None):
+        self.cache_dir = os.path.join(cache_dir, 'catalog') if cache_dir else None
+        self.encodings = encodings or ['utf-8', 'gbk', 'gb2312', 'ansi', 'utf-16', 'utf-16-le']
+        # 扩展名 -> 格式名（如 '.csv' -> 'csv'）
+        self.format_map = {
+            ext: self._format_name(processor)
+            for ext, processor in extension_map.items()
+        }
+        self._lock = threading.RLock()
+        self._catalogs = {}  # 格式: {目录绝对路径: {"dir_mtime_ns": int, "entries": {文件名: 记录}}}
+
+    @staticmethod
+    def _format_name(processor):
+        """由处理器类名推导格式名（CsvFileProcessor -> csv）"""
+        name = type(processor).__name__
+        return name[:-len('FileProcessor')].lower() if name.endswith('FileProcessor') else name.lower()
+
+    def _catalog_path(self, directory):
+        digest = hashlib.sha1(directory.encode('utf-8')).hexdigest()[:16]
+        return os.path.join(self.cache_dir, f"{digest}.json")
+
+    def _get_catalog(self, directory):
+        """获取目录索引，内存中没有时从磁盘加载"""
+        directory = os.path.abspath(directory)
+        catalog = self._catalogs.get(directory)
+        if catalog is None:
+            catalog = {"dir_mtime_ns": None, "entries": {}}
+            if self.cache_dir:
+                try:
+                    with open(self._catalog_path(directory), 'r', encoding='utf-8') as f:
+                        loaded = json.load(f)
+                    if loaded.get("directory") == directory:
+                        catalog["dir_mtime_ns"] = loaded.get("dir_mtime_ns")
+                        catalog["entries"] = loaded.get("entries", {})
+                except (OSError, ValueError):
+                    pass
+            self._catalogs[directory] = catalog
+        return directory, catalog
+
+    def save(self, directory):
+        """持久化目录索引"""
+        if not self.cache_dir:
+            return
+        with self._lock:
+            directory, catalog = self._get_catalog(directory)
+            data = {"directory": directory, **catalog}
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            tmp_path = self._catalog_path(directory) + '.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self._catalog_path(directory))
+        except OSError as e:
+            print(f"保存文件目录索引失败: {str(e)}")
+
+    def refresh(self, directory, check_files=False):
+        """增量刷新目录索引
+
+        目录mtime未变化时（没有文件增删/重命名）直接使用已有索引；
+        check_files=True 时无论目录mtime是否变化都重新比对每个文件的size/mtime。
+        Returns:
+            bool: 索引是否发生变化
+        """
+        if not directory or not os.path.isdir(directory):
+            return False
+
+        with self._lock:
+            directory, catalog = self._get_catalog(directory)
+            dir_mtime_ns = os.stat(directory).st_mtime_ns
+            if not check_files and catalog["dir_mtime_ns"] == dir_mtime_ns:
+                return False
+
+            old_entries = catalog["entries"]
+            new_entries = {}
+            changed = False
+            with os.scandir(directory) as it:
+                for entry in it:
+                    if entry.name.startswith('.'):
+                        continue
+                    try:
+                        if not entry.is_file():
+                            continue
+                        st = entry.stat()
+                    except OSError:
+                        continue
+
+                    old = old_entries.get(entry.name)
+                    if old and old["size"] == st.st_size and old["mtime_ns"] == st.st_mtime_ns:
+                        new_entries[entry.name] = old
+                        continue
+
+                    ext = os.path.splitext(entry.name)[1].lower()
+                    new_entries[entry.name] = {
+                        "name": entry.name,
+                        "size": st.st_size,
+                        "mtime_ns": st.st_mtime_ns,
+                        "format": self.format_map.get(ext),
+                        "encoding": None,
+                        "est_rows": None,
+                        "detailed": False
+                    }
+                    changed = True
+
+            changed = changed or len(new_entries) != len(old_entries)
+            catalog["entries"] = new_entries
+            catalog["dir_mtime_ns"] = dir_mtime_ns
+
+        if changed:
+            self.save(directory)
+        return changed
+
+    def fill_details(self, directory, names=None, stop_flag=None):
+        """补全编码和估算行数（仅读取文件头部），返回补全的文件数
+
+        Args:
+            names: 只补全指定文件，默认补全所有缺少详情的文件
+            stop_flag: 可选的无参可调用对象，返回True时提前结束
+        """
+        with self._lock:
+            directory, catalog = self._get_catalog(directory)
+            pending = [
+                entry for name, entry in catalog["entries"].items()
+                if not entry.get("detailed") and (names is None or name in names)
+            ]
+
+        count = 0
+        for entry in pending:
+            if stop_flag and stop_flag():
+                break
+            encoding, est_rows = self._detect_details(os.path.join(directory, entry["name"]), entry)
+            with self._lock:
+                entry["encoding"] = encoding
+                entry["est_rows"] = est_rows
+                entry["detailed"] = True
+            count += 1
+
+        if count:
+            self.save(directory)
+        return count
+
+    def _detect_details(self, path, entry):
+        """读取文件头部，检测编码并按换行密度估算行数"""
+        fmt = entry.get("format")
+        if fmt is None or fmt in self.BINARY_FORMATS:
+            return None, None
+        try:
+            with open(path, 'rb') as f:
+                sample = f.read(self.SAMPLE_BYTES)
+        except OSError:
+            return None, None
+        if not sample:
+            return None, 0
+
+        encoding = detect_encoding(sample, self.encodings)
+        est_rows = self._estimate_rows(sample, entry["size"], fmt, encoding)
+        return encoding, est_rows
+
+    @staticmethod
+    def _estimate_rows(sample, size, fmt, encoding):
+        if encoding and encoding.lower().startswith('utf-16'):
+            newline = '\n'.encode(encoding)
+            if newline.startswith(codecs.BOM_UTF16_LE) or newline.startswith(codecs.BOM_UTF16_BE):
+                newline = newline[2:]
+        else:
+            newline = b'\n'
+
+        if fmt == 'json':
+            # JSON按对象起始符估算记录数（嵌套对象会导致偏大，仅作参考）
+            marker_count = sample.count(b'{')
+        else:
+            marker_count = sample.count(newline)
+            if len(sample) == size and not sample.endswith(newline):
+                marker_count += 1  # 最后一行没有换行符
+
+        est_rows = marker_count if len(sample) >= size else int(marker_count * size / len(sample))
+        if fmt == 'csv' and est_rows > 0:
+            est_rows -= 1  # 表头行
+        return est_rows
+
+    def get_entry(self, directory, name):
+        """获取单个文件的索引记录（不访问文件系统）"""
+        with self._lock:
+            _, catalog = self._get_catalog(directory)
+            entry = catalog["entries"].get(name)
+            return dict(entry) if entry else None
+
+    def list_files(self, directory, pattern=None, formats=None, min_size=None, max_size=None,
+                   sort_by='name', reverse=False):
+        """按条件查询索引中的文件（不访问文件系统）
+
+        Args:
+            pattern: 文件名包含的子串（不区分大小写）
+            formats: 允许的格式集合（如 {'csv', 'txt'}）
+            min_size/max_size: 文件大小范围（字节）
+            sort_by: 排序字段 name/size/mtime_ns/format/est_rows
+        Returns:
+            list: 文件索引记录列表
+        """
+        with self._lock:
+            _, catalog = self._get_catalog(directory)
+            entries = list(catalog["entries"].values())
+
+        if pattern:
+            pattern = pattern.lower()
+            entries = [e for e in entries if pattern in e["name"].lower()]
+        if formats:
+            entries = [e for e in entries if e.get("format") in formats]
+        if min_size is not None:
+            entries = [e for e in entries if e["size"] >= min_size]
+        if max_size is not None:
+            entries = [e for e in entries if e["size"] <= max_size]
+
+        if sort_by == 'name':
+            entries.sort(key=lambda e: e["name"].lower(), reverse=reverse)
+        else:
+            # 缺失值（如未补全的est_rows）统一排在最后
+            present = [e for e in entries if e.get(sort_by) is not None]
+            missing = [e for e in entries if e.get(sort_by) is None]
+            present.sort(key=lambda e: e[sort_by], reverse=reverse)
+            entries = present + missing
+
+        return [dict(e) for e in entries]
+
+
+def detect_encoding(sample, encodings):
+    """按顺序尝试编码解码文件头部，返回第一个成功的编码"""
+    if sample.startswith(codecs.BOM_UTF8):
+        return 'utf-8-sig'
+    if sample.startswith(codecs.BOM_UTF16_LE) or sample.startswith(codecs.BOM_UTF16_BE):
+        return 'utf-16'
+
+    for encoding in encodings:
+        try:
+            # 使用增量解码器，容忍样本末尾被截断的多字节字符
+            codecs.getincrementaldecoder(encoding)().decode(sample, final=False)
+            return encoding
+        except (UnicodeDecodeError, LookupError):
+            continue
+    return None
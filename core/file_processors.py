@@ -1,6 +1,9 @@
+import io
+import codecs
 import pandas as pd
 import json
 from abc import ABC, abstractmethod
+from core.file_catalog import detect_encoding
 
 
 class FileProcessor(ABC):
@@ -17,7 +20,7 @@ class FileProcessor(ABC):
         Args:
             file_path: 文件路径
             encodings: 尝试的编码列表
-            kwargs: 额外参数
+            kwargs: 额外参数（usecols: 只读取指定的列）
         Returns:
             pd.DataFrame: 读取的数据
         Raises:
@@ -25,6 +28,38 @@ class FileProcessor(ABC):
         """
         pass
 
+    def probe_file(self, file_path, nrows=5, encodings=None, **kwargs):
+        """只读取表头和前nrows行（或有限的字节前缀），用于快速获取结构和样本
+        子类未实现时退回全量读取后截取
+        """
+        return self.read_file(file_path, encodings=encodings, **kwargs).head(nrows)
+
+    def supports_incremental(self):
+        """是否支持增量读取追加内容（按行追加的文本格式）"""
+        return False
+
+    def read_appended(self, file_path, offset, encoding, columns, **kwargs):
+        """读取offset之后追加的完整行并返回(DataFrame, 新的offset)
+        Args:
+            file_path: 文件路径
+            offset: 上次读取结束的字节偏移
+            encoding: 文件编码
+            columns: 文件的完整列名（追加内容没有表头）
+            kwargs: 额外参数（usecols: 只读取指定的列）
+        """
+        raise NotImplementedError(f"{type(self).__name__} 不支持增量读取")
+
+    @staticmethod
+    def _read_appended_lines(file_path, offset, encoding):
+        """读取offset之后的完整行（末尾未写完的行留到下次读取）"""
+        with open(file_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind(b'\n')
+        if end < 0:
+            return "", offset
+        return data[:end + 1].decode(encoding, errors='replace'), offset + end + 1
+
 
 class CsvFileProcessor(FileProcessor):
     def get_supported_extensions(self):
@@ -47,13 +82,50 @@ class CsvFileProcessor(FileProcessor):
                     engine=kwargs.get('engine', 'python'),
                     header=header,
                     # 忽略空行，增强容错性
-                    skip_blank_lines=True
+                    skip_blank_lines=True,
+                    # 列裁剪：只解析需要的列
+                    usecols=kwargs.get('usecols')
                 )
             except (UnicodeDecodeError, pd.errors.ParserError) as e:
                 # 细化异常捕获，避免非编码问题被忽略
                 continue
         raise ValueError(f"CSV文件读取失败，已尝试编码: {encodings}")
 
+    def probe_file(self, file_path, nrows=5, encodings=None, **kwargs):
+        encodings = encodings or ['utf-8', 'gbk', 'gb2312', 'ansi', 'utf-16', 'utf-16-le']
+        for encoding in encodings:
+            try:
+                return pd.read_csv(
+                    file_path,
+                    encoding=encoding,
+                    sep=kwargs.get('sep', ','),
+                    engine=kwargs.get('engine', 'python'),
+                    header=kwargs.get('header', 'infer'),
+                    skip_blank_lines=True,
+                    nrows=nrows
+                )
+            except (UnicodeDecodeError, LookupError, pd.errors.ParserError):
+                continue
+        raise ValueError(f"CSV文件读取失败，已尝试编码: {encodings}")
+
+    def supports_incremental(self):
+        return True
+
+    def read_appended(self, file_path, offset, encoding, columns, **kwargs):
+        text, new_offset = self._read_appended_lines(file_path, offset, encoding)
+        if not text.strip():
+            return pd.DataFrame(columns=kwargs.get('usecols') or columns), new_offset
+        df = pd.read_csv(
+            io.StringIO(text),
+            sep=kwargs.get('sep', ','),
+            engine=kwargs.get('engine', 'python'),
+            header=None,
+            names=columns,
+            skip_blank_lines=True,
+            usecols=kwargs.get('usecols')
+        )
+        return df, new_offset
+
 
 class ExcelFileProcessor(FileProcessor):
     def get_supported_extensions(self):
@@ -72,12 +144,28 @@ class ExcelFileProcessor(FileProcessor):
                     engine=engine,
                     # 忽略空行
                     skiprows=lambda x: x in kwargs.get('skip_rows', []),
-                    keep_default_na=False  # 避免将空字符串识别为NaN
+                    keep_default_na=False,  # 避免将空字符串识别为NaN
+                    usecols=kwargs.get('usecols')
                 )
             except (ValueError, ImportError, pd.errors.ParserError) as e:
                 continue
         raise ValueError(f"Excel文件读取失败，已尝试引擎: {engines}")
 
+    def probe_file(self, file_path, nrows=5, encodings=None, **kwargs):
+        engines = kwargs.get('engines', ['openpyxl', 'xlrd'])
+        for engine in engines:
+            try:
+                return pd.read_excel(
+                    file_path,
+                    sheet_name=kwargs.get('sheet_name', 0),
+                    engine=engine,
+                    nrows=nrows,
+                    keep_default_na=False
+                )
+            except (ValueError, ImportError, pd.errors.ParserError):
+                continue
+        raise ValueError(f"Excel文件读取失败，已尝试引擎: {engines}")
+
 class JsonFileProcessor(FileProcessor):
     def get_supported_extensions(self):
         return ['.json']
@@ -94,16 +182,52 @@ class JsonFileProcessor(FileProcessor):
                     data = json.load(f, strict=strict)
                 # 支持更多JSON结构（如嵌套字典）
                 if isinstance(data, list):
-                    return pd.DataFrame(data)
+                    df = pd.DataFrame(data)
                 elif isinstance(data, dict):
                     # 嵌套字典转为多列
-                    return pd.json_normalize(data)
+                    df = pd.json_normalize(data)
                 else:
                     raise ValueError("JSON格式不支持（需为列表或对象）")
+                usecols = kwargs.get('usecols')
+                if usecols:
+                    # JSON需完整解析，列裁剪在构建DataFrame后进行（仍可减少脱敏和内存开销）
+                    df = df[[col for col in usecols if col in df.columns]]
+                return df
             except (json.JSONDecodeError, UnicodeDecodeError):
                 continue
         raise ValueError(f"JSON文件读取失败，已尝试编码: {encodings}")
 
+    def probe_file(self, file_path, nrows=5, encodings=None, **kwargs):
+        """顶层为数组时只解码有限字节前缀中的前nrows条记录，其他结构退回全量读取"""
+        encodings = encodings or ['utf-8', 'gbk', 'gb2312', 'ansi', 'utf-16']
+        max_bytes = kwargs.get('max_bytes', 1024 * 1024)
+        with open(file_path, 'rb') as f:
+            prefix = f.read(max_bytes)
+
+        encoding = detect_encoding(prefix, encodings)
+        if encoding:
+            text = codecs.getincrementaldecoder(encoding)(errors='replace').decode(prefix, final=False)
+            text = text.lstrip('\ufeff').lstrip()
+            if text.startswith('['):
+                decoder = json.JSONDecoder(strict=kwargs.get('strict', False))
+                records = []
+                pos = 1
+                try:
+                    while len(records) < nrows:
+                        while pos < len(text) and text[pos] in ' \t\r\n,':
+                            pos += 1
+                        if pos >= len(text) or text[pos] == ']':
+                            break
+                        record, pos = decoder.raw_decode(text, pos)
+                        records.append(record)
+                except json.JSONDecodeError:
+                    # 前缀末尾的记录被截断，使用已完整解码的记录
+                    pass
+                if records:
+                    return pd.DataFrame(records)
+
+        return self.read_file(file_path, encodings=encodings, **kwargs).head(nrows)
+
 class TxtFileProcessor(FileProcessor):
     def get_supported_extensions(self):
         return ['.txt', '.log']
@@ -123,4 +247,37 @@ class TxtFileProcessor(FileProcessor):
                 )
             except Exception:
                 continue
-        raise ValueError(f"TXT/LOG文件读取失败，已尝试编码: {encodings}")
\ No newline at end of file
+        raise ValueError(f"TXT/LOG文件读取失败，已尝试编码: {encodings}")
+
+    def probe_file(self, file_path, nrows=5, encodings=None, **kwargs):
+        encodings = encodings or ['utf-8', 'gbk', 'gb2312', 'ansi']
+        for encoding in encodings:
+            try:
+                return pd.read_csv(
+                    file_path,
+                    encoding=encoding,
+                    sep=kwargs.get('delimiter', '\t'),
+                    engine='python',
+                    header=None,
+                    names=['event'],
+                    nrows=nrows
+                )
+            except Exception:
+                continue
+        raise ValueError(f"TXT/LOG文件读取失败，已尝试编码: {encodings}")
+
+    def supports_incremental(self):
+        return True
+
+    def read_appended(self, file_path, offset, encoding, columns, **kwargs):
+        text, new_offset = self._read_appended_lines(file_path, offset, encoding)
+        if not text.strip():
+            return pd.DataFrame(columns=columns), new_offset
+        df = pd.read_csv(
+            io.StringIO(text),
+            sep=kwargs.get('delimiter', '\t'),
+            engine='python',
+            header=None,
+            names=columns
+        )
+        return df, new_offset
\ No newline at end of file
@@ -1,12 +1,136 @@
 import os
+import re
+import time
 import pandas as pd
+import numpy as np
 import json
 from utils.helpers import get_file_list, sanitize_filename
-from core.api_client import DeepSeekAPI
+from core.api_client import DeepSeekAPI, DEFAULT_BASE_URL, RequestCancelledError
 from core.file_processors import (
     CsvFileProcessor, ExcelFileProcessor,
     JsonFileProcessor, TxtFileProcessor
 )
+from core.file_catalog import FileCatalog, detect_encoding
+from core.dataset_cache import (
+    DatasetCache, DatasetEntry, STATE_UNCHANGED, STATE_APPENDED
+)
+from core.time_index import TimeIndex, detect_timestamp_columns
+from core.code_analysis import find_column_references
+from core.data_compactor import DataCompactor
+from core.prompt_serializer import TabularPromptSerializer
+from core.prompt_builder import PromptBuilder, PromptCacheStats
+from core.token_estimator import TokenEstimator
+from core.response_cache import ResponseCache
+from core.rate_limiter import RateLimiter, CircuitBreaker
+from core.code_cache import CodeCache, schema_fingerprint
+from core.execution_pool import ExecutionPool
+from core.code_profiler import PerformanceFeedback
+from core.query_templates import QueryRouter, detect_column_roles
+from core.column_profile import profile_dataframe, format_profiles, merge_profiles
+from core.time_rollup import TimeRollups, ROLLUP_ATTR
+from core.text_index import InvertedIndex, ValueIndex, parse_query, search_rows, scan_rows, text_columns
+
+
+# 直接回答模式下压缩数据格式的说明（单次回答和map-reduce分块分析共用）
+DIRECT_ANSWER_DATA_NOTES = """    数据说明：
+    - row_count为原始行数；表格中完全相同的行已合并，_count列为该行出现的次数
+    - constant_columns中的列在所有行中取值相同，已从表格中移除
+    - column_summaries中的列不同值过多，仅给出不同值数量和出现次数最多的值（top），已从表格中移除
+    - sampled为true时表格是按出现次数优先的分层抽样结果，并非全部不同行
+"""
+
+
+# 时间预聚合表的使用说明（仅在所选文件有预聚合时加入prompt）
+ROLLUP_PROMPT_NOTES = """时间预聚合表（按时间段统计事件数、趋势时优先使用，无需扫描原始数据）:
+data_dict[文件名].attrs["rollups"].table(grain, by=None) 返回DataFrame，grain为"minute"或"hour"，
+by为下列维度列名（None表示只统计总数），结果列为 time（时间段起点）、维度列（by不为None时）、count；
+该表不存在时返回None。预聚合基于文件全量数据，若len(data_dict[文件名])与.attrs["rollups"].row_count不同，
+说明数据已按时间范围截取，需先按time列筛选。各文件的预聚合:"""
+
+
+# 代码生成的固定规则（放在prompt最前面，所有代码生成请求共用同一前缀）
+CODE_GENERATION_RULES = """请根据后面给出的数据信息和用户需求生成可直接执行的Python代码，需严格遵循以下规则：
+
+一、执行环境说明
+1. 代码将在包含以下预定义变量的环境中执行：
+   - data_dict: 字典类型，键为文件名，值为pandas.DataFrame（已加载的所有数据）
+   - pd: pandas库（已导入，可直接使用）
+   - np: numpy库（已导入，可直接使用）
+2. 禁止使用任何未提及的库或变量，禁止导入新库（如import语句）
+
+二、必须定义的核心变量（缺失会导致执行失败）
+1. result_table: 必须是pandas.DataFrame类型
+   - 存储最终分析结果数据
+   - 若无需处理，需通过pd.concat(data_dict.values(), ignore_index=True)生成
+   - 确保所有列名有效，无重复或特殊字符
+2. summary: 必须是字符串类型
+   - 根据用户需求，可以包含分析结论、统计信息、管理建议（可自行丰富内容）等总结内容
+   - 长度建议50-300字，清晰描述分析结果
+3. chart_info: 可选字典类型（如果用户不需要生成图表，可允许为None）
+   - 如果用户在需求中需要生成图表（如生成图表、生成柱状图等），则需提供chart_info字典
+   - 字典结构如下：
+     {
+       "chart_type": "bar/line/pie/scatter/hist",  # 强制必填，且为支持的类型
+       "title": "图表标题",  # 强制必填
+       "data_prep": {
+         "x_col": "x轴数据列名",  # bar/line/scatter/hist必须提供
+         "y_col": "y轴数据列名",  # bar/line/scatter可选
+         "values": "值列名",  # pie必须提供
+         "bins": 分箱数  # hist可选
+       }
+     }
+     这是图表信息的模板，chart_type字段按照这些关键词对应：柱状图bar/折线图line/散点图scatter/直方图hist/饼图pie
+     生成代码时根据图表类型检查必要的列配置
+        'bar': ['x_col', 'y_col']
+        'line': ['x_col', 'y_col']
+        'scatter': ['x_col', 'y_col']
+        'pie': ['x_col', 'values']
+        'hist': ['x_col']
+
+三、代码结构规范
+1. 先定义工具函数（如数据解析、格式转换等辅助函数）
+2. 再进行数据处理逻辑（基于data_dict中的数据）
+3. 最后生成上述三个核心变量
+
+四、禁止事项
+1. 禁止使用print、input等IO操作语句
+2. 禁止修改data_dict原始数据（可创建副本处理）
+3. 禁止修改形如PROTECTEDXXXXXXXX敏感词占位符（保持原样）
+4. 禁止出现语法错误（如缩进错误、缺少冒号、未闭合括号等）
+5. 禁止返回不完整代码（如仅定义函数未执行逻辑）
+
+五、数据处理要求
+1. 处理DataFrame时需考虑空值（使用pd.notna()判断）
+2. 时间类型列建议转换为字符串（如df[col].astype(str)）
+3. 确保数值计算逻辑正确（避免除零、类型不匹配等错误）
+
+请严格按照上述规则生成代码，确保可直接执行且符合变量要求。
+"""
+
+# 直接回答模式的任务说明
+DIRECT_ANSWER_INSTRUCTIONS = """    请基于后面提供的数据信息回答用户问题，无需生成代码。"""
+
+MAP_INSTRUCTIONS = """    数据按块分别提供，每块包含不同的记录，元信息对整个文件有效。
+    请仅基于所给的这一块数据，提取与用户需求相关的部分结论：给出具体的计数、取值和异常记录（保留原始取值和数字，便于与其他块合并），
+    不要推测其他块的内容，无需生成代码，不超过500字。"""
+
+REDUCE_INSTRUCTIONS = """    数据按块分别分析后得到了多份部分结论，后面给出各文件的整体信息（row_count为原始行数，constant_columns为取值相同的列，column_summaries为高基数列摘要）和各部分结论。
+    {task}：同一对象在不同块中的计数需要相加，去除重复内容，无需生成代码。"""
+
+
+# 流式接收生成代码时，出现完整的代码块（开始和结束的```）即可停止接收
+CODE_BLOCK_PATTERN = re.compile(r'```[\w]*[ \t]*\n.*?\n[ \t]*```', re.DOTALL)
+
+# pandas启用写时复制时浅拷贝即可隔离调用方的修改，否则需要深拷贝
+COPY_ON_WRITE = int(pd.__version__.split(".")[0]) >= 3 or getattr(pd.options.mode, "copy_on_write", False) is True
+
+
+def has_complete_code_block(text):
+    return CODE_BLOCK_PATTERN.search(text) is not None
+
+
+class LoadCancelledError(RuntimeError):
+    """数据加载被取消（如改为按列裁剪重新加载）"""
 
 
 class LogAIProcessor:
@@ -28,13 +152,50 @@ class LogAIProcessor:
         self.verbose = config.get("verbose_logging", False)
         self.supported_encodings = ['utf-8', 'gbk', 'gb2312', 'ansi', 'utf-16', 'utf-16-le']
 
+        # 本地token估算（按API返回的实际用量持续校准），请求前检查prompt长度
+        self.token_estimator = TokenEstimator(
+            config.get_cache_dir(),
+            model_limits=config.get("model_limits"),
+            safety_margin=config.get("token_safety_margin", 0.05)
+        )
+
+        # 可选的API响应缓存（相同的脱敏请求直接返回缓存结果）
+        self.response_cache = ResponseCache(
+            config.get_cache_dir(),
+            ttl_seconds=config.get("response_cache_ttl_hours", 168) * 3600,
+            max_bytes=config.get("response_cache_max_mb", 200) * 1024 * 1024
+        ) if config.get("response_cache", False) else None
+
+        # 服务端prompt缓存命中统计（按业务流程累计，持久化到缓存目录）
+        self.prompt_cache_stats = PromptCacheStats(config.get_cache_dir())
+
+        # 生成代码缓存（请求和数据结构相同时复用之前成功执行的代码）
+        self.code_cache = CodeCache(
+            config.get_cache_dir(),
+            max_entries=config.get("code_cache_max_entries", 500)
+        ) if config.get("code_cache", True) else None
+
+        # 性能分析发现的热点写法（开启profile_code时记录），作为后续代码生成的提示
+        self.performance_feedback = PerformanceFeedback(config.get_cache_dir())
+
+        # 常见请求（IP排名、事件类型统计、每小时事件数等）直接匹配内置的向量化查询模板，跳过模型生成代码
+        self.query_router = QueryRouter() if config.get("query_templates", True) else None
+
+        # 生成代码的执行进程池：预热的子进程，代码失控（死循环、内存暴涨）时不影响界面；关闭时在本进程内执行
+        self.execution_pool = ExecutionPool(
+            workers=config.get("execution_workers", 2),
+            timeout=config.get("execution_timeout", 600),
+            memory_limit_mb=config.get("execution_memory_limit_mb")
+        ).start() if config.get("subprocess_execution", True) else None
+
         # 初始化API客户端，传入敏感词处理器
-        self.client = DeepSeekAPI(api_key=self.api_key,
-                                  sensitive_processor=self.sensitive_processor) if self.api_key else None
+        self.client = self._create_client(self.api_key) if self.api_key else None
 
         # 存储当前选择的文件和数据
         self.current_files = None
         self.current_data = None
+        # 最近一次prompt数据序列化的统计（token数及相对JSON布局节省的token数）
+        self.last_serialization_stats = None
 
         # 初始化文件处理器（核心扩展点：添加新类型只需在这里注册）
         self.file_processors = [
@@ -50,6 +211,62 @@ class LogAIProcessor:
             for ext in processor.get_supported_extensions():
                 self.extension_map[ext.lower()] = processor
 
+        # 数据目录索引（持久化，刷新时仅比对变化的文件）
+        self.file_catalog = FileCatalog(
+            config.get_cache_dir(),
+            self.extension_map,
+            self.supported_encodings
+        )
+
+        # 脱敏后数据集缓存（支持对持续增长的日志文件只读取追加内容）
+        self.incremental_ingest = config.get("incremental_ingest", True)
+        self.dataset_cache = DatasetCache(
+            config.get_cache_dir(),
+            max_entries=config.get("dataset_cache_max_files", 16),
+            persist=config.get("persist_dataset_cache", False)
+        )
+        # 加载时识别时间列并建立有序时间索引
+        self.build_time_index = config.get("time_index", True)
+        # 基于时间索引按分钟/小时预聚合事件数（按源IP、用户、动作、状态拆分），通过DataFrame.attrs["rollups"]提供
+        self.build_time_rollups = config.get("time_rollups", True)
+        # 为文本列建立关键词索引（平均长度不小于text_index_min_length的日志文本列建倒排索引，其他短字段建取值索引），用于关键词预过滤
+        self.build_text_index = config.get("text_index", True)
+        self.text_index_min_length = config.get("text_index_min_length", 32)
+        # 加载时统计各列的类型、空值率、近似不同值数和常见值（随数据集缓存，供prompt和界面使用）
+        self.build_column_profiles = config.get("column_profiles", True)
+        self.column_profile_top_k = config.get("column_profile_top_k", 10)
+
+    def _create_client(self, api_key):
+        return DeepSeekAPI(
+            api_key=api_key,
+            sensitive_processor=self.sensitive_processor,
+            token_estimator=self.token_estimator,
+            max_concurrency=self.config.get("api_max_concurrency", 8),
+            timeout=self.config.get("api_timeout", 300),
+            # 可指向本地模拟服务（utils/mock_server.py）做离线基准测试
+            base_url=self.config.get("api_base_url") or DEFAULT_BASE_URL,
+            response_cache=self.response_cache,
+            prompt_cache_stats=self.prompt_cache_stats,
+            rate_limiter=RateLimiter(
+                requests_per_minute=self.config.get("api_rpm", 120),
+                tokens_per_minute=self.config.get("api_tpm")
+            ),
+            circuit_breaker=CircuitBreaker(
+                failure_threshold=self.config.get("api_circuit_failures", 5),
+                reset_timeout=self.config.get("api_circuit_reset_seconds", 30)
+            )
+        )
+
+    def set_api_key(self, api_key):
+        """更新API Key：已有客户端时只替换Key（保留连接池），否则新建客户端"""
+        self.api_key = api_key
+        if not api_key:
+            self.client = None
+        elif self.client is not None:
+            self.client.set_api_key(api_key)
+        else:
+            self.client = self._create_client(api_key)
+
     def set_default_data_dir(self, new_dir):
         if new_dir:
             self.default_data_dir = new_dir
@@ -68,52 +285,62 @@ class LogAIProcessor:
         if new_dir:
             self.current_save_dir = new_dir
 
-    def get_file_list(self):
+    def get_file_list(self, check_files=False, **query):
         """获取当前数据目录中的文件列表"""
+        return [entry["name"] for entry in self.get_file_entries(check_files, **query)]
+
+    def get_file_entries(self, check_files=False, **query):
+        """获取当前数据目录中文件的索引记录（大小、格式、编码、估算行数等）
+
+        Args:
+            check_files: 是否重新比对每个文件的大小和修改时间
+            query: 传给FileCatalog.list_files的筛选/排序条件
+        """
         if not self.current_data_dir or not os.path.exists(self.current_data_dir):
             return []
-        return get_file_list(self.current_data_dir)
-
-    def load_data_files(self, file_names):
-        """从当前数据目录加载文件"""
+        try:
+            self.file_catalog.refresh(self.current_data_dir, check_files=check_files)
+        except OSError as e:
+            print(f"刷新文件目录索引失败: {str(e)}")
+            return [{"name": name, "size": 0, "format": None} for name in get_file_list(self.current_data_dir)]
+        return self.file_catalog.list_files(self.current_data_dir, **query)
+
+    def load_data_files(self, file_names, columns=None, cancel_event=None):
+        """从当前数据目录加载文件
+
+        Args:
+            columns: 可选的列裁剪 {文件名: 列名列表}，未列出的文件加载全部列
+            cancel_event: 可选的threading.Event，置位后尽快中止加载并抛出LoadCancelledError
+        """
         if not self.current_data_dir or not os.path.exists(self.current_data_dir):
             raise ValueError("当前数据目录未设置或不存在")
 
-        return self._load_file_data(file_names)
+        return self._load_file_data(file_names, columns, cancel_event)
 
-    def _load_file_data(self, file_names):
-        """从当前数据目录读取文件数据，使用多线程加载"""
-        if self.current_data and set(file_names) == set(self.current_data.keys()):
-            return self.current_data
+    def _load_file_data(self, file_names, columns=None, cancel_event=None):
+        """从当前数据目录读取文件数据，使用多线程加载
 
+        每个文件的脱敏结果按文件缓存：文件未变化时直接复用；
+        文件仅追加内容时只解析并脱敏追加部分（增量模式）；文件被轮转/重写时全量重载。
+        """
         data_dict = {}
         from concurrent.futures import ThreadPoolExecutor, as_completed
 
-        def load_single_file(file_name):
-            safe_file = sanitize_filename(file_name)
-            full_path = os.path.join(self.current_data_dir, safe_file)
-
-            if not os.path.exists(full_path):
-                raise FileNotFoundError(f"文件不存在: {full_path}")
+        mask_signature = self.sensitive_processor.get_words_signature()
+        columns = columns or {}
 
-            _, ext = os.path.splitext(full_path)
-            ext = ext.lower()
-
-            if ext not in self.extension_map:
-                supported_exts = ", ".join(self.extension_map.keys())
-                raise ValueError(f"不支持的文件格式: {ext}。支持的格式: {supported_exts}")
-
-            processor = self.extension_map[ext]
-            df = processor.read_file(full_path, encodings=self.supported_encodings)
-
-            # 加载后立即进行敏感词处理
-            df_copy = df.copy()
-            for col in df_copy.columns:
-                if df_copy[col].dtype == 'object':
-                    df_copy[col] = df_copy[col].astype(str).apply(
-                        lambda x: self.sensitive_processor.normalize_to_replacement(x) if pd.notna(x) else x
-                    )
-            return safe_file, df_copy
+        def load_single_file(file_name):
+            safe_file, full_path, processor = self._resolve_file(file_name)
+            entry = self._load_dataset_entry(
+                safe_file, full_path, processor, mask_signature,
+                usecols=columns.get(safe_file), cancel_event=cancel_event
+            )
+            # 返回副本，避免调用方原地修改破坏缓存的数据集及其时间索引的行号
+            df = entry.df.copy(deep=not COPY_ON_WRITE)
+            rollups = entry.extras.get("time_rollups")
+            if rollups is not None:
+                df.attrs[ROLLUP_ATTR] = rollups
+            return safe_file, df
 
         with ThreadPoolExecutor(max_workers=min(4, len(file_names))) as executor:
             futures = {executor.submit(load_single_file, fn): fn for fn in file_names}
@@ -122,12 +349,384 @@ class LogAIProcessor:
                 try:
                     safe_file, df = future.result()
                     data_dict[safe_file] = df
+                except LoadCancelledError:
+                    raise
                 except Exception as e:
                     raise RuntimeError(f"读取文件 {futures[future]} 失败: {str(e)}")
 
+        self.current_files = list(data_dict.keys())
         self.current_data = data_dict
         return data_dict
 
+    def _resolve_file(self, file_name):
+        """解析文件路径并匹配处理器，返回(安全文件名, 完整路径, 处理器)"""
+        safe_file = sanitize_filename(file_name)
+        full_path = os.path.join(self.current_data_dir, safe_file)
+
+        if not os.path.exists(full_path):
+            raise FileNotFoundError(f"文件不存在: {full_path}")
+
+        _, ext = os.path.splitext(full_path)
+        ext = ext.lower()
+
+        if ext not in self.extension_map:
+            supported_exts = ", ".join(self.extension_map.keys())
+            raise ValueError(f"不支持的文件格式: {ext}。支持的格式: {supported_exts}")
+
+        return safe_file, full_path, self.extension_map[ext]
+
+    def probe_files(self, file_names, nrows=5, time_range=None):
+        """快速获取文件结构和样本（不做全量加载）
+
+        数据集已缓存且文件未变化时直接从缓存截取，否则只读取文件表头和前nrows行并脱敏。
+        Returns:
+            dict: {文件名: {"sample": 脱敏后的样本DataFrame, "time_columns": 时间列列表,
+                            "profiles": 全量数据的列统计, "rollups": 时间预聚合（数据集未缓存时均为None）}}
+        """
+        if not self.current_data_dir or not os.path.exists(self.current_data_dir):
+            raise ValueError("当前数据目录未设置或不存在")
+
+        mask_signature = self.sensitive_processor.get_words_signature()
+        probes = {}
+        for file_name in file_names:
+            try:
+                safe_file, full_path, processor = self._resolve_file(file_name)
+                entry = self.dataset_cache.get(full_path)
+                # 按列裁剪加载的缓存只有部分列，不能作为文件结构
+                if entry is not None and entry.columns is None \
+                        and entry.check_file_state(os.stat(full_path), mask_signature) == STATE_UNCHANGED:
+                    df = self.apply_time_range({safe_file: entry.df}, time_range)[safe_file]
+                    probes[safe_file] = {
+                        "sample": df.head(nrows),
+                        "time_columns": list(entry.extras.get("time_indexes", {}).keys()),
+                        "profiles": entry.extras.get("column_profiles"),
+                        "rollups": entry.extras.get("time_rollups")
+                    }
+                    continue
+
+                sample = self._mask_dataframe(
+                    processor.probe_file(full_path, nrows=nrows, encodings=self.supported_encodings)
+                )
+                probes[safe_file] = {
+                    "sample": sample,
+                    "time_columns": list(detect_timestamp_columns(sample).keys()),
+                    "profiles": None,
+                    "rollups": None
+                }
+            except Exception as e:
+                raise RuntimeError(f"读取文件 {file_name} 失败: {str(e)}")
+        return probes
+
+    def _load_dataset_entry(self, file_name, full_path, processor, mask_signature,
+                            usecols=None, cancel_event=None):
+        """获取文件的缓存数据集，按文件状态选择复用、增量追加或全量加载
+
+        Args:
+            usecols: 只需要的列（列裁剪），None表示全部列；缓存中已有所需的列时直接复用
+        """
+        st = os.stat(full_path)
+        entry = self.dataset_cache.get(full_path)
+
+        if entry is not None and entry.covers(usecols):
+            state = entry.check_file_state(st, mask_signature)
+            if state == STATE_UNCHANGED:
+                return entry
+            if state == STATE_APPENDED and self.incremental_ingest:
+                try:
+                    return self._append_dataset_entry(entry, processor, cancel_event)
+                except LoadCancelledError:
+                    raise
+                except Exception as e:
+                    # 追加内容解析失败（如列数不一致）时退回全量加载
+                    if self.verbose:
+                        print(f"增量读取 {file_name} 失败，改为全量加载: {str(e)}")
+
+        all_columns = None
+        if usecols and processor.supports_incremental():
+            # 列裁剪加载时记录文件完整列名，供增量读取无表头的追加内容
+            all_columns = list(processor.probe_file(full_path, nrows=0, encodings=self.supported_encodings).columns)
+        df = processor.read_file(full_path, encodings=self.supported_encodings, usecols=usecols)
+        st_after = os.stat(full_path)
+
+        entry = DatasetEntry(file_name, full_path, self._mask_dataframe(df, cancel_event), mask_signature)
+        if usecols:
+            entry.columns = list(df.columns)
+            entry.all_columns = all_columns or list(df.columns)
+        if self.build_time_index:
+            entry.extras["time_indexes"] = self._build_time_indexes(entry.df)
+            if self.build_time_rollups and entry.extras["time_indexes"]:
+                time_index = next(iter(entry.extras["time_indexes"].values()))
+                entry.extras["time_rollups"] = TimeRollups.build(
+                    entry.df, time_index, detect_column_roles(entry.df.head(200), [time_index.column])
+                )
+        if self.build_text_index:
+            entry.extras["text_indexes"] = self._build_text_indexes(entry.df)
+        if self.build_column_profiles:
+            entry.extras["column_profiles"] = profile_dataframe(entry.df, self.column_profile_top_k)
+        offset = None
+        if processor.supports_incremental() and st_after.st_size == st.st_size:
+            # 只有读取期间文件未变化且以完整行结束时，才能从文件末尾继续增量读取
+            with open(full_path, 'rb') as f:
+                head = f.read(FileCatalog.SAMPLE_BYTES)
+                f.seek(max(0, st.st_size - 1))
+                last_byte = f.read(1)
+            entry.encoding = detect_encoding(head, self.supported_encodings)
+            ascii_compatible = entry.encoding and not entry.encoding.lower().startswith('utf-16')
+            if ascii_compatible and (st.st_size == 0 or last_byte == b'\n'):
+                offset = st.st_size
+        entry.update_file_state(st_after, offset)
+        self.dataset_cache.put(entry)
+        return entry
+
+    def _append_dataset_entry(self, entry, processor, cancel_event=None):
+        """只解析并脱敏追加的内容，合并到缓存的DataFrame"""
+        new_df, new_offset = processor.read_appended(
+            entry.path, entry.offset, entry.encoding, entry.all_columns, usecols=entry.columns
+        )
+        if not new_df.empty:
+            new_df = self._mask_dataframe(self._align_appended_dtypes(entry.df, new_df), cancel_event)
+            entry.df = pd.concat([entry.df, new_df], ignore_index=True)
+            # 时间索引只解析追加的行（复用缓存的时间格式）
+            for time_index in entry.extras.get("time_indexes", {}).values():
+                time_index.extend(new_df[time_index.column])
+            if "time_rollups" in entry.extras:
+                entry.extras["time_rollups"].extend(new_df)
+            for text_index in entry.extras.get("text_indexes", {}).values():
+                text_index.extend(new_df[text_index.column])
+            # 列统计只用追加的行增量更新
+            if "column_profiles" in entry.extras:
+                profile_dataframe(new_df, self.column_profile_top_k, entry.extras["column_profiles"])
+        st = os.stat(entry.path)
+        entry.size = st.st_size
+        entry.mtime_ns = st.st_mtime_ns
+        entry.offset = new_offset
+        self.dataset_cache.put(entry)
+        return entry
+
+    @classmethod
+    def _align_appended_dtypes(cls, cached_df, new_df):
+        """追加内容单独解析时类型推断可能与全量不同（如文本列追加的值恰好都是数字），按缓存的列类型对齐
+
+        缓存中的文本列统一转为文本，保证脱敏和合并后与全量加载一致；缓存中的数值列在追加内容中出现文本时，
+        全量加载会得到文本列，此时抛出异常退回全量加载。
+        """
+        if cached_df.empty:
+            return new_df
+        new_df = new_df.copy()
+        for col in new_df.columns:
+            if col not in cached_df.columns or new_df[col].dtype == cached_df[col].dtype:
+                continue
+            if cls._is_text_column(cached_df[col]):
+                new_df[col] = new_df[col].astype(str)
+            elif cls._is_text_column(new_df[col]):
+                raise ValueError(f"追加内容中列 {col} 的类型与已加载数据不一致")
+        return new_df
+
+    def plan_projection(self, code, file_names):
+        """静态分析生成代码使用的列，返回列裁剪方案 {文件名: 列名列表}
+
+        代码中的列名可能是脱敏后的形式，这里统一映射回实际列名；已识别的时间列始终保留。
+        无法确定代码用到哪些列时返回None（加载全部列）。
+        """
+        probes = self.probe_files(file_names)
+        columns_by_file = {}
+        for file_name, probe in probes.items():
+            mapping = {}
+            for col in probe["sample"].columns:
+                mapping[str(col)] = col
+                mapping[self.sensitive_processor.normalize_to_replacement(str(col))] = col
+            columns_by_file[file_name] = mapping
+
+        references = find_column_references(code, columns_by_file)
+        if not references:
+            return None
+
+        projection = {}
+        for file_name, cols in references.items():
+            all_columns = list(probes[file_name]["sample"].columns)
+            keep = set(cols) | set(probes[file_name]["time_columns"])
+            if len(keep) < len(all_columns):
+                # 保持文件中的原始列顺序
+                projection[file_name] = [col for col in all_columns if col in keep]
+        return projection or None
+
+    @staticmethod
+    def _build_time_indexes(df):
+        """识别时间列并一次性解析建立有序时间索引"""
+        indexes = {}
+        for col, spec in detect_timestamp_columns(df).items():
+            try:
+                indexes[col] = TimeIndex.build(df[col], spec["format"], spec["unit"])
+            except (ValueError, TypeError, OverflowError):
+                continue
+        return indexes
+
+    def _build_text_indexes(self, df):
+        """为文本列建立关键词索引：日志文本列（按前1000行的平均长度识别）建倒排索引，IP、用户名等短字段建取值索引"""
+        indexes = {}
+        for col in df.columns:
+            if not isinstance(df[col], pd.Series) or not self._is_text_column(df[col]):
+                continue
+            head = df[col].head(1000).dropna().astype(str)
+            if not head.empty and head.str.len().mean() >= self.text_index_min_length:
+                indexes[col] = InvertedIndex.build(df[col])
+            else:
+                indexes[col] = ValueIndex.build(df[col])
+        return indexes
+
+    def _get_dataset_entry(self, file_name):
+        """获取已加载文件的缓存数据集"""
+        full_path = os.path.join(self.current_data_dir, sanitize_filename(file_name))
+        entry = self.dataset_cache.get(full_path)
+        if entry is None:
+            raise ValueError(f"文件 {file_name} 尚未加载")
+        return entry
+
+    def get_time_columns(self, file_name):
+        """获取已加载文件中识别出的时间列及其时间范围"""
+        entry = self._get_dataset_entry(file_name)
+        return {
+            col: {"format": index.format, "unit": index.unit, "range": index.bounds()}
+            for col, index in entry.extras.get("time_indexes", {}).items()
+        }
+
+    def get_column_profiles(self, file_name):
+        """获取已缓存文件的列统计 {列名: ColumnProfile}
+
+        只查询内存中的缓存，文件未加载、已变化或未统计时返回None；按列裁剪加载的文件只有部分列的统计。
+        """
+        if not self.current_data_dir:
+            return None
+        full_path = os.path.join(self.current_data_dir, sanitize_filename(file_name))
+        entry = self.dataset_cache.get(full_path, from_disk=False)
+        if entry is None or "column_profiles" not in entry.extras:
+            return None
+        try:
+            state = entry.check_file_state(os.stat(full_path), self.sensitive_processor.get_words_signature())
+        except OSError:
+            return None
+        return entry.extras["column_profiles"] if state == STATE_UNCHANGED else None
+
+    def get_column_sketch(self, file_names, column):
+        """合并多个已加载文件中同一列的统计（HyperLogLog/Space-Saving/Count-Min），不读取数据
+
+        可在固定内存内回答"出现最多的取值"（top）、"不同值数"（distinct）和某个取值的出现次数（estimate_count）。
+        任一文件未加载、已变化或没有该列时返回None。
+        """
+        return merge_profiles([(self.get_column_profiles(name) or {}).get(column) for name in file_names])
+
+    def answer_from_sketches(self, match):
+        """查询模板可由已加载数据集的列统计直接回答时返回结果变量（不加载数据），否则返回None"""
+        profiles = {}
+        for file_name in match.columns:
+            file_profiles = self.get_column_profiles(file_name)
+            if file_profiles is None:
+                return None
+            profiles[file_name] = file_profiles
+        try:
+            return match.run_sketch(profiles)
+        except Exception as e:
+            if self.verbose:
+                print(f"基于列统计回答失败，改为加载数据: {str(e)}")
+            return None
+
+    def slice_time_range(self, file_name, start=None, end=None, column=None):
+        """按时间范围 [start, end) 截取已加载文件的数据（基于有序时间索引二分查找）
+
+        Args:
+            start/end: 时间边界（字符串、datetime或Timestamp），None表示不限
+            column: 时间列名，默认使用识别出的第一个时间列
+        Returns:
+            pd.DataFrame: 时间范围内的行；文件没有时间列时返回None
+        """
+        entry = self._get_dataset_entry(file_name)
+        return self._slice_frame(entry.extras.get("time_indexes", {}), entry.df, start, end, column)
+
+    @staticmethod
+    def _slice_frame(indexes, df, start, end, column=None):
+        if column is None:
+            if not indexes:
+                return None
+            column = next(iter(indexes))
+        elif column not in indexes:
+            raise ValueError(f"列 {column} 不是已识别的时间列")
+        return indexes[column].slice_frame(df, start, end)
+
+    def _time_indexes_for(self, file_name, df):
+        """获取与df行号对应的时间索引：优先复用缓存数据集中的索引，缓存已被淘汰或行已变化时在df上重新建立"""
+        full_path = os.path.join(self.current_data_dir, sanitize_filename(file_name))
+        entry = self.dataset_cache.get(full_path)
+        if entry is not None and len(entry.df) == len(df) and df.index.equals(entry.df.index):
+            indexes = entry.extras.get("time_indexes", {})
+            return {col: index for col, index in indexes.items() if col in df.columns}
+        return self._build_time_indexes(df) if self.build_time_index else {}
+
+    def search_rows(self, file_name, query, mode="and"):
+        """在已加载文件中查找包含关键词的行，返回行号数组（缓存数据集中的位置，升序）
+
+        各关键词在所有文本列中做不区分大小写的子串匹配：日志文本列查倒排索引，IP、用户名等短字段查取值索引，
+        没有索引的其他列（如时间类型的列）逐行扫描，结果与没有索引时逐列扫描一致。查询中的敏感词按脱敏后的形式匹配。
+        Args:
+            query: 空白分隔的关键词，双引号括起的为短语；也可传入词项列表
+            mode: "and"（包含全部关键词）或 "or"（包含任一关键词）
+        """
+        entry = self._get_dataset_entry(file_name)
+        normalize = self.sensitive_processor.normalize_to_replacement
+        terms = [normalize(term) for term in parse_query(query)]
+        indexes = entry.extras.get("text_indexes")
+        if indexes:
+            scan_columns = [col for col in text_columns(entry.df) if col not in indexes]
+            return search_rows(indexes, entry.df, terms, mode, scan_columns)
+        return scan_rows(entry.df, terms, mode)
+
+    def filter_rows(self, data_dict, query, mode="and"):
+        """按关键词预过滤数据字典中的每个文件（用于分析或直接回答之前缩小数据量）
+
+        data_dict中的DataFrame须来自load_data_files（可已按时间范围截取），行标签即缓存数据集中的行号。
+        """
+        if not parse_query(query):
+            return data_dict
+        filtered = {}
+        for file_name, df in data_dict.items():
+            rows = self.search_rows(file_name, query, mode)
+            filtered[file_name] = df[np.isin(df.index.to_numpy(), rows)]
+        return filtered
+
+    def apply_time_range(self, data_dict, time_range):
+        """对数据字典中的每个文件按时间范围截取，没有时间列的文件保持不变
+
+        截取的是data_dict中传入的DataFrame（可为按列裁剪的数据），行号须与缓存数据集一致。
+        """
+        if not time_range or all(bound is None for bound in time_range):
+            return data_dict
+        start, end = time_range
+        sliced = {}
+        for file_name, df in data_dict.items():
+            part = self._slice_frame(self._time_indexes_for(file_name, df), df, start, end)
+            sliced[file_name] = df if part is None else part
+        return sliced
+
+    def _log_serialization_stats(self):
+        stats = self.last_serialization_stats
+        if self.verbose and stats and "saved_tokens" in stats:
+            print(f"prompt数据约 {stats['tokens']} tokens，相比逐行JSON节省约 {stats['saved_tokens']} tokens")
+
+    @staticmethod
+    def _is_text_column(series):
+        return series.dtype == 'object' or pd.api.types.is_string_dtype(series.dtype)
+
+    def _mask_dataframe(self, df, cancel_event=None):
+        """对DataFrame的文本列进行敏感词统一替换"""
+        df_copy = df.copy()
+        for col in df_copy.columns:
+            if cancel_event is not None and cancel_event.is_set():
+                raise LoadCancelledError("数据加载已取消")
+            if self._is_text_column(df_copy[col]):
+                df_copy[col] = df_copy[col].astype(str).apply(
+                    lambda x: self.sensitive_processor.normalize_to_replacement(x) if pd.notna(x) else x
+                )
+        return df_copy
+
     def process_and_anonymize_files(self, file_names, output_dir):
         """处理并去敏文件"""
         if not file_names:
@@ -192,115 +791,170 @@ class LogAIProcessor:
         anonymized_text, _ = self.sensitive_processor.replace_sensitive_words(text)
         return anonymized_text
 
-    def generate_processing_code(self, user_request, file_names):
-        """生成完整可执行代码，而非函数内部逻辑"""
-        data_dict = self._load_file_data(file_names)
-        file_info = {}
+    def generate_processing_code(self, user_request, file_names, time_range=None, use_cache=True,
+                                 progress_callback=None, cancel_event=None, previous_attempt=None):
+        """生成完整可执行代码，而非函数内部逻辑（仅需文件结构和样本，不做全量加载）
+
+        Args:
+            previous_attempt: 可选的(上次生成的代码, 错误信息)，提供时要求模型修复该代码
+        """
+        probes = self.probe_files(file_names, nrows=5, time_range=time_range)
 
         # 处理用户请求，确保其中的敏感词被统一替换
         processed_request = self.sensitive_processor.normalize_to_replacement(user_request)
 
-        for filename, df in data_dict.items():
-            # 1. 替换列名中的敏感词
-            replaced_columns = [
-                self.sensitive_processor.normalize_to_replacement(col)
-                for col in df.columns.tolist()
-            ]
-
-            # 2. 替换样本数据中的敏感词
-            replaced_samples = []
-            for sample in df.head(5).to_dict(orient='records'):
-                replaced_sample = {}
-                for key, value in sample.items():
-                    # 对每个字段值进行替换（处理字符串类型）
-                    if isinstance(value, str):
-                        replaced_val = self.sensitive_processor.normalize_to_replacement(value)
-                        replaced_sample[key] = replaced_val
-                    else:
-                        replaced_sample[key] = value  # 非字符串类型保持不变
-                replaced_samples.append(replaced_sample)
-
-            file_info[filename] = {
-                "columns": replaced_columns,
-                "sample": replaced_samples
-            }
-
-        # 3. 生成代码
-        prompt = f"""根据用户请求编写完整的Python处理代码:
-用户需求: {user_request}
-数据信息: {json.dumps(file_info, ensure_ascii=False)}
-
-请根据用户需求生成可直接执行的Python代码，需严格遵循以下规则：
-
-一、执行环境说明
-1. 代码将在包含以下预定义变量的环境中执行：
-   - data_dict: 字典类型，键为文件名，值为pandas.DataFrame（已加载的所有数据）
-   - pd: pandas库（已导入，可直接使用）
-   - np: numpy库（已导入，可直接使用）
-2. 禁止使用任何未提及的库或变量，禁止导入新库（如import语句）
-
-二、必须定义的核心变量（缺失会导致执行失败）
-1. result_table: 必须是pandas.DataFrame类型
-   - 存储最终分析结果数据
-   - 若无需处理，需通过pd.concat(data_dict.values(), ignore_index=True)生成
-   - 确保所有列名有效，无重复或特殊字符
-2. summary: 必须是字符串类型
-   - 根据用户需求，可以包含分析结论、统计信息、管理建议（可自行丰富内容）等总结内容
-   - 长度建议50-300字，清晰描述分析结果
-3. chart_info: 可选字典类型（如果用户不需要生成图表，可允许为None）
-   - 如果用户在需求中需要生成图表（如生成图表、生成柱状图等），则需提供chart_info字典
-   - 字典结构如下：
-     {{
-       "chart_type": "bar/line/pie/scatter/hist",  # 强制必填，且为支持的类型
-       "title": "图表标题",  # 强制必填
-       "data_prep": {{
-         "x_col": "x轴数据列名",  # bar/line/scatter/hist必须提供
-         "y_col": "y轴数据列名",  # bar/line/scatter可选
-         "values": "值列名",  # pie必须提供
-         "bins": 分箱数  # hist可选
-       }}
-     }}
-     这是图表信息的模板，chart_type字段按照这些关键词对应：柱状图bar/折线图line/散点图scatter/直方图hist/饼图pie
-     生成代码时根据图表类型检查必要的列配置
-        'bar': ['x_col', 'y_col']
-        'line': ['x_col', 'y_col']
-        'scatter': ['x_col', 'y_col']
-        'pie': ['x_col', 'values']
-        'hist': ['x_col']
-
-三、代码结构规范
-1. 先定义工具函数（如数据解析、格式转换等辅助函数）
-2. 再进行数据处理逻辑（基于data_dict中的数据）
-3. 最后生成上述三个核心变量
-
-四、禁止事项
-1. 禁止使用print、input等IO操作语句
-2. 禁止修改data_dict原始数据（可创建副本处理）
-3. 禁止修改形如PROTECTEDXXXXXXXX敏感词占位符（保持原样）
-4. 禁止出现语法错误（如缩进错误、缺少冒号、未闭合括号等）
-5. 禁止返回不完整代码（如仅定义函数未执行逻辑）
-
-五、数据处理要求
-1. 处理DataFrame时需考虑空值（使用pd.notna()判断）
-2. 时间类型列建议转换为字符串（如df[col].astype(str)）
-3. 确保数值计算逻辑正确（避免除零、类型不匹配等错误）
+        # 1. 列名和样本数据中的敏感词统一替换，按表头+制表符分隔的紧凑格式输出
+        normalize = self.sensitive_processor.normalize_to_replacement
+        serializer = TabularPromptSerializer(value_transform=normalize, token_estimator=self.token_estimator.estimate)
+        tables = {
+            filename: (probe["sample"].head(5), {"time_columns": [normalize(str(c)) for c in probe["time_columns"]]})
+            for filename, probe in probes.items()
+        }
+        # 2. 记录相对逐行JSON布局节省的token数
+        data_text, self.last_serialization_stats = serializer.serialize_tables(tables)
+        self._log_serialization_stats()
+        # 已加载过的文件附上全量数据的列统计，生成的代码无需再自行探查数据
+        profile_text = "\n".join(
+            f"{filename}:\n{format_profiles(probe['profiles'], value_transform=normalize)}"
+            for filename, probe in probes.items() if probe.get("profiles")
+        )
+        rollup_text = "\n".join(
+            f"{filename}: {normalize(probe['rollups'].describe())}"
+            for filename, probe in probes.items() if probe.get("rollups")
+        )
 
-请严格按照上述规则生成代码，确保可直接执行且符合变量要求。
-"""
+        # 3. 生成代码（固定规则在前、数据结构其次、用户需求在最后，便于命中服务端prompt缓存）
+        builder = (
+            PromptBuilder()
+            .static(CODE_GENERATION_RULES)
+            .static(self.performance_feedback.prompt_text())
+            .schema(f"数据信息（每个文件给出表头和前5行样本，制表符分隔；time_columns为已识别的时间列）:\n{data_text}")
+            .schema(f"列统计（基于全量数据，不同值数和常见值次数可能为近似值）:\n{profile_text}" if profile_text else "")
+            .schema(f"{ROLLUP_PROMPT_NOTES}\n{rollup_text}" if rollup_text else "")
+            .dynamic(f"用户需求: {user_request}\n请根据以上规则和数据信息，为该需求编写完整的Python处理代码。")
+        )
+        if previous_attempt is not None:
+            # 修复轮：附上上次的代码和在样本数据上试运行的错误
+            previous_code, error = previous_attempt
+            builder.dynamic(
+                f"上次生成的代码如下，在抽样数据上试运行时出现问题:\n```python\n{previous_code}\n```\n"
+                f"问题: {normalize(error)}\n请修正这些问题，重新输出完整的Python处理代码。"
+            )
+        prompt = builder.build()
 
         response = self.client.completions_create(
             model='deepseek-reasoner',
             prompt=prompt,
             max_tokens=10000,
-            temperature=1.0
+            temperature=1.0,
+            use_cache=use_cache,
+            stream=self.config.get("stream_responses", True),
+            on_delta=self._stream_progress(progress_callback, "生成代码"),
+            stop_when=has_complete_code_block,
+            cancel_event=cancel_event,
+            workflow="code_repair" if previous_attempt is not None else "code_generation"
         )
 
         code_block = response.choices[0].message.content.strip()
 
         return code_block
 
-    def direct_answer(self, user_request, file_names):
-        """直接回答模式：对全部数据脱敏后调用API，不展示表格内容"""
+    def match_query_template(self, user_request, file_names):
+        """按请求和文件结构匹配内置查询模板，返回TemplateMatch；未匹配、模板关闭或读取结构失败时返回None"""
+        if self.query_router is None:
+            return None
+        try:
+            probes = self.probe_files(file_names, nrows=20)
+        except Exception as e:
+            if self.verbose:
+                print(f"读取文件结构失败，不使用查询模板: {str(e)}")
+            return None
+        masked_request = self.sensitive_processor.normalize_to_replacement(user_request)
+        return self.query_router.route(
+            masked_request,
+            {name: probe["sample"] for name, probe in probes.items()},
+            {name: probe["time_columns"] for name, probe in probes.items()}
+        )
+
+    def _stream_progress(self, progress_callback, label, interval=0.5):
+        """返回流式响应的回调：按时间间隔汇报已接收的推理和回答字数"""
+        if progress_callback is None:
+            return None
+        counts = {"reasoning": 0, "content": 0}
+        last_report = [0.0]
+
+        def on_delta(kind, text):
+            counts[kind] += len(text)
+            now = time.monotonic()
+            if now - last_report[0] < interval:
+                return
+            last_report[0] = now
+            if counts["content"]:
+                progress_callback(f"{label}：正在输出，已接收 {counts['content']} 字...")
+            else:
+                progress_callback(f"{label}：模型思考中，已推理 {counts['reasoning']} 字...")
+
+        return on_delta
+
+    def code_cache_key(self, user_request, file_names):
+        """计算代码缓存键：脱敏后的规范化请求 + 文件角色、列名和类型构成的结构指纹
+
+        Returns:
+            tuple | None: (缓存键, 按角色排序的文件名列表)，代码缓存关闭或读取文件结构失败时返回None
+        """
+        if self.code_cache is None:
+            return None
+        try:
+            probes = self.probe_files(file_names, nrows=5)
+        except Exception as e:
+            if self.verbose:
+                print(f"读取文件结构失败，不使用代码缓存: {str(e)}")
+            return None
+        fingerprint, ordered = schema_fingerprint({name: probe["sample"] for name, probe in probes.items()})
+        masked_request = self.sensitive_processor.normalize_to_replacement(user_request)
+        return self.code_cache.make_key(masked_request, fingerprint), ordered
+
+    def get_cached_code(self, cache_key):
+        """返回缓存的代码（文件名已替换为本次选择的文件），未命中时返回None"""
+        if self.code_cache is None or cache_key is None:
+            return None
+        key, ordered = cache_key
+        return self.code_cache.get(key, ordered)
+
+    def store_generated_code(self, cache_key, user_request, code):
+        """保存执行成功的生成代码"""
+        if self.code_cache is None or cache_key is None or not code:
+            return
+        key, ordered = cache_key
+        self.code_cache.put(key, self.sensitive_processor.normalize_to_replacement(user_request), ordered, code)
+
+    def invalidate_cached_code(self, cache_key):
+        if self.code_cache is not None and cache_key is not None:
+            self.code_cache.invalidate(cache_key[0])
+
+    def _replace_sensitive_values(self, obj):
+        """递归脱敏嵌套结构中的字符串值"""
+        if isinstance(obj, str):
+            return self.sensitive_processor.replace_sensitive_words(obj)[0]
+        if isinstance(obj, dict):
+            return {self._replace_sensitive_values(k): self._replace_sensitive_values(v) for k, v in obj.items()}
+        if isinstance(obj, (list, tuple)):
+            return [self._replace_sensitive_values(v) for v in obj]
+        return obj
+
+    def direct_answer(self, user_request, file_names, time_range=None, progress_callback=None, use_cache=True,
+                      cancel_event=None, keyword_filter=None):
+        """直接回答模式：对全部数据脱敏并按token预算压缩后调用API，不展示表格内容
+
+        数据无法在预算内完整放入一个prompt（需要抽样）时，按配置改用map-reduce：
+        数据按预算分块并发分析，再汇总各块结论得到最终回答。
+
+        Args:
+            progress_callback: 可选的进度回调，参数为进度文字
+            use_cache: 为False时不使用缓存的API响应
+            cancel_event: 可选的threading.Event，置位后中止正在接收的回答
+            keyword_filter: 可选的关键词查询（语法见search_rows），只把包含关键词的行放入prompt
+        """
         if not self.client:
             return {
                 "summary": "未配置API密钥，无法进行直接回答",
@@ -308,44 +962,61 @@ class LogAIProcessor:
                 "chart_info": None
             }
 
-        # 加载数据并脱敏（处理全部数据）
-        data_dict = self._load_file_data(file_names)
-        file_info = {}
-        for filename, df in data_dict.items():
-            # 1. 脱敏列名
-            replaced_columns = [
-                self.sensitive_processor.replace_sensitive_words(col)[0]
-                for col in df.columns.tolist()
-            ]
-
-            # 2. 脱敏全部数据（不再只传样本，而是全部记录）
-            replaced_records = []
-            for record in df.to_dict(orient='records'):  # 遍历所有行，而非head(2)
-                replaced_record = {}
-                for key, value in record.items():
-                    if isinstance(value, str):
-                        # 对字符串类型脱敏
-                        replaced_val, _ = self.sensitive_processor.replace_sensitive_words(value)
-                        replaced_record[key] = replaced_val
-                    else:
-                        replaced_record[key] = value  # 非字符串保持原样
-                replaced_records.append(replaced_record)
-
-            file_info[filename] = {
-                "columns": replaced_columns,
-                "records": replaced_records  # 用全部记录替换样本
-            }
+        # 加载数据并脱敏（处理全部数据，指定时间范围时只取范围内的行）
+        data_dict = self.apply_time_range(self._load_file_data(file_names), time_range)
+        if keyword_filter:
+            data_dict = self.filter_rows(data_dict, keyword_filter)
 
-        # 构建脱敏后的prompt（明确基于全部数据回答）
-        prompt = f"""用户需求: {user_request}
-    数据信息: {json.dumps(file_info, ensure_ascii=False)}
+        # 按token预算压缩数据（去重计数、删除常量列、高基数列摘要、分层抽样）
+        serializer = TabularPromptSerializer(
+            value_transform=lambda text: self.sensitive_processor.replace_sensitive_words(text)[0],
+            token_estimator=self.token_estimator.estimate
+        )
+        compactor = DataCompactor(
+            token_budget=self.config.get("direct_answer_token_budget", 24000),
+            top_k=self.config.get("direct_answer_top_k", 10),
+            token_estimator=self.token_estimator.estimate,
+            table_token_estimator=serializer.estimate_table_tokens
+        )
+        compacted_all = compactor.compact_all(data_dict)
 
-    请基于提供的全部数据信息回答用户问题，无需生成代码。
-    """
+        mode = self.config.get("direct_answer_mode", "auto")  # auto / single / map_reduce
+        use_map_reduce = mode == "map_reduce" or (
+            mode == "auto" and any(compacted["sampled"] for compacted in compacted_all.values())
+        )
+        if use_map_reduce:
+            raw_summary = self._map_reduce_answer(
+                user_request, data_dict, serializer, compactor, progress_callback, use_cache, cancel_event
+            )
+        else:
+            tables = {}
+            for filename, compacted in compacted_all.items():
+                records = compacted.pop("records")
+                # 常量列和高基数列摘要中的字符串同样脱敏，记录表在序列化时逐值脱敏
+                tables[filename] = (records, self._replace_sensitive_values(compacted))
+            data_text, self.last_serialization_stats = serializer.serialize_tables(tables)
+            self._log_serialization_stats()
+
+            # 构建脱敏后的prompt（数据已按预算压缩，说明压缩方式）
+            prompt = (
+                PromptBuilder()
+                .static(DIRECT_ANSWER_DATA_NOTES)
+                .static(DIRECT_ANSWER_INSTRUCTIONS)
+                .schema(f"    数据信息（每个文件先给出元信息，再以表头+制表符分隔的表格给出记录）:\n{data_text}")
+                .dynamic(f"用户需求: {user_request}")
+                .build()
+            )
 
-        # 调用API（仅传递脱敏数据）
-        response = self.client.completions_create(prompt=prompt)
-        raw_summary = response.choices[0].message.content
+            # 调用API（仅传递脱敏数据）
+            response = self.client.completions_create(
+                prompt=prompt,
+                use_cache=use_cache,
+                stream=self.config.get("stream_responses", True),
+                on_delta=self._stream_progress(progress_callback, "直接回答"),
+                cancel_event=cancel_event,
+                workflow="direct_answer"
+            )
+            raw_summary = response.choices[0].message.content
 
         # 本地还原总结内容（关键修改：确保在本地完成还原）
         restored_summary = self.sensitive_processor.restore_sensitive_words(raw_summary)
@@ -356,3 +1027,139 @@ class LogAIProcessor:
             "chart_info": None
 
         }
+
+    def _map_reduce_answer(self, user_request, data_dict, serializer, compactor, progress_callback=None,
+                           use_cache=True, cancel_event=None):
+        """map-reduce直接回答：数据分块并发分析（map），再汇总各块结论（reduce）
+
+        各块结论和最终回答在返回前均保持脱敏状态，仅由调用方对最终回答还原敏感词。
+        """
+        def report(message):
+            if progress_callback:
+                progress_callback(message)
+            if self.verbose:
+                print(message)
+
+        chunk_budget = self.config.get("map_chunk_token_budget", compactor.token_budget)
+        max_chunks = self.config.get("map_reduce_max_chunks", 32)
+        concurrency = max(1, self.config.get("map_reduce_concurrency", 4))
+        map_max_tokens = self.config.get("map_max_tokens", 4000)
+
+        # 1. 按预算分块（总块数超过上限时按比例分给各文件，超出部分分层抽样）
+        total_rows = sum(len(df) for df in data_dict.values()) or 1
+        tasks = []  # 格式: [(文件名, 块序号, 块数, 元信息, 记录块)]
+        overview = {}  # 格式: {文件名: 脱敏后的元信息}
+        for filename, df in data_dict.items():
+            file_chunks = max(1, int(max_chunks * len(df) / total_rows))
+            meta, chunks = compactor.compact_chunks(df, chunk_budget, file_chunks)
+            meta = self._replace_sensitive_values(meta)
+            overview[filename] = meta
+            for index, chunk in enumerate(chunks or [pd.DataFrame()]):
+                tasks.append((filename, index + 1, max(1, len(chunks)), meta, chunk))
+
+        # 2. map：各数据块的请求在API客户端的事件循环中并发执行（有并发上限）
+        def chunk_prompt(task):
+            filename, index, count, meta, chunk = task
+            chunk_serializer = TabularPromptSerializer(
+                value_transform=serializer.value_transform,
+                token_estimator=serializer.estimate_tokens
+            )
+            data_text, _ = chunk_serializer.serialize_tables({filename: (chunk, meta)}, compare_json=False)
+            return (
+                PromptBuilder()
+                .static(DIRECT_ANSWER_DATA_NOTES)
+                .static(MAP_INSTRUCTIONS)
+                .schema(f"    以下是文件 {filename} 的第 {index}/{count} 块数据:\n{data_text}")
+                .dynamic(f"用户需求: {user_request}")
+                .build()
+            )
+
+        report(f"数据量超出单次分析预算，分为 {len(tasks)} 块并发分析（并发数 {concurrency}）...")
+        responses = self.client.completions_batch(
+            [{"prompt": chunk_prompt(task), "max_tokens": map_max_tokens, "use_cache": use_cache,
+              "cancel_event": cancel_event, "workflow": "map_reduce_map"}
+             for task in tasks],
+            max_concurrency=concurrency,
+            progress_callback=lambda done, total: report(f"已完成 {done}/{total} 块数据分析")
+        )
+        if cancel_event is not None and cancel_event.is_set():
+            raise RequestCancelledError()
+        partials = []
+        failed = 0
+        for (filename, index, count, _, _), response in zip(tasks, responses):
+            if isinstance(response, Exception):
+                failed += 1
+                print(f"数据块分析失败（{filename} 第 {index}/{count} 块）: {str(response)}")
+            else:
+                partials.append((f"文件 {filename} 第 {index}/{count} 块", response.choices[0].message.content))
+        if not partials:
+            raise Exception("所有数据块分析均失败，无法生成回答")
+
+        # 3. reduce：汇总结论（结论过长时分批汇总，直到能放入一个prompt）
+        overview_text = json.dumps(overview, ensure_ascii=False, default=str)
+        reduce_budget = self.config.get("reduce_token_budget", compactor.token_budget)
+        while len(partials) > 1 and self.token_estimator.estimate(self._format_partials(partials)) > reduce_budget:
+            batches = self._batch_partials(partials, reduce_budget)
+            if len(batches) == len(partials):
+                break  # 单个结论已超出预算，无法继续合并
+            report(f"部分结论过长，先分 {len(batches)} 批合并...")
+            responses = self.client.completions_batch(
+                [{"prompt": self._reduce_prompt(user_request, overview_text, batch, final=False), "use_cache": use_cache,
+                  "cancel_event": cancel_event, "workflow": "map_reduce_reduce"} for batch in batches],
+                max_concurrency=concurrency
+            )
+            if cancel_event is not None and cancel_event.is_set():
+                raise RequestCancelledError()
+            merged = []
+            for batch, response in zip(batches, responses):
+                if isinstance(response, Exception):
+                    # 合并失败的批次保留原结论
+                    print(f"部分结论合并失败: {str(response)}")
+                    merged.extend(text for _, text in batch)
+                else:
+                    merged.append(response.choices[0].message.content)
+            if len(merged) >= len(partials):
+                break
+            partials = [(f"合并结论 {i + 1}", text) for i, text in enumerate(merged)]
+
+        report("正在汇总各块分析结论...")
+        note = f"（另有 {failed} 块数据分析失败，结论可能不完整）" if failed else ""
+        response = self.client.completions_create(
+            prompt=self._reduce_prompt(user_request, overview_text, partials, final=True, note=note),
+            use_cache=use_cache,
+            stream=self.config.get("stream_responses", True),
+            on_delta=self._stream_progress(progress_callback, "汇总结论"),
+            cancel_event=cancel_event,
+            workflow="map_reduce_reduce"
+        )
+        return response.choices[0].message.content
+
+    @staticmethod
+    def _format_partials(partials):
+        return "\n\n".join(f"### {title}\n{text}" for title, text in partials)
+
+    def _batch_partials(self, partials, budget):
+        """按token预算把部分结论分批"""
+        batches, current, used = [], [], 0
+        for partial in partials:
+            tokens = self.token_estimator.estimate(partial[1])
+            if current and used + tokens > budget:
+                batches.append(current)
+                current, used = [], 0
+            current.append(partial)
+            used += tokens
+        if current:
+            batches.append(current)
+        return batches
+
+    def _reduce_prompt(self, user_request, overview_text, partials, final=True, note=""):
+        """构建汇总多个部分结论的prompt（结论保持脱敏状态）"""
+        task = "请合并这些结论，直接回答用户问题" if final else "请把这些结论合并为一份部分结论，保留具体的计数和取值"
+        return (
+            PromptBuilder()
+            .static(REDUCE_INSTRUCTIONS.format(task=task))
+            .schema(f"    各文件的整体信息:\n{overview_text}")
+            .schema(f"    部分结论{note}:\n{self._format_partials(partials)}")
+            .dynamic(f"用户需求: {user_request}")
+            .build()
+        )
@@ -0,0 +1,92 @@
+import os
+import json
+import threading
+
+
+# prompt片段的稳定程度：越靠前越稳定，排列在prompt越前面
+STATIC = 0  # 固定规则、格式说明（所有请求相同）
+SCHEMA = 1  # 数据结构和样本（同一批文件的多次请求相同）
+DYNAMIC = 2  # 用户请求等每次都可能变化的内容
+
+
+class PromptBuilder:
+    """按稳定程度排列prompt片段，使固定内容构成尽量长的公共前缀
+
+    服务端按前缀缓存prompt（命中部分计费更低、响应更快），可变内容放在最后才能命中缓存。
+    同一稳定程度的片段保持添加顺序。
+    """
+
+    def __init__(self, separator="\n\n"):
+        self.separator = separator
+        self.segments = []  # 格式: [(稳定程度, 添加顺序, 文本)]
+
+    def add(self, text, level):
+        if text:
+            self.segments.append((level, len(self.segments), text.strip('\n')))
+        return self
+
+    def static(self, text):
+        return self.add(text, STATIC)
+
+    def schema(self, text):
+        return self.add(text, SCHEMA)
+
+    def dynamic(self, text):
+        return self.add(text, DYNAMIC)
+
+    def build(self):
+        return self.separator.join(text for _, _, text in sorted(self.segments)) + "\n"
+
+
+class PromptCacheStats:
+    """按业务流程统计服务端prompt缓存的命中情况（usage中的prompt_cache_hit_tokens/prompt_cache_miss_tokens）"""
+
+    def __init__(self, cache_dir=None):
+        self.stats_file = os.path.join(cache_dir, 'prompt_cache_stats.json') if cache_dir else None
+        self.stats = {}  # 格式: {流程名: {"requests", "hit_tokens", "miss_tokens"}}
+        self._lock = threading.Lock()
+        if self.stats_file and os.path.exists(self.stats_file):
+            try:
+                with open(self.stats_file, 'r', encoding='utf-8') as f:
+                    self.stats = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"加载prompt缓存统计失败: {str(e)}")
+
+    def record(self, workflow, usage):
+        """记录一次请求的缓存命中情况，返回(命中token数, 未命中token数)，usage中没有相关字段时返回None"""
+        hit = getattr(usage, "prompt_cache_hit_tokens", None) if usage is not None else None
+        miss = getattr(usage, "prompt_cache_miss_tokens", None) if usage is not None else None
+        if hit is None and miss is None:
+            return None
+        hit, miss = hit or 0, miss or 0
+        with self._lock:
+            entry = self.stats.setdefault(workflow, {"requests": 0, "hit_tokens": 0, "miss_tokens": 0})
+            entry["requests"] += 1
+            entry["hit_tokens"] += hit
+            entry["miss_tokens"] += miss
+            self._save()
+        return hit, miss
+
+    def _save(self):
+        if not self.stats_file:
+            return
+        try:
+            with open(self.stats_file, 'w', encoding='utf-8') as f:
+                json.dump(self.stats, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"保存prompt缓存统计失败: {str(e)}")
+
+    def hit_rate(self, workflow):
+        entry = self.stats.get(workflow)
+        if not entry:
+            return None
+        total = entry["hit_tokens"] + entry["miss_tokens"]
+        return entry["hit_tokens"] / total if total else None
+
+    def report(self):
+        """各流程的请求数、命中/未命中token数及命中率"""
+        with self._lock:
+            return {
+                name: {**entry, "hit_rate": round(self.hit_rate(name) or 0.0, 4)}
+                for name, entry in self.stats.items()
+            }
@@ -0,0 +1,145 @@
+import json
+import math
+import numpy as np
+import pandas as pd
+from core.token_estimator import estimate_tokens
+from utils.helpers import json_default
+
+
+class TabularPromptSerializer:
+    """将DataFrame序列化为紧凑的表格文本（用于prompt）
+
+    输出格式：列名只在表头出现一次（TSV），重复出现的较长取值放入字典，表中以@编号引用。
+    以生成器方式逐块输出，不构建逐行字典的中间列表；同时统计相对逐行JSON布局节省的token数。
+    """
+
+    def __init__(self, delimiter='\t', chunk_rows=1000, min_repeats=3, min_value_length=8,
+                 max_dictionary=500, token_estimator=None, value_transform=None):
+        self.delimiter = delimiter
+        self.chunk_rows = chunk_rows
+        # 出现次数不少于min_repeats且长度不少于min_value_length的取值才放入字典
+        self.min_repeats = min_repeats
+        self.min_value_length = min_value_length
+        self.max_dictionary = max_dictionary
+        self.estimate_tokens = token_estimator or estimate_tokens
+        self.value_transform = value_transform  # 可选的字符串取值转换（如敏感词替换）
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"tokens": 0, "json_tokens": 0}
+
+    def _build_dictionary(self, df):
+        """按节省的字符数选出重复取值，返回{取值: 引用标记}"""
+        candidates = []
+        for col in df.columns:
+            series = df[col]
+            if not (series.dtype == 'object' or pd.api.types.is_string_dtype(series.dtype)):
+                continue
+            counts = series.dropna().astype(str).value_counts()
+            counts = counts[counts >= self.min_repeats]
+            for value, count in counts.items():
+                if len(value) >= self.min_value_length:
+                    candidates.append((len(value) * (count - 1), value))
+
+        candidates.sort(reverse=True)
+        dictionary = {}
+        for _, value in candidates:
+            if value not in dictionary:
+                dictionary[value] = f"@{len(dictionary)}"
+            if len(dictionary) >= self.max_dictionary:
+                break
+        return dictionary
+
+    def _format_value(self, value, dictionary):
+        if value is None or (isinstance(value, float) and math.isnan(value)) or value is pd.NaT:
+            return ""
+        if isinstance(value, str):
+            ref = dictionary.get(value)
+            if ref is not None:
+                return ref
+            if self.value_transform:
+                value = self.value_transform(value)
+            text = value.replace('\t', ' ').replace('\r', ' ').replace('\n', ' ')
+            # 以@开头的原始取值加转义，避免与字典引用混淆
+            return '\\' + text if text.startswith('@') else text
+        if isinstance(value, (float, np.floating)) and float(value).is_integer():
+            return str(int(value))
+        return str(value)
+
+    def _format_header(self, col):
+        text = str(col)
+        if self.value_transform:
+            text = self.value_transform(text)
+        return text.replace('\t', ' ').replace('\n', ' ')
+
+    def iter_table(self, name, df, meta=None, compare_json=True):
+        """逐块输出单个表的紧凑文本
+
+        Args:
+            name: 表名（文件名）
+            df: 数据
+            meta: 可选的元信息字典，以一行JSON输出在表头之前
+            compare_json: 是否同时估算逐行JSON布局的token数用于对比
+        """
+        dictionary = self._build_dictionary(df)
+
+        lines = [f"## 文件: {name}（{len(df)}行）\n"]
+        if meta:
+            lines.append(f"# 元信息: {json.dumps(meta, ensure_ascii=False, default=json_default)}\n")
+        if dictionary:
+            lines.append("# 字典（表中@编号表示对应取值）:\n")
+            for value, ref in dictionary.items():
+                shown = self.value_transform(value) if self.value_transform else value
+                lines.append(f"{ref}{self.delimiter}{shown.replace(chr(10), ' ')}\n")
+        lines.append(self.delimiter.join(self._format_header(c) for c in df.columns) + "\n")
+        yield from self._emit("".join(lines))
+
+        if compare_json and meta:
+            self.stats["json_tokens"] += self.estimate_tokens(
+                json.dumps(meta, ensure_ascii=False, default=json_default))
+
+        for start in range(0, len(df), self.chunk_rows):
+            chunk = df.iloc[start:start + self.chunk_rows]
+            text = "".join(
+                self.delimiter.join(self._format_value(v, dictionary) for v in row) + "\n"
+                for row in chunk.itertuples(index=False, name=None)
+            )
+            if compare_json:
+                self.stats["json_tokens"] += self.estimate_tokens(json.dumps(
+                    chunk.to_dict(orient='records'), ensure_ascii=False, default=json_default))
+            yield from self._emit(text)
+
+    def _emit(self, text):
+        self.stats["tokens"] += self.estimate_tokens(text)
+        yield text
+
+    def serialize_tables(self, tables, compare_json=True):
+        """序列化多个表
+
+        Args:
+            tables: {表名: DataFrame} 或 {表名: (DataFrame, 元信息)}
+        Returns:
+            (str, dict): 文本及统计 {"tokens", "json_tokens", "saved_tokens"}
+        """
+        self.reset_stats()
+        parts = []
+        for name, table in tables.items():
+            df, meta = table if isinstance(table, tuple) else (table, None)
+            parts.extend(self.iter_table(name, df, meta, compare_json))
+        return "".join(parts), self.report()
+
+    def report(self):
+        stats = dict(self.stats)
+        if stats["json_tokens"]:
+            stats["saved_tokens"] = stats["json_tokens"] - stats["tokens"]
+        return stats
+
+    def estimate_table_tokens(self, df):
+        """估算表格序列化后的token数（按前若干行推算，供数据压缩预算使用）"""
+        if df.empty:
+            return 0
+        head = df.head(200)
+        saved_stats = dict(self.stats)
+        text = "".join(self.iter_table("", head, compare_json=False))
+        self.stats = saved_stats
+        return int(self.estimate_tokens(text) * len(df) / len(head))
@@ -0,0 +1,668 @@
+import re
+import functools
+import numpy as np
+import pandas as pd
+from core.time_index import parse_time_values, infer_time_format
+from core.column_profile import merge_profiles
+from core.time_rollup import ROLLUP_GRAINS, ROLLUP_ATTR
+
+
+# 列角色识别：列名（小写）包含这些关键词时视为对应角色，越靠前优先级越高
+ROLE_NAME_HINTS = {
+    "ip": ('src_ip', 'source_ip', 'client_ip', 'remote_addr', 'srcip', 'ip', '源ip', '来源ip', '源地址', '地址'),
+    "user": ('username', 'user_name', 'user', 'account', 'login', '用户名', '用户', '账号', '账户'),
+    "event": ('event_type', 'eventtype', 'action', 'category', 'event', 'type', '事件类型', '类型', '动作', '操作', '事件'),
+    "status": ('status', 'result', 'outcome', 'state', '状态', '结果')
+}
+# 事件类型、状态等分类列的平均长度上限（超过时视为原始日志文本，而不是分类值）
+MAX_CATEGORY_LENGTH = 48
+
+IPV4_PATTERN = r'^\d{1,3}(?:\.\d{1,3}){3}$'
+FAILURE_PATTERN = r'fail|失败|denied|deny|拒绝|invalid|错误|error|unauthori[sz]ed|refused'
+LOGIN_PATTERN = r'login|logon|log in|sign.?in|auth|ssh|登录|登陆|认证'
+
+# 请求中出现这些词时说明包含模板无法表达的条件或分析，交给模型生成代码
+COMPLEX_HINTS = (
+    '并且', '而且', '同时', '以及', '排除', '除了', '不包括', '不含', '大于', '小于', '超过', '低于', '不少于',
+    '占比', '比例', '百分比', '平均', '均值', '中位', '关联', '相关', '对比', '比较', '异常', '预测', '原因',
+    '为什么', '如何', '建议', '趋势变化', '之间', '以来', '昨天', '今天', '最近', '本周', '上周', '本月',
+    'where', 'and', 'or', 'not', 'only', 'except', 'exclude', 'excluding', 'without', 'average', 'mean', 'ratio',
+    'percent', 'percentage', 'compare', 'comparing', 'between', 'why', 'since', 'after', 'before'
+)
+# 模板只做全量统计，请求中出现具体取值（IP、比较条件、引号括起的值、指定的用户或主机）时交给模型生成代码
+IPV4_IN_TEXT_PATTERN = re.compile(r'(?<![\d.])\d{1,3}(?:\.\d{1,3}){3}(?![\d.])')
+COMPARISON_PATTERN = re.compile(r'[\w\u4e00-\u9fff)）\]]\s*(?:==|!=|>=|<=|=|:|：|>|<)\s*[^\s，。,]')
+QUOTED_PATTERN = re.compile(r'"([^"]+)"|\'([^\']+)\'|“([^”]+)”|‘([^’]+)’|「([^」]+)」|『([^』]+)』')
+ENTITY_PATTERN = re.compile(
+    r'(?:用户|账号|账户|主机|服务器|域名)名?\s*(?:为|是|等于)?\s*(?P<cn>[a-z0-9][a-z0-9_.@\-]*)'
+    r'|(?<![a-z0-9])(?:user|username|account|host|hostname|domain)s?\s+(?:named\s+|called\s+)?(?P<en>[a-z0-9_.@\-]+)'
+    r'|(?P<masked>protected[a-z0-9]{8})'
+)
+# 指代实体的词后面出现这些词时不是具体取值（如"users by"、"用户login失败"）
+GENERIC_WORDS = {
+    'by', 'per', 'with', 'of', 'in', 'on', 'for', 'from', 'to', 'is', 'are', 'the', 'a', 'an', 'that', 'who', 'which',
+    'top', 'count', 'counts', 'number', 'list', 'name', 'names', 'id', 'ids', 'ip', 'ips', 'event', 'events', 'type',
+    'types', 'action', 'actions', 'status', 'activity', 'login', 'logins', 'logon', 'logons', 'fail', 'failed',
+    'failure', 'failures', 'auth', 'ssh'
+}
+# 模板匹配后请求中允许出现的通用词（动词、量词、虚词等），去掉这些词、模板关键词和用到的列名后
+# 仍有其他内容词时（如"登录失败的IP排名"中的"登录失败"、"凌晨2点到4点"），视为模板无法表达的条件
+FILLER_WORDS = (
+    '统计', '计算', '查询', '查看', '查找', '找出', '列出', '显示', '展示', '给出', '输出', '分析', '生成', '绘制', '画',
+    '请', '帮我', '帮忙', '一下', '所有', '全部', '每个', '每种', '各个', '各', '分别', '出现', '访问', '记录', '日志', '数据',
+    '事件', '情况', '分布', '排名', '排行', '排序', '最多', '最高', '数量', '次数', '个数', '条数', '记录数', '多少', '哪些',
+    '有', '是', '按', '前', '的', '个', '条', '次', '数', '名', '图', '表', '表格',
+    'show', 'list', 'give', 'get', 'find', 'me', 'please', 'count', 'number', 'of', 'the', 'a', 'all', 'each', 'every',
+    'per', 'by', 'in', 'most', 'frequent', 'top', 'what', 'which', 'is', 'are', 'how', 'many', 'event', 'record',
+    'log', 'data', 'rank', 'ranking', 'distribution', 'table'
+)
+CONTENT_PATTERN = re.compile(r'[a-z0-9\u4e00-\u9fff]')
+# 检查样本取值时忽略的取值长度下限（单个字符、个位数字过于常见）
+MIN_LITERAL_LENGTH = 2
+CHART_HINTS = {'柱状': 'bar', '条形': 'bar', 'bar': 'bar', '饼': 'pie', 'pie': 'pie', '折线': 'line', 'line': 'line'}
+CHART_REQUEST_HINTS = ('图', 'chart', 'plot', '可视化')
+CHINESE_NUMBERS = {'三': 3, '五': 5, '十': 10, '十五': 15, '二十': 20, '五十': 50, '一百': 100}
+TOP_N_PATTERN = re.compile(r'(?:前|top\s*|最多的?|排名前?)\s*(\d+|二十|十五|十|五十|一百|三|五)', re.IGNORECASE)
+# 简单规则语法："按X统计"、"每个X的数量"、"count by X"，X须为数据中的列名
+COUNT_BY_PATTERNS = [
+    re.compile(r'按\s*[「“"\']?(?P<col>[^\s，。,「」“”"\']+?)[」”"\']?\s*(?:统计|分组|计数|汇总|分类)'),
+    re.compile(r'(?:每个|每种|各个?)\s*[「“"\']?(?P<col>[^\s，。,「」“”"\']+?)[」”"\']?\s*的?(?:数量|次数|记录数|条数)'),
+    re.compile(r'count\s+(?:of\s+\w+\s+)?by\s+(?P<col>[\w.]+)', re.IGNORECASE)
+]
+
+
+def _column_matches(column, hints):
+    """返回列名匹配的第一个关键词的优先级（越小越优先），不匹配时返回None"""
+    name = str(column).lower()
+    for rank, hint in enumerate(hints):
+        if hint in name:
+            return rank
+    return None
+
+
+def _is_category(series):
+    text = series.dropna().astype(str)
+    return not text.empty and text.str.len().mean() <= MAX_CATEGORY_LENGTH
+
+
+def detect_column_roles(sample, time_columns=()):
+    """根据列名和样本值识别列角色
+
+    Returns:
+        dict: {"ip"/"user"/"event"/"status"/"time": 列名}，只包含识别出的角色
+    """
+    roles = {}
+    if time_columns:
+        roles["time"] = time_columns[0]
+    used = set(time_columns)
+    for role, hints in ROLE_NAME_HINTS.items():
+        best = None
+        for col in sample.columns:
+            if col in used or not isinstance(sample[col], pd.Series):
+                continue
+            rank = _column_matches(col, hints)
+            if rank is None:
+                continue
+            if role == "ip":
+                values = sample[col].dropna().astype(str)
+                if values.empty or not values.str.match(IPV4_PATTERN).mean() >= 0.8:
+                    continue
+            elif not _is_category(sample[col]):
+                continue
+            if best is None or rank < best[0]:
+                best = (rank, col)
+        if best is None and role == "ip":
+            # 列名没有提示时按取值识别IP列
+            for col in sample.columns:
+                if col in used or not isinstance(sample[col], pd.Series):
+                    continue
+                values = sample[col].dropna().astype(str)
+                if not values.empty and values.str.match(IPV4_PATTERN).mean() >= 0.8:
+                    best = (0, col)
+                    break
+        if best is not None:
+            roles[role] = best[1]
+            used.add(best[1])
+    return roles
+
+
+def parse_top_n(request, default=10):
+    match = TOP_N_PATTERN.search(request)
+    if not match:
+        return default
+    value = match.group(1)
+    return int(value) if value.isdigit() else CHINESE_NUMBERS.get(value, default)
+
+
+def _chart_type(request, default):
+    """请求中要求图表时返回图表类型（指定了类型时按指定），否则返回None"""
+    lowered = request.lower()
+    if not _contains_any(lowered, CHART_REQUEST_HINTS):
+        return None
+    for hint, chart_type in CHART_HINTS.items():
+        if _contains_keyword(lowered, hint):
+            return chart_type
+    return default
+
+
+@functools.lru_cache(maxsize=None)
+def _keyword_pattern(word):
+    """英文关键词按整词匹配（允许复数、过去式等词尾，如fail匹配failed、ip不匹配recipients），中文关键词按子串匹配"""
+    word = word.strip()
+    if not word.isascii():
+        return None
+    return re.compile(r'(?<![a-z0-9])' + re.escape(word) + r'(?:s|es|d|ed|ing)?(?![a-z0-9])')
+
+
+def _contains_keyword(text, word):
+    pattern = _keyword_pattern(word)
+    return word in text if pattern is None else pattern.search(text) is not None
+
+
+def _contains_any(text, words):
+    return any(_contains_keyword(text, word) for word in words)
+
+
+def _literal_boundary_pattern(value):
+    """取值在请求中的匹配规则：首尾为字母数字时要求前后不是字母数字（避免10匹配到100、admin匹配到administrator）"""
+    prefix = r'(?<![a-z0-9])' if value[0].isascii() and value[0].isalnum() else ''
+    suffix = r'(?![a-z0-9])' if value[-1].isascii() and value[-1].isalnum() else ''
+    return re.compile(prefix + re.escape(value) + suffix)
+
+
+def has_literal_condition(text, column_names=()):
+    """请求中是否带有具体取值的条件：IPv4地址、=/:等比较、引号括起的值（列名除外）、指定的用户/主机或脱敏后的敏感词
+
+    text须为小写且已去掉"前N"/"top N"等名次部分。
+    """
+    if IPV4_IN_TEXT_PATTERN.search(text) or COMPARISON_PATTERN.search(text):
+        return True
+    columns = {str(col).lower() for col in column_names}
+    for found in QUOTED_PATTERN.finditer(text):
+        quoted = next(group for group in found.groups() if group is not None).strip()
+        if quoted and quoted not in columns:
+            return True
+    for found in ENTITY_PATTERN.finditer(text):
+        value = found.group("cn") or found.group("en")
+        if found.group("masked") or (value and value not in GENERIC_WORDS and value not in columns):
+            return True
+    return False
+
+
+def has_unhandled_words(text, vocabulary):
+    """去掉模板词汇和通用词后，请求中是否还剩其他内容词（未知的词一律视为过滤条件）
+
+    text须为小写且已去掉名次部分；英文词按整词去掉（含复数等词尾），中文词按子串去掉，长词优先。
+    """
+    for word in sorted(set(vocabulary) | set(FILLER_WORDS), key=len, reverse=True):
+        pattern = _keyword_pattern(word)
+        text = text.replace(word, ' ') if pattern is None else pattern.sub(' ', text)
+    return CONTENT_PATTERN.search(text) is not None
+
+
+def mentions_sample_value(text, samples, time_columns=None, ignore=None):
+    """请求中是否出现了样本数据中的某个取值（如用户名、事件类型、状态码），即请求按该取值过滤
+
+    Args:
+        text: 小写且已去掉名次部分的请求
+        samples: {文件名: 样本DataFrame}
+        time_columns: {文件名: 时间列列表}，时间列的取值不检查
+        ignore: 可选的正则，匹配的取值由模板本身处理（如登录失败模板中的失败、登录类取值）
+    """
+    time_columns = time_columns or {}
+    for name, sample in samples.items():
+        skip = set(time_columns.get(name, []))
+        for col in sample.columns:
+            if col in skip or not isinstance(sample[col], pd.Series):
+                continue
+            for value in sample[col].dropna().astype(str).str.strip().str.lower().unique():
+                if len(value) < MIN_LITERAL_LENGTH or len(value) > MAX_CATEGORY_LENGTH or value not in text:
+                    continue
+                if ignore is not None and re.search(ignore, value):
+                    continue
+                if _literal_boundary_pattern(value).search(text):
+                    return True
+    return False
+
+
+class TemplateMatch:
+    """模板匹配结果：模板、参数及各文件用到的列"""
+
+    def __init__(self, template, params, columns):
+        self.template = template
+        self.params = params
+        self.columns = columns  # 格式: {文件名: {角色: 列名}}
+        self.time_columns = {}  # 格式: {文件名: 时间列列表}
+
+    @property
+    def name(self):
+        return self.template.name
+
+    @property
+    def description(self):
+        return self.template.description
+
+    def projection(self):
+        """只需加载的列 {文件名: 列名列表}（时间列始终保留，以便按时间范围截取）"""
+        return {
+            name: list(dict.fromkeys(list(roles.values()) + list(self.time_columns.get(name, []))))
+            for name, roles in self.columns.items()
+        }
+
+    def run(self, data_dict):
+        return self.template.run(self, data_dict)
+
+    def run_sketch(self, profiles):
+        return self.template.run_sketch(self, profiles)
+
+
+class QueryTemplate:
+    """参数化的查询模板：关键词组（每组至少命中一个）+ 所需列角色 + 向量化实现"""
+
+    name = ""
+    description = ""
+    keyword_groups = ()
+    roles = ()  # 必须具备的列角色
+    optional_roles = ()
+    handled_values = None  # 模板自身会处理的取值（正则），请求中出现这类样本取值时不视为过滤条件
+
+    def match(self, request, schema):
+        """request为小写的脱敏请求，schema为{文件名: 列角色}；匹配时返回TemplateMatch，否则返回None"""
+        if not all(_contains_any(request, group) for group in self.keyword_groups):
+            return None
+        columns = {
+            name: {role: roles[role] for role in self.roles + self.optional_roles if role in roles}
+            for name, roles in schema.items() if all(role in roles for role in self.roles)
+        }
+        if not columns or not self.accepts(columns):
+            return None
+        return TemplateMatch(self, self.parse_params(request), columns)
+
+    def accepts(self, columns):
+        return True
+
+    def vocabulary(self, match):
+        """请求中可以出现的词：模板关键词、所用列角色的名称、用到的列名及图表相关的词"""
+        words = [word for group in self.keyword_groups for word in group]
+        for role in self.roles + self.optional_roles:
+            words.extend(ROLE_NAME_HINTS.get(role, ()))
+        words.extend(str(col).lower() for roles in match.columns.values() for col in roles.values())
+        words.extend(CHART_HINTS)
+        words.extend(CHART_REQUEST_HINTS)
+        return words
+
+    def parse_params(self, request):
+        return {"chart_type": _chart_type(request, None)}
+
+    @staticmethod
+    def _series(match, data_dict, role):
+        """合并各文件中某个角色列的数据"""
+        parts = [data_dict[name][roles[role]] for name, roles in match.columns.items()
+                 if name in data_dict and role in roles]
+        if not parts:
+            return pd.Series(dtype=object)
+        return pd.concat(parts, ignore_index=True) if len(parts) > 1 else parts[0]
+
+    @staticmethod
+    def _counts_table(series, label, top=None):
+        counts = series.value_counts(dropna=True)
+        if top:
+            counts = counts.head(top)
+        return pd.DataFrame({label: counts.index.astype(str), "次数": counts.to_numpy()})
+
+    @staticmethod
+    def _merged_profile(match, profiles, role):
+        """合并各文件中某个角色列的统计，任一文件缺少该列的统计时返回None"""
+        return merge_profiles([profiles.get(name, {}).get(roles[role])
+                               for name, roles in match.columns.items() if role in roles])
+
+    @staticmethod
+    def _sketch_counts_table(profile, label, top=None):
+        """由列统计中的常见值生成计数表，返回(表格, 是否为近似计数)
+
+        Space-Saving有计数器被淘汰时只能给出前若干名；要求全部取值（top为None）或超出保留的名次时返回(None, False)。
+        """
+        if profile is None or profile.frequency is None:
+            return None, False
+        if (top is None and profile.heavy_hitters.floor > 0) or (top and top > profile.top_k):
+            return None, False
+        top_values = profile.heavy_hitters.top(top)
+        table = pd.DataFrame({label: [str(value) for value, _, _ in top_values],
+                              "次数": [count for _, count, _ in top_values]})
+        return table, any(error for _, _, error in top_values)
+
+    def run(self, match, data_dict):
+        raise NotImplementedError
+
+    def run_sketch(self, match, profiles):
+        """用已加载数据集的列统计（sketch）回答，不读取数据；profiles为{文件名: {列名: ColumnProfile}}
+
+        Returns:
+            dict | None: 结果变量，模板不支持或统计无法给出可靠结果时返回None
+        """
+        return None
+
+
+class TopIpTemplate(QueryTemplate):
+    name = "top_ips"
+    description = "出现次数最多的IP"
+    keyword_groups = (('ip', '地址'), ('top', '前', '最多', '排名', '最频繁', '最活跃', '次数'))
+    roles = ("ip",)
+
+    def parse_params(self, request):
+        # 要求排名时默认取前10个，只要求统计次数时返回全部IP
+        ranked = _contains_any(request, ('top', '前', '最多', '排名', '最频繁', '最活跃'))
+        return {"top": parse_top_n(request, default=10 if ranked else None), "chart_type": _chart_type(request, "bar")}
+
+    def run(self, match, data_dict):
+        series = self._series(match, data_dict, "ip")
+        top = match.params["top"]
+        table = self._counts_table(series, "IP", top)
+        summary = f"共 {len(series)} 条记录，涉及 {series.nunique()} 个不同IP。"
+        if not table.empty:
+            summary += f"出现次数最多的IP为 {table.iloc[0, 0]}（{table.iloc[0, 1]} 次）"
+            summary += f"，以下为前 {len(table)} 个IP。" if top else "。"
+        title = f"出现次数前{top}的IP" if top else "各IP出现次数"
+        return {"result_table": table, "summary": summary, "chart_info": _bar_chart(match, title, "IP", "次数")}
+
+    def run_sketch(self, match, profiles):
+        profile = self._merged_profile(match, profiles, "ip")
+        top = match.params["top"]
+        table, approximate = self._sketch_counts_table(profile, "IP", top)
+        if table is None:
+            return None
+        summary = f"共 {profile.count} 条记录，涉及{'' if profile.to_dict()['distinct_exact'] else '约'} {profile.distinct} 个不同IP。"
+        if not table.empty:
+            summary += f"出现次数最多的IP为 {table.iloc[0, 0]}（{table.iloc[0, 1]} 次）"
+            summary += f"，以下为前 {len(table)} 个IP。" if top else "。"
+        if approximate:
+            summary += "（基于数据统计摘要，次数为近似上界）"
+        title = f"出现次数前{top}的IP" if top else "各IP出现次数"
+        return {"result_table": table, "summary": summary, "chart_info": _bar_chart(match, title, "IP", "次数")}
+
+
+class DistinctIpTemplate(QueryTemplate):
+    name = "distinct_ips"
+    description = "不同IP数量"
+    keyword_groups = (('ip', '地址', '来源'), ('不同', '去重', 'distinct', 'unique', '独立', '唯一'))
+    roles = ("ip",)
+
+    def run(self, match, data_dict):
+        rows = [(name, data_dict[name][roles["ip"]].nunique()) for name, roles in match.columns.items()
+                if name in data_dict]
+        total = self._series(match, data_dict, "ip").nunique()
+        return self._result(match, rows, total, approximate=False)
+
+    def run_sketch(self, match, profiles):
+        rows = []
+        for name, roles in match.columns.items():
+            profile = profiles.get(name, {}).get(roles["ip"])
+            if profile is None:
+                return None
+            rows.append((name, profile.distinct))
+        merged = self._merged_profile(match, profiles, "ip")
+        return self._result(match, rows, merged.distinct, approximate=not merged.to_dict()["distinct_exact"])
+
+    def _result(self, match, rows, total, approximate):
+        if len(rows) > 1:
+            rows.append(("合计", total))
+        table = pd.DataFrame({"文件": [name for name, _ in rows], "不同IP数": [count for _, count in rows]})
+        summary = f"共有{'约' if approximate else ''} {total} 个不同IP。"
+        if approximate:
+            summary += "（基于HyperLogLog统计摘要，误差约1%）"
+        return {"result_table": table, "summary": summary, "chart_info": None}
+
+
+class EventTypeCountTemplate(QueryTemplate):
+    name = "event_type_counts"
+    description = "按事件类型统计数量"
+    keyword_groups = (('事件类型', '类型', 'event type', 'event_type', 'action', '动作', '操作'),
+                      ('统计', '数量', '次数', '分布', 'count', '多少', '各'))
+    roles = ("event",)
+
+    def parse_params(self, request):
+        return {"chart_type": _chart_type(request, "pie")}
+
+    def run(self, match, data_dict):
+        series = self._series(match, data_dict, "event")
+        table = self._counts_table(series, "事件类型")
+        summary = f"共 {len(series)} 条记录，{len(table)} 种事件类型。"
+        if not table.empty:
+            summary += f"最多的是 {table.iloc[0, 0]}（{table.iloc[0, 1]} 次，占 {table.iloc[0, 1] / max(1, len(series)):.1%}）。"
+        return {"result_table": table, "summary": summary,
+                "chart_info": _bar_chart(match, "各事件类型数量", "事件类型", "次数")}
+
+    def run_sketch(self, match, profiles):
+        profile = self._merged_profile(match, profiles, "event")
+        table, _ = self._sketch_counts_table(profile, "事件类型")
+        if table is None:
+            return None
+        total = profile.count
+        summary = f"共 {total} 条记录，{len(table)} 种事件类型。"
+        if not table.empty:
+            summary += f"最多的是 {table.iloc[0, 0]}（{table.iloc[0, 1]} 次，占 {table.iloc[0, 1] / max(1, total):.1%}）。"
+        return {"result_table": table, "summary": summary,
+                "chart_info": _bar_chart(match, "各事件类型数量", "事件类型", "次数")}
+
+
+class EventsPerHourTemplate(QueryTemplate):
+    name = "events_per_hour"
+    description = "每小时事件数"
+    keyword_groups = (('每小时', '按小时', '小时', 'hourly', 'per hour', 'by hour'),)
+    roles = ("time",)
+    grain = "hour"
+    label = "小时"
+    time_format = "%Y-%m-%d %H:00"
+
+    def parse_params(self, request):
+        return {"chart_type": _chart_type(request, "line")}
+
+    def _bucket_counts(self, match, data_dict):
+        """各文件按时间段计数后合并：有覆盖整个DataFrame的时间预聚合时直接使用，否则解析时间列"""
+        size = ROLLUP_GRAINS[self.grain]
+        parts = []
+        for name, roles in match.columns.items():
+            if name not in data_dict:
+                continue
+            df = data_dict[name]
+            rollups = df.attrs.get(ROLLUP_ATTR)
+            if rollups is not None and rollups.time_column == roles["time"] and rollups.row_count == len(df):
+                table = rollups.table(self.grain)
+                if table is not None:
+                    parts.append(pd.Series(table["count"].to_numpy(),
+                                           index=table["time"].to_numpy().view('int64') // size))
+                    continue
+            series = df[roles["time"]]
+            spec = infer_time_format(series) or {}
+            epoch = parse_time_values(series, spec.get("format"), spec.get("unit"))
+            epoch = epoch[epoch != np.iinfo('int64').min]
+            buckets, counts = np.unique(epoch // size, return_counts=True)
+            parts.append(pd.Series(counts, index=buckets))
+        if not parts:
+            return pd.Series(dtype='int64')
+        return pd.concat(parts).groupby(level=0).sum().sort_index()
+
+    def run(self, match, data_dict):
+        counts = self._bucket_counts(match, data_dict)
+        size = ROLLUP_GRAINS[self.grain]
+        table = pd.DataFrame({self.label: pd.to_datetime(counts.index.to_numpy(dtype='int64') * size),
+                              "事件数": counts.to_numpy(dtype='int64')})
+        summary = f"共 {int(counts.sum())} 条带时间的记录，覆盖 {len(table)} 个{self.label}。"
+        if not table.empty:
+            peak = table["事件数"].idxmax()
+            summary += (f"事件最多的{self.label}为 {table.loc[peak, self.label]:{self.time_format}}"
+                        f"（{table.loc[peak, '事件数']} 条），平均每{self.label} {table['事件数'].mean():.1f} 条。")
+        chart_info = None
+        if match.params["chart_type"]:
+            chart_info = {"chart_type": match.params["chart_type"], "title": f"每{self.label}事件数",
+                          "data_prep": {"x_col": self.label, "y_col": "事件数"}}
+        return {"result_table": table, "summary": summary, "chart_info": chart_info}
+
+
+class EventsPerMinuteTemplate(EventsPerHourTemplate):
+    name = "events_per_minute"
+    description = "每分钟事件数"
+    keyword_groups = (('每分钟', '按分钟', '分钟', 'per minute', 'by minute'),)
+    grain = "minute"
+    label = "分钟"
+    time_format = "%Y-%m-%d %H:%M"
+
+
+class FailedLoginTemplate(QueryTemplate):
+    name = "failed_logins_per_user"
+    description = "各用户登录失败次数"
+    keyword_groups = (('失败', 'fail', 'failure'), ('登录', '登陆', 'login', 'logon', '认证'),
+                      ('用户', '账号', 'user', 'account', '每个', '各'))
+    roles = ("user",)
+    optional_roles = ("status", "event")
+    handled_values = f"{FAILURE_PATTERN}|{LOGIN_PATTERN}"
+
+    def accepts(self, columns):
+        # 需要状态列或事件列判断是否失败
+        return any("status" in roles or "event" in roles for roles in columns.values())
+
+    def parse_params(self, request):
+        return {"top": parse_top_n(request, default=None), "chart_type": _chart_type(request, "bar")}
+
+    def run(self, match, data_dict):
+        users = []
+        for name, roles in match.columns.items():
+            if name not in data_dict:
+                continue
+            df = data_dict[name]
+            failed = np.zeros(len(df), dtype=bool)
+            for role in ("status", "event"):
+                if role in roles:
+                    failed |= df[roles[role]].astype(str).str.contains(FAILURE_PATTERN, case=False, regex=True).to_numpy()
+            if "event" in roles:
+                events = df[roles["event"]].astype(str)
+                is_login = events.str.contains(LOGIN_PATTERN, case=False, regex=True).to_numpy()
+                if is_login.any():
+                    # 事件列能区分登录事件时只统计登录失败
+                    failed &= is_login
+            users.append(df[roles["user"]][failed])
+        series = pd.concat(users, ignore_index=True) if users else pd.Series(dtype=object)
+        table = self._counts_table(series, "用户", match.params["top"])
+        table = table.rename(columns={"次数": "失败次数"})
+        summary = f"共 {len(series)} 次登录失败，涉及 {series.nunique()} 个用户。"
+        if not table.empty:
+            summary += f"失败次数最多的用户为 {table.iloc[0, 0]}（{table.iloc[0, 1]} 次）。"
+        return {"result_table": table, "summary": summary,
+                "chart_info": _bar_chart(match, "各用户登录失败次数", "用户", "失败次数")}
+
+
+class CountByColumnTemplate(QueryTemplate):
+    """规则语法匹配的通用模板：按请求中指定的列统计各取值的数量"""
+
+    name = "count_by_column"
+    description = "按指定列统计数量"
+
+    def match(self, request, schema, columns_by_file=None):
+        for pattern in COUNT_BY_PATTERNS:
+            found = pattern.search(request)
+            if not found:
+                continue
+            wanted = found.group("col").strip().lower()
+            columns = {
+                name: {"column": col}
+                for name, cols in (columns_by_file or {}).items()
+                for col in cols if str(col).lower() == wanted
+            }
+            if columns:
+                return TemplateMatch(self, {"top": parse_top_n(request, default=None),
+                                            "chart_type": _chart_type(request, "bar"), "label": wanted}, columns)
+        return None
+
+    def vocabulary(self, match):
+        words = ['统计', '分组', '计数', '汇总', '分类', '每个', '每种', '各个', '各', '数量', '次数', '记录数', '条数',
+                 'count', 'of', 'by', match.params["label"]]
+        words.extend(str(roles["column"]).lower() for roles in match.columns.values())
+        words.extend(CHART_HINTS)
+        words.extend(CHART_REQUEST_HINTS)
+        return words
+
+    def run(self, match, data_dict):
+        series = self._series(match, data_dict, "column")
+        label = str(next(iter(match.columns.values()))["column"])
+        table = self._counts_table(series, label, match.params["top"])
+        summary = f"共 {len(series)} 条记录，{label} 有 {series.nunique()} 个不同取值。"
+        if not table.empty:
+            summary += f"最多的是 {table.iloc[0, 0]}（{table.iloc[0, 1]} 次）。"
+        return {"result_table": table, "summary": summary,
+                "chart_info": _bar_chart(match, f"按{label}统计数量", label, "次数")}
+
+    def run_sketch(self, match, profiles):
+        profile = self._merged_profile(match, profiles, "column")
+        label = str(next(iter(match.columns.values()))["column"])
+        table, approximate = self._sketch_counts_table(profile, label, match.params["top"])
+        if table is None:
+            return None
+        summary = f"共 {profile.count} 条记录，{label} 有{'' if profile.to_dict()['distinct_exact'] else '约'} {profile.distinct} 个不同取值。"
+        if not table.empty:
+            summary += f"最多的是 {table.iloc[0, 0]}（{table.iloc[0, 1]} 次）。"
+        if approximate:
+            summary += "（基于数据统计摘要，次数为近似上界）"
+        return {"result_table": table, "summary": summary,
+                "chart_info": _bar_chart(match, f"按{label}统计数量", label, "次数")}
+
+
+def _bar_chart(match, title, x_col, y_col):
+    chart_type = match.params.get("chart_type")
+    if not chart_type:
+        return None
+    if chart_type == "pie":
+        return {"chart_type": "pie", "title": title, "data_prep": {"x_col": x_col, "values": y_col}}
+    return {"chart_type": chart_type, "title": title, "data_prep": {"x_col": x_col, "y_col": y_col}}
+
+
+# 按优先级排列：具体的模板在前，通用的按列统计在最后
+DEFAULT_TEMPLATES = [FailedLoginTemplate(), TopIpTemplate(), DistinctIpTemplate(), EventsPerMinuteTemplate(),
+                     EventsPerHourTemplate(), EventTypeCountTemplate()]
+
+
+class QueryRouter:
+    """意图路由：常见请求直接匹配内置的向量化查询模板，跳过模型生成代码
+
+    只在请求不含模板无法表达的条件（过滤、比例、对比等）时匹配，宁可漏配也不误配：
+    请求中出现IP地址、比较条件、引号括起的值、指定的用户/主机或样本数据中的取值时，视为带过滤条件而不匹配；
+    去掉模板关键词、用到的列名和通用词后仍剩其他内容词时同样不匹配。
+    """
+
+    def __init__(self, templates=None):
+        self.templates = list(templates or DEFAULT_TEMPLATES)
+        self.count_by_column = CountByColumnTemplate()
+
+    def route(self, request, samples, time_columns=None):
+        """
+        Args:
+            request: 脱敏后的用户请求
+            samples: {文件名: 样本DataFrame}
+            time_columns: {文件名: 时间列列表}
+        Returns:
+            TemplateMatch | None
+        """
+        text = f" {request.strip().lower()} "
+        if _contains_any(text, COMPLEX_HINTS):
+            return None
+        # "前10"、"top 10"中的数字不是取值条件
+        literal_text = TOP_N_PATTERN.sub(" ", text)
+        column_names = [col for sample in samples.values() for col in sample.columns]
+        if has_literal_condition(literal_text, column_names):
+            return None
+        time_columns = time_columns or {}
+        schema = {name: detect_column_roles(sample, time_columns.get(name, [])) for name, sample in samples.items()}
+        match = None
+        for template in self.templates:
+            match = template.match(text, schema)
+            if match is not None:
+                break
+        if match is None:
+            match = self.count_by_column.match(
+                text, schema, {name: list(sample.columns) for name, sample in samples.items()}
+            )
+        if match is None or has_unhandled_words(literal_text, match.template.vocabulary(match)):
+            return None
+        if mentions_sample_value(literal_text, samples, time_columns, match.template.handled_values):
+            return None
+        match.time_columns = {name: list(time_columns.get(name, [])) for name in match.columns}
+        return match
@@ -0,0 +1,184 @@
+import time
+import random
+import asyncio
+import openai
+
+
+# 可重试的HTTP状态码（限流、超时冲突、服务端错误）
+RETRYABLE_STATUS = {408, 409, 429, 500, 502, 503, 504}
+# 计入熔断器的失败（服务端或网络故障，不含限流和请求本身的错误）
+SERVER_FAILURE_STATUS = {500, 502, 503, 504}
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断器打开，暂停向API发送请求"""
+
+
+def _retry_after_seconds(error):
+    """读取响应头中的Retry-After（秒数或HTTP日期），没有时返回None"""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return float(value) / 1000
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        from email.utils import parsedate_to_datetime
+        try:
+            return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return None
+
+
+def classify_error(error):
+    """错误分类
+
+    Returns:
+        (bool, bool, float | None): (是否可重试, 是否计入熔断器, 服务端要求的等待秒数)
+    """
+    if isinstance(error, (asyncio.TimeoutError, openai.APITimeoutError, openai.APIConnectionError)):
+        return True, True, None
+    if isinstance(error, openai.APIStatusError):
+        status = error.status_code
+        return status in RETRYABLE_STATUS, status in SERVER_FAILURE_STATUS, _retry_after_seconds(error)
+    if isinstance(error, (openai.OpenAIError, ValueError, TypeError)):
+        # 认证、参数等客户端错误，重试不会成功
+        return False, False, None
+    return True, True, None
+
+
+def backoff_delay(attempt, retry_after=None, base=1.0, cap=60.0):
+    """指数退避（全抖动）；服务端给出Retry-After时以其为下限并附加少量抖动"""
+    delay = random.uniform(0, min(cap, base * 2 ** attempt))
+    if retry_after is not None:
+        delay = retry_after + random.uniform(0, min(1.0, base))
+    return delay
+
+
+class TokenBucket:
+    """令牌桶：按每分钟速率持续补充，容量为一分钟的额度；余额可为负（事后按实际用量扣减）"""
+
+    def __init__(self, per_minute):
+        self.rate = per_minute / 60.0
+        self.capacity = float(per_minute)
+        self.tokens = float(per_minute)
+        self.updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """获取amount个令牌需要等待的秒数"""
+        self._refill()
+        amount = min(amount, self.capacity)  # 超过桶容量的请求在桶满时放行
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount):
+        self._refill()
+        self.tokens -= amount
+
+
+class RateLimiter:
+    """请求数（RPM）和token数（TPM）限流，所有请求共用；收到429时全局暂停到Retry-After之后"""
+
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.paused_until = 0.0
+        self._lock = None
+
+    async def acquire(self, estimated_tokens=0):
+        """等待直到可以发送请求，并预扣请求数和预估的prompt token数"""
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            while True:
+                wait = max(0.0, self.paused_until - time.monotonic())
+                if self.requests is not None:
+                    wait = max(wait, self.requests.wait_time(1))
+                if self.tokens is not None:
+                    wait = max(wait, self.tokens.wait_time(estimated_tokens))
+                if wait <= 0:
+                    break
+                await asyncio.sleep(wait)
+            if self.requests is not None:
+                self.requests.consume(1)
+            if self.tokens is not None:
+                self.tokens.consume(estimated_tokens)
+
+    def record_usage(self, estimated_tokens, usage):
+        """按实际用量修正token额度（补扣输出token及prompt估算误差）"""
+        if self.tokens is None or usage is None:
+            return
+        prompt_tokens = getattr(usage, "prompt_tokens", None) or estimated_tokens
+        completion_tokens = getattr(usage, "completion_tokens", None) or 0
+        self.tokens.consume(prompt_tokens - estimated_tokens + completion_tokens)
+
+    def pause(self, seconds):
+        """收到限流响应后，所有请求暂停到指定时间之后"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+class CircuitBreaker:
+    """熔断器：连续失败达到阈值后打开，冷却时间内直接拒绝请求；冷却后放行一个试探请求"""
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.half_open = False
+
+    def before_request(self):
+        """熔断器打开时抛出CircuitOpenError
+
+        Returns:
+            bool: 本次请求是否为试探请求（调用方须在请求结束时记录结果或调用release_trial）
+        """
+        if self.opened_at is None:
+            return False
+        elapsed = time.monotonic() - self.opened_at
+        if elapsed < self.reset_timeout:
+            remaining = max(1, int(self.reset_timeout - elapsed))
+            raise CircuitOpenError(f"API服务连续 {self.failures} 次请求失败，已暂停请求，请约 {remaining} 秒后重试")
+        if self.half_open:
+            raise CircuitOpenError(f"API服务连续 {self.failures} 次请求失败，正在试探服务是否恢复，请稍后重试")
+        self.half_open = True  # 放行一个试探请求
+        return True
+
+    def release_trial(self, service_reachable=False):
+        """试探请求结束但未记录成功或失败时调用（被取消、收到429或400等非服务端故障的错误）
+
+        服务有响应时关闭熔断；被取消等无法判断服务状态时重新打开，冷却时间重新计算。
+        """
+        if not self.half_open:
+            return
+        if service_reachable:
+            self.record_success()
+        else:
+            self.opened_at = time.monotonic()
+            self.half_open = False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.half_open = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self.half_open or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+            self.half_open = False
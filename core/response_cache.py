@@ -0,0 +1,117 @@
+import os
+import json
+import time
+import types
+import sqlite3
+import hashlib
+import threading
+
+
+def make_cache_key(messages, model, temperature, max_tokens):
+    """按脱敏后的消息、模型、温度和max_tokens计算缓存键"""
+    payload = json.dumps(
+        {"messages": messages, "model": model, "temperature": temperature, "max_tokens": max_tokens},
+        ensure_ascii=False, sort_keys=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _response_to_dict(response):
+    """提取响应中需要缓存的字段（内容均为API返回的脱敏文本）"""
+    choice = response.choices[0]
+    usage = getattr(response, "usage", None)
+    return {
+        "content": choice.message.content,
+        "reasoning_content": getattr(choice.message, "reasoning_content", None),
+        "finish_reason": getattr(choice, "finish_reason", None),
+        "usage": {
+            "prompt_tokens": getattr(usage, "prompt_tokens", None),
+            "completion_tokens": getattr(usage, "completion_tokens", None),
+            "total_tokens": getattr(usage, "total_tokens", None)
+        } if usage is not None else None
+    }
+
+
+def _dict_to_response(data):
+    """将缓存的字段还原为与API响应结构一致的对象（response.choices[0].message.content）"""
+    message = types.SimpleNamespace(content=data["content"], reasoning_content=data.get("reasoning_content"))
+    choice = types.SimpleNamespace(message=message, finish_reason=data.get("finish_reason"), index=0)
+    usage = types.SimpleNamespace(**data["usage"]) if data.get("usage") else None
+    return types.SimpleNamespace(choices=[choice], usage=usage, cached=True)
+
+
+class ResponseCache:
+    """以请求内容哈希为键的API响应缓存（SQLite，位于缓存目录下）
+
+    只缓存发往API的脱敏prompt对应的原始响应（脱敏文本），还原后的内容不会写入缓存。
+    超过有效期的记录不再命中，总大小超过上限时按最近访问时间淘汰。
+    """
+
+    def __init__(self, cache_dir, ttl_seconds=7 * 24 * 3600, max_bytes=200 * 1024 * 1024):
+        self.path = os.path.join(cache_dir, 'responses.sqlite3')
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "key TEXT PRIMARY KEY, model TEXT, data TEXT NOT NULL, size INTEGER NOT NULL, "
+            "created REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed)")
+        self._conn.commit()
+        self.purge_expired()
+
+    def get(self, key):
+        """返回缓存的响应对象，未命中或已过期时返回None"""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT data, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.ttl_seconds:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return _dict_to_response(json.loads(row[0]))
+
+    def put(self, key, model, response):
+        data = json.dumps(_response_to_dict(response), ensure_ascii=False)
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, model, data, size, created, accessed) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, data, len(data.encode('utf-8')), now, now)
+            )
+            self._conn.commit()
+            self._evict()
+
+    def _evict(self):
+        """总大小超过上限时按最近访问时间淘汰，直到降到上限的90%以下"""
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        target = self.max_bytes * 0.9
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed").fetchall():
+            if total <= target:
+                break
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+        self._conn.commit()
+
+    def purge_expired(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE created < ?", (time.time() - self.ttl_seconds,))
+            self._conn.commit()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def stats(self):
+        with self._lock:
+            count, total = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        return {"entries": count, "bytes": total, "hits": self.hits, "misses": self.misses}
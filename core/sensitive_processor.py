@@ -1,6 +1,7 @@
 import re
 import json
 import os
+import hashlib
 import random
 import string
 import pandas as pd
@@ -312,6 +313,11 @@ class SensitiveWordProcessor:
         # 使用缓存的合并正则单次还原
         return self.combined_restore_pattern.sub(restore_callback, text)
 
+    def get_words_signature(self):
+        """敏感词表签名，用于判断缓存的脱敏数据是否仍然有效"""
+        content = json.dumps(self.sensitive_words, ensure_ascii=False, sort_keys=True)
+        return hashlib.md5(content.encode('utf-8')).hexdigest()
+
     def get_all_sensitive_words(self):
         """获取所有敏感词列表"""
         return [(k, v) for k, v in self.sensitive_words.items()]
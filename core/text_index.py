@@ -0,0 +1,322 @@
+import re
+import numpy as np
+import pandas as pd
+
+
+# 分词规则：小写后的连续字母数字（含下划线）为一个词，中文按单字切分
+TOKEN_PATTERN = r'[0-9a-z_]+|[一-鿿]'
+# 查询语法：双引号括起的为短语，其余按空白分隔
+QUERY_PATTERN = re.compile(r'"([^"]+)"|(\S+)')
+# 建立索引时每次分词的行数（控制展开后的词表内存）
+INDEX_CHUNK_ROWS = 200000
+# 追加产生的段数超过该值时合并为一段
+MAX_SEGMENTS = 8
+EMPTY_ROWS = np.empty(0, dtype='int64')
+
+
+def tokenize(text):
+    return re.findall(TOKEN_PATTERN, str(text).lower())
+
+
+def parse_query(query):
+    """解析查询为词项列表：双引号括起的短语作为一个词项，也可直接传入词项列表"""
+    if isinstance(query, (list, tuple)):
+        return [str(term) for term in query if str(term).strip()]
+    return [phrase or word for phrase, word in QUERY_PATTERN.findall(str(query))]
+
+
+def encode_varints(values):
+    """把非负整数数组编码为变长字节（每字节7位，最高位表示后面还有字节），返回(字节数组, 每个值的字节数)"""
+    values = np.asarray(values, dtype=np.uint64)
+    nbytes = np.ones(len(values), dtype=np.int64)
+    rest = values >> np.uint64(7)
+    while rest.any():
+        nbytes += rest > 0
+        rest >>= np.uint64(7)
+    owner = np.repeat(np.arange(len(values)), nbytes)
+    group = np.arange(int(nbytes.sum())) - np.repeat(np.cumsum(nbytes) - nbytes, nbytes)
+    data = ((values[owner] >> (group * 7).astype(np.uint64)) & np.uint64(0x7F)).astype(np.uint8)
+    data[group < nbytes[owner] - 1] |= 0x80
+    return data, nbytes
+
+
+def decode_varints(data):
+    """encode_varints的逆过程，返回int64数组"""
+    if len(data) == 0:
+        return EMPTY_ROWS
+    ends = np.flatnonzero(data < 0x80)
+    starts = np.concatenate([[0], ends[:-1] + 1])
+    group = np.arange(len(data)) - np.repeat(starts, ends - starts + 1)
+    parts = (data & 0x7F).astype(np.uint64) << (group * 7).astype(np.uint64)
+    return np.add.reduceat(parts, starts).astype(np.int64)
+
+
+class _Segment:
+    """一段倒排表：词表 + 按词存放的压缩倒排列表（行号差值的变长编码）"""
+
+    def __init__(self, rows, tokens):
+        """rows须为非递减（分词结果按行展开的顺序），按词稳定排序后各倒排列表内的行号即为升序"""
+        codes, vocab = pd.factorize(tokens)
+        order = np.argsort(codes, kind='stable')
+        codes, rows = codes[order], rows[order]
+        # 同一行中重复出现的词只记一次
+        keep = np.concatenate([[True], (codes[1:] != codes[:-1]) | (rows[1:] != rows[:-1])])
+        codes, rows = codes[keep], rows[keep]
+        first = np.concatenate([[True], codes[1:] != codes[:-1]])
+        deltas = np.where(first, rows, np.concatenate([[0], np.diff(rows)]))
+        self.data, nbytes = encode_varints(deltas)
+        starts = np.flatnonzero(first)
+        byte_positions = np.concatenate([[0], np.cumsum(nbytes)])
+        self.offsets = np.concatenate([byte_positions[starts], [byte_positions[-1]]])
+        self.counts = np.diff(np.concatenate([starts, [len(codes)]]))
+        self.vocab = pd.Index(vocab)
+        # 子串查找用：按长度排序的词以换行拼接成一个字符串（词中不含换行，匹配不会跨词）及各词的起点
+        lengths = np.fromiter((len(token) for token in vocab), dtype=np.int64, count=len(vocab))
+        self.by_length = np.argsort(lengths, kind='stable')
+        self.sorted_lengths = lengths[self.by_length]
+        self.joined = '\n'.join(vocab[self.by_length])
+        self.starts = np.concatenate([[0], np.cumsum(self.sorted_lengths + 1)[:-1]]).astype(np.int64)
+
+    def postings(self, token):
+        position = self.vocab.get_indexer([token])[0]
+        if position < 0:
+            return EMPTY_ROWS
+        return np.cumsum(decode_varints(self.data[self.offsets[position]:self.offsets[position + 1]]))
+
+    def vocab_containing(self, text):
+        """词表中包含text的词的位置：与text相同的词查哈希表，更长的词在拼接的词表字符串中一次查找"""
+        exact = self.vocab.get_indexer([text])[0]
+        first_longer = np.searchsorted(self.sorted_lengths, len(text), side='right')
+        positions = [exact] if exact >= 0 else []
+        if first_longer < len(self.starts):
+            hits = np.fromiter(
+                (found.start() for found in re.compile(re.escape(text)).finditer(self.joined, int(self.starts[first_longer]))),
+                dtype=np.int64
+            )
+            if len(hits):
+                positions.extend(self.by_length[np.unique(np.searchsorted(self.starts, hits, side='right') - 1)])
+        return np.sort(np.asarray(positions, dtype=np.int64))
+
+    def postings_containing(self, text):
+        """包含text的所有词（子串匹配词表）的倒排列表的并集"""
+        positions = self.vocab_containing(text)
+        if len(positions) == 0:
+            return EMPTY_ROWS
+        if len(positions) == 1:
+            return self.postings(self.vocab[positions[0]])
+        # 一次解码所有命中词的倒排列表：拼接各列表的字节区间，再按列表起点扣除前面列表的累计值
+        starts = self.offsets[positions]
+        lengths = self.offsets[positions + 1] - starts
+        index = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths) + np.arange(int(lengths.sum()))
+        rows = np.cumsum(decode_varints(self.data[index]))
+        counts = self.counts[positions]
+        base = np.concatenate([[0], rows[np.cumsum(counts)[:-1] - 1]])
+        return np.unique(rows - np.repeat(base, counts))
+
+    def document_frequency(self, token):
+        position = self.vocab.get_indexer([token])[0]
+        return 0 if position < 0 else int(self.counts[position])
+
+    def pairs(self):
+        """展开为(行号数组, 词数组)，用于合并段"""
+        rows = np.cumsum(decode_varints(self.data))
+        # 每个倒排列表的第一个值是绝对行号，其余是差值：按列表起点扣除前面列表的累计值
+        list_index = np.repeat(np.arange(len(self.counts)), self.counts)
+        starts = np.concatenate([[0], np.cumsum(self.counts)[:-1]])
+        base = np.concatenate([[0], rows[starts[1:] - 1]]) if len(starts) else EMPTY_ROWS
+        rows = rows - base[list_index]
+        return rows, np.repeat(self.vocab.to_numpy(dtype=object), self.counts)
+
+    @property
+    def nbytes(self):
+        return self.data.nbytes + self.offsets.nbytes + self.counts.nbytes
+
+
+class InvertedIndex:
+    """日志文本列的倒排索引：词 → 包含该词的行号（压缩存储）
+
+    加载时分词建立，追加数据时只为新行建立新的段，段过多时合并。
+    词项中的每个词在词表中按子串查找（fail也匹配failed）：相同的词查哈希表，更长的词在拼接的词表字符串中查找，
+    取包含它的所有词的倒排列表；
+    单个词的词项直接返回这些行，多词词项（如域名、IP、短语）求交集后在候选行上做不区分大小写的子串校验。
+    结果与逐行str.contains一致。
+    """
+
+    def __init__(self, column):
+        self.column = column
+        self.row_count = 0
+        self.segments = []
+
+    @classmethod
+    def build(cls, series):
+        index = cls(series.name)
+        index.extend(series)
+        return index
+
+    def extend(self, series):
+        """为追加的行建立索引（行号从已有行数开始计）"""
+        for start in range(0, len(series), INDEX_CHUNK_ROWS):
+            chunk = series.iloc[start:start + INDEX_CHUNK_ROWS]
+            tokens = chunk.dropna().astype(str).str.lower().str.findall(TOKEN_PATTERN).explode().dropna()
+            if len(tokens):
+                self.segments.append(_Segment(
+                    self._row_numbers(chunk, tokens) + self.row_count + start,
+                    tokens.to_numpy(dtype=object)
+                ))
+        self.row_count += len(series)
+        if len(self.segments) > MAX_SEGMENTS:
+            self._merge_segments()
+
+    @staticmethod
+    def _row_numbers(chunk, tokens):
+        """explode后的行标签转换为块内行号"""
+        return chunk.index.get_indexer(tokens.index).astype(np.int64)
+
+    def _merge_segments(self):
+        pairs = [segment.pairs() for segment in self.segments]
+        rows = np.concatenate([p[0] for p in pairs])
+        tokens = np.concatenate([p[1] for p in pairs])
+        order = np.argsort(rows, kind='stable')
+        self.segments = [_Segment(rows[order], tokens[order])]
+
+    def postings(self, token):
+        """包含某个词的行号（升序）"""
+        return self._concat(segment.postings(token) for segment in self.segments)
+
+    def postings_containing(self, text):
+        """包含text（作为某个词的子串）的行号（升序）"""
+        return self._concat(segment.postings_containing(text) for segment in self.segments)
+
+    @staticmethod
+    def _concat(parts):
+        # 各段的行号区间依次递增，直接拼接即为升序
+        parts = [part for part in parts if len(part)]
+        return np.concatenate(parts) if parts else EMPTY_ROWS
+
+    def term_rows(self, series, term):
+        """匹配单个词项（子串）的行号；series为被索引的列（用于多词词项的子串校验）"""
+        tokens = tokenize(term)
+        if tokens:
+            if len(tokens) == 1 and tokens[0] == term.lower():
+                return self.postings_containing(tokens[0])
+            # 词项在某行中出现时，词项中的每个词都是该行某个词的子串；从最短的倒排列表开始求交集。
+            # 多词词项最后还要逐行校验，单个字母数字（如IP中的一位数）命中的词太多，只在没有更长的词时使用
+            selective = [token for token in set(tokens) if len(token) > 1 or not token.isascii()]
+            lists = sorted((self.postings_containing(token) for token in selective or [max(tokens, key=len)]), key=len)
+            candidates = lists[0]
+            for rows in lists[1:]:
+                if not len(candidates):
+                    break
+                candidates = np.intersect1d(candidates, rows, assume_unique=True)
+        else:
+            candidates = np.arange(self.row_count)  # 没有可索引的词（如纯标点），只能逐行校验
+        if not len(candidates):
+            return EMPTY_ROWS
+        values = series.iloc[candidates].astype(str)
+        return candidates[values.str.contains(term, case=False, regex=False).to_numpy(dtype=bool)]
+
+    @property
+    def nbytes(self):
+        return sum(segment.nbytes for segment in self.segments)
+
+
+class ValueIndex:
+    """短文本列（IP、用户名、状态等）的取值索引：不同取值的字典 + 每行的取值编号
+
+    这类列取值重复度高，词项只需在不同取值上做子串匹配，再按编号取出对应的行，结果与逐行str.contains一致。
+    """
+
+    def __init__(self, column):
+        self.column = column
+        self.row_count = 0
+        self.codes = np.empty(0, dtype=np.int32)  # 每行的取值编号，空值为-1
+        self.values = pd.Index([], dtype=object)
+        self.texts = pd.Series([], dtype=object)  # 各取值的字符串形式（与逐行扫描时的astype(str)一致）
+
+    @classmethod
+    def build(cls, series):
+        index = cls(series.name)
+        index.extend(series)
+        return index
+
+    def extend(self, series):
+        """为追加的行编号，新出现的取值追加到字典末尾"""
+        codes, uniques = pd.factorize(series.to_numpy(dtype=object))
+        positions = self.values.get_indexer(uniques)
+        new = positions < 0
+        positions[new] = len(self.values) + np.arange(int(new.sum()))
+        if new.any():
+            added = pd.Index(uniques[new], dtype=object)
+            self.values = self.values.append(added)
+            self.texts = pd.concat([self.texts, pd.Series(added).astype(str)], ignore_index=True)
+        lookup = np.append(positions, -1).astype(np.int32)
+        self.codes = np.concatenate([self.codes, lookup[codes]])
+        self.row_count += len(series)
+
+    def term_rows(self, series, term):
+        """匹配单个词项（子串）的行号；series参数与InvertedIndex.term_rows一致，这里不需要"""
+        matched = self.texts.str.contains(term, case=False, regex=False).to_numpy(dtype=bool)
+        if not matched.any():
+            return EMPTY_ROWS
+        return np.flatnonzero(np.append(matched, False)[self.codes])
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes
+
+
+def text_columns(df):
+    """参与关键词查找的列（非数值列）"""
+    return [col for col in df.columns if not pd.api.types.is_numeric_dtype(df[col].dtype)]
+
+
+def _scan_term(df, term, columns):
+    """逐列做不区分大小写的子串匹配（空值不匹配），返回布尔数组"""
+    matched = np.zeros(len(df), dtype=bool)
+    for col in columns:
+        series = df[col]
+        contains = series.astype(str).str.contains(term, case=False, regex=False).to_numpy(dtype=bool)
+        matched |= contains & series.notna().to_numpy()
+    return matched
+
+
+def search_rows(indexes, df, query, mode="and", scan_columns=()):
+    """在已建立索引的列中查找匹配的行号（DataFrame中的位置，升序）
+
+    Args:
+        indexes: {列名: InvertedIndex或ValueIndex}，行号与df的行位置一一对应
+        query: 查询字符串（空白分隔的词，双引号括起的为短语）或词项列表
+        mode: "and"（匹配全部词项）或 "or"（匹配任一词项）；一行在任一列中匹配即视为匹配该词项
+        scan_columns: 没有索引、需要逐行扫描的其他文本列（如旧版本缓存中未建立取值索引的短字段）
+    """
+    if mode not in ("and", "or"):
+        raise ValueError("mode须为 and 或 or")
+    terms = parse_query(query)
+    if not terms:
+        return np.arange(len(df))
+    combined = None
+    for term in terms:
+        # 各列的匹配行标记到同一个布尔数组（比逐列求行号并集快）
+        matched = _scan_term(df, term, scan_columns)
+        for column, index in indexes.items():
+            matched[index.term_rows(df[column], term)] = True
+        if combined is None:
+            combined = matched
+        else:
+            combined = combined & matched if mode == "and" else combined | matched
+        if mode == "and" and not combined.any():
+            break
+    return np.flatnonzero(combined)
+
+
+def scan_rows(df, query, mode="and", columns=None):
+    """没有倒排索引时逐列做不区分大小写的子串匹配（结果与search_rows一致）"""
+    columns = columns or text_columns(df)
+    combined = None
+    for term in parse_query(query):
+        matched = _scan_term(df, term, columns)
+        if combined is None:
+            combined = matched
+        else:
+            combined = combined & matched if mode == "and" else combined | matched
+    return np.arange(len(df)) if combined is None else np.flatnonzero(combined)
@@ -0,0 +1,186 @@
+import re
+import numpy as np
+import pandas as pd
+
+try:
+    from pandas.tseries.api import guess_datetime_format
+except ImportError:  # pandas < 2.2
+    from pandas._libs.tslibs.parsing import guess_datetime_format
+
+
+# 列名中出现这些关键词时优先作为时间列候选
+TIME_NAME_HINTS = ('time', 'date', 'timestamp', 'datetime', '时间', '日期')
+# 较短的关键词只在列名整体或以_/.分隔的某一段与之相同时才算（避免events、hosts等列名误命中）
+TIME_NAME_PARTS = ('ts',)
+
+# guess_datetime_format 无法识别时尝试的常见日志时间格式
+COMMON_LOG_FORMATS = [
+    '%d/%b/%Y:%H:%M:%S %z',  # Apache/Nginx访问日志
+    '%b %d %H:%M:%S',  # syslog（无年份）
+    '%Y/%m/%d %H:%M:%S',
+    '%Y-%m-%dT%H:%M:%S.%fZ',
+]
+
+# 数值型时间戳的合理范围（2000-01-01 至 2100-01-01，单位：秒）
+EPOCH_SECONDS_RANGE = (946684800, 4102444800)
+
+
+def _has_time_hint(column):
+    name = str(column).lower()
+    if any(hint in name for hint in TIME_NAME_HINTS):
+        return True
+    return any(part in TIME_NAME_PARTS for part in re.split(r'[_.]', name))
+
+
+def _to_epoch_ns(parsed):
+    """将解析后的时间序列统一为UTC无时区的int64纳秒数组，NaT保留为NaT标记值"""
+    if getattr(parsed.dt, 'tz', None) is not None:
+        parsed = parsed.dt.tz_convert('UTC').dt.tz_localize(None)
+    return parsed.astype('datetime64[ns]').to_numpy().view('int64')
+
+
+def parse_time_values(series, fmt=None, unit=None):
+    """按缓存的格式解析时间列，返回int64纳秒数组（无法解析的值为NaT标记值）"""
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        parsed = series
+    elif unit:
+        parsed = pd.to_datetime(pd.to_numeric(series, errors='coerce'), unit=unit, errors='coerce')
+    elif fmt:
+        parsed = pd.to_datetime(series, format=fmt, errors='coerce', utc='%z' in fmt)
+    else:
+        parsed = pd.to_datetime(series, errors='coerce', utc=True)
+    return _to_epoch_ns(parsed)
+
+
+def to_epoch_ns(value):
+    """将查询边界（字符串/datetime/Timestamp）转换为与索引一致的纳秒值"""
+    ts = pd.Timestamp(value)
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert('UTC').tz_localize(None)
+    return ts.as_unit('ns').value if hasattr(ts, 'as_unit') else ts.value
+
+
+def infer_time_format(series, sample_size=50, min_ratio=0.9):
+    """推断列的时间格式
+
+    Returns:
+        dict | None: {"format": 格式字符串或None, "unit": 数值时间戳单位或None}，不是时间列时返回None
+    """
+    if pd.api.types.is_datetime64_any_dtype(series.dtype):
+        return {"format": None, "unit": None}
+
+    sample = series.dropna().head(sample_size)
+    if sample.empty:
+        return None
+
+    if pd.api.types.is_numeric_dtype(sample.dtype):
+        # 数值型时间戳仅在列名提示为时间列时识别，避免把普通数值列误判为时间
+        if not _has_time_hint(series.name):
+            return None
+        low, high = EPOCH_SECONDS_RANGE
+        for unit, scale in (('s', 1), ('ms', 1000)):
+            if ((sample >= low * scale) & (sample <= high * scale)).mean() >= min_ratio:
+                return {"format": None, "unit": unit}
+        return None
+
+    sample = sample.astype(str)
+    if sample.str.len().max() > 64 or not sample.str.contains(r'\d', regex=True).all():
+        return None
+
+    candidates = []
+    guessed = guess_datetime_format(sample.iloc[0])
+    if guessed:
+        candidates.append(guessed)
+    candidates.extend(f for f in COMMON_LOG_FORMATS if f not in candidates)
+
+    for fmt in candidates:
+        parsed = pd.to_datetime(sample, format=fmt, errors='coerce', utc='%z' in fmt)
+        if parsed.notna().mean() >= min_ratio:
+            return {"format": fmt, "unit": None}
+
+    # 格式不统一时仅在列名提示为时间列时退回逐值解析（较慢）
+    if _has_time_hint(series.name):
+        parsed = pd.to_datetime(sample, errors='coerce', utc=True)
+        if parsed.notna().mean() >= min_ratio:
+            return {"format": None, "unit": None}
+    return None
+
+
+def detect_timestamp_columns(df, sample_size=50):
+    """检测DataFrame中的时间列，返回{列名: {"format", "unit"}}，列名带时间提示的排在前面"""
+    columns = sorted(df.columns, key=lambda c: not _has_time_hint(c))
+    detected = {}
+    for col in columns:
+        if not isinstance(df[col], pd.Series):
+            continue  # 重复列名
+        spec = infer_time_format(df[col], sample_size=sample_size)
+        if spec is not None:
+            detected[col] = spec
+    return detected
+
+
+class TimeIndex:
+    """单个时间列的有序索引：按时间排序的纳秒值及对应行号，区间查询使用二分查找"""
+
+    def __init__(self, column, fmt=None, unit=None):
+        self.column = column
+        self.format = fmt  # 缓存的解析格式，追加数据时复用
+        self.unit = unit
+        self.values = np.empty(0, dtype='int64')  # 已排序的时间值（纳秒）
+        self.positions = np.empty(0, dtype='int64')  # 对应的行号
+        self.row_count = 0  # 已建立索引的行数（含无法解析的行）
+        self.is_sorted = True  # 原始行序是否已按时间排序（可直接按行号切片）
+
+    @classmethod
+    def build(cls, series, fmt=None, unit=None):
+        index = cls(series.name, fmt, unit)
+        index.extend(series)
+        return index
+
+    def extend(self, series):
+        """为追加的行建立索引（行号从已有行数开始计），只解析新行"""
+        epoch = parse_time_values(series, self.format, self.unit)
+        valid = epoch != np.iinfo('int64').min
+        new_values = epoch[valid]
+        new_positions = np.arange(self.row_count, self.row_count + len(series), dtype='int64')[valid]
+        self.row_count += len(series)
+        if len(new_values) == 0:
+            return
+
+        order = np.argsort(new_values, kind='stable')
+        in_order = bool((order == np.arange(len(order))).all())
+        new_values = new_values[order]
+        new_positions = new_positions[order]
+
+        if len(self.values) == 0 or new_values[0] >= self.values[-1]:
+            # 日志通常按时间追加，直接拼接即可保持有序
+            self.is_sorted = self.is_sorted and in_order and valid.all()
+            self.values = np.concatenate([self.values, new_values])
+            self.positions = np.concatenate([self.positions, new_positions])
+        else:
+            self.is_sorted = False
+            values = np.concatenate([self.values, new_values])
+            positions = np.concatenate([self.positions, new_positions])
+            merged = np.argsort(values, kind='stable')
+            self.values = values[merged]
+            self.positions = positions[merged]
+
+    def bounds(self):
+        """返回索引覆盖的时间范围 (最早, 最晚)"""
+        if len(self.values) == 0:
+            return None, None
+        return pd.Timestamp(self.values[0]), pd.Timestamp(self.values[-1])
+
+    def slice_positions(self, start=None, end=None):
+        """返回时间落在 [start, end) 内的行号（按时间排序）"""
+        lo = 0 if start is None else np.searchsorted(self.values, to_epoch_ns(start), side='left')
+        hi = len(self.values) if end is None else np.searchsorted(self.values, to_epoch_ns(end), side='left')
+        return self.positions[lo:hi]
+
+    def slice_frame(self, df, start=None, end=None):
+        """按时间范围截取DataFrame，保持原始行序"""
+        positions = self.slice_positions(start, end)
+        if self.is_sorted and len(positions) > 0:
+            # 原始行序即时间序，行号连续，直接切片避免随机访问
+            return df.iloc[positions[0]:positions[-1] + 1]
+        return df.iloc[np.sort(positions)]
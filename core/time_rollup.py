@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+from core.time_index import parse_time_values
+
+
+# 预聚合的时间粒度（纳秒）
+ROLLUP_GRAINS = {"minute": 60 * 10 ** 9, "hour": 3600 * 10 ** 9}
+# 按这些列角色拆分事件数（源IP、用户、动作、状态）
+ROLLUP_ROLES = ("ip", "user", "event", "status")
+# 单个预聚合表的分组数上限，超过时停止维护该表（如按分钟×高基数IP），保证预聚合远小于原始数据
+MAX_ROLLUP_GROUPS = 200000
+# 数据字典中DataFrame.attrs保存预聚合的键
+ROLLUP_ATTR = "rollups"
+
+NAT = np.iinfo('int64').min
+
+
+class TimeRollups:
+    """按分钟、按小时预聚合的事件数（总数及按源IP/用户/动作/状态拆分）
+
+    加载时基于时间索引建立，追加数据时只聚合新行。通过data_dict中DataFrame的attrs["rollups"]提供给
+    查询模板和生成代码；统计的是文件全量数据，row_count与DataFrame行数不同说明DataFrame已按时间范围截取。
+    """
+
+    def __init__(self, time_column, dimensions, fmt=None, unit=None, grains=ROLLUP_GRAINS):
+        self.time_column = time_column
+        self.dimensions = dimensions  # 格式: {角色: 列名}
+        self.format = fmt
+        self.unit = unit
+        self.grains = dict(grains)
+        self.row_count = 0  # 已聚合的行数（含时间无法解析的行）
+        self._counts = {}  # 格式: {(粒度, 维度列名或None): pd.Series}，索引为时间桶纳秒（及维度取值）
+        self._disabled = set()  # 分组数超过上限而停止维护的表
+
+    def __deepcopy__(self, memo):
+        # 挂在DataFrame.attrs上，pandas运算会深拷贝attrs；预聚合只读，共享同一对象即可
+        return self
+
+    @classmethod
+    def build(cls, df, time_index, roles):
+        """基于已建立的时间索引聚合整个DataFrame（无需重新解析时间列），roles为{角色: 列名}"""
+        dimensions = {role: roles[role] for role in ROLLUP_ROLES if role in roles}
+        rollups = cls(time_index.column, dimensions, time_index.format, time_index.unit)
+        epoch = np.full(time_index.row_count, NAT, dtype='int64')
+        epoch[time_index.positions] = time_index.values
+        rollups._add(df, epoch)
+        return rollups
+
+    def extend(self, df):
+        """聚合追加的行（复用缓存的时间格式）"""
+        self._add(df, parse_time_values(df[self.time_column], self.format, self.unit))
+
+    def _add(self, df, epoch):
+        self.row_count += len(df)
+        valid = epoch != NAT
+        if not valid.any():
+            return
+        epoch = epoch[valid]
+        for grain, size in self.grains.items():
+            buckets = epoch // size * size
+            self._merge((grain, None), pd.Series(buckets).value_counts(sort=False))
+            for column in self.dimensions.values():
+                if (grain, column) in self._disabled:
+                    continue
+                frame = pd.DataFrame({"time": buckets, "value": df[column].to_numpy()[valid]})
+                self._merge((grain, column), frame.groupby(["time", "value"], sort=False).size())
+
+    def _merge(self, key, counts):
+        current = self._counts.get(key)
+        merged = counts if current is None else current.add(counts, fill_value=0)
+        if len(merged) > MAX_ROLLUP_GROUPS:
+            self._counts.pop(key, None)
+            self._disabled.add(key)
+            return
+        self._counts[key] = merged.astype('int64')
+
+    def available(self):
+        """可用的预聚合表 [(粒度, 维度列名或None)]"""
+        return sorted(self._counts, key=lambda key: (key[0], key[1] is not None, str(key[1])))
+
+    def table(self, grain="hour", by=None):
+        """返回预聚合表：列为time（时间桶起点）、维度列（by不为None时）和count，按时间排序
+
+        Args:
+            grain: "minute" 或 "hour"
+            by: 维度列名或角色名（ip/user/event/status），None表示只按时间统计总数
+        Returns:
+            pd.DataFrame | None: 该表不存在（没有该维度列或分组过多未维护）时返回None
+        """
+        column = self.dimensions.get(by, by)
+        counts = self._counts.get((grain, column))
+        if counts is None:
+            return None
+        table = counts.rename("count").reset_index()
+        table.columns = ["time", "count"] if column is None else ["time", column, "count"]
+        table["time"] = pd.to_datetime(table["time"].to_numpy(dtype='int64'))
+        return table.sort_values(list(table.columns[:-1]), kind="stable", ignore_index=True)
+
+    def describe(self):
+        """预聚合表说明（用于prompt）"""
+        tables = {}
+        for grain, column in self.available():
+            tables.setdefault(grain, []).append("总数" if column is None else f"by={column!r}")
+        text = "；".join(f"{grain}: {'、'.join(names)}" for grain, names in tables.items())
+        return f"时间列 {self.time_column}，已聚合 {self.row_count} 行；可用的表 {text or '无'}"
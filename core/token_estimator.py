@@ -0,0 +1,160 @@
+import os
+import re
+import json
+import threading
+
+
+# 各类字符的token折算率（参考DeepSeek官方说明：1个中文字符约0.6个token，1个英文字符约0.3个token）
+CHAR_CLASS_RATES = {
+    "cjk": 0.6,
+    "latin": 0.3,
+    "digit": 0.4,  # 数字通常按1~3位一组切分
+    "space": 0.25,
+    "symbol": 0.8  # 标点、制表符分隔的表格等
+}
+
+# 单次扫描文本时按字符类别切分的正则
+CHAR_CLASS_PATTERN = re.compile(
+    r'(?P<cjk>[\u2e80-\u9fff\uf900-\ufaff\uff00-\uffef]+)'
+    r'|(?P<latin>[A-Za-z]+)'
+    r'|(?P<digit>[0-9]+)'
+    r'|(?P<space>\s+)'
+    r'|(?P<symbol>[^\sA-Za-z0-9\u2e80-\u9fff\uf900-\ufaff\uff00-\uffef]+)'
+)
+
+# 每条消息的格式开销（角色标记等）
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# 各模型的上下文长度及单次输出上限，可通过配置项model_limits覆盖
+DEFAULT_MODEL_LIMITS = {
+    "deepseek-chat": {"context": 131072, "max_output": 8192},
+    "deepseek-reasoner": {"context": 131072, "max_output": 65536},
+    "default": {"context": 65536, "max_output": 8192}
+}
+
+# 校准系数的取值范围及每次更新的权重
+SCALE_RANGE = (0.5, 2.0)
+CALIBRATION_WEIGHT = 0.2
+
+
+def count_char_classes(text):
+    """单次扫描统计各类字符数量"""
+    counts = dict.fromkeys(CHAR_CLASS_RATES, 0)
+    if not text:
+        return counts
+    for match in CHAR_CLASS_PATTERN.finditer(text):
+        counts[match.lastgroup] += match.end() - match.start()
+    return counts
+
+
+def estimate_tokens(text):
+    """按字符类别折算率估算文本token数（未校准）"""
+    if not text:
+        return 0
+    counts = count_char_classes(text)
+    return int(sum(CHAR_CLASS_RATES[name] * n for name, n in counts.items()) + 0.5)
+
+
+class PromptTooLargeError(ValueError):
+    """prompt估算长度超出模型上下文预算"""
+
+    def __init__(self, model, prompt_tokens, context, min_output):
+        self.model = model
+        self.prompt_tokens = prompt_tokens
+        self.context = context
+        self.min_output = min_output
+        super().__init__(
+            f"prompt估算约 {prompt_tokens} tokens，超出模型 {model} 的上下文预算"
+            f"（上下文 {context} tokens，需预留至少 {min_output} tokens用于输出），请缩小数据范围或选择更少的文件"
+        )
+
+
+class TokenEstimator:
+    """离线token估算及请求前的prompt长度检查
+
+    估算值按模型乘以校准系数，系数根据API返回的usage.prompt_tokens逐步修正并持久化到缓存目录。
+    """
+
+    def __init__(self, cache_dir=None, model_limits=None, safety_margin=0.05, min_output_tokens=1024):
+        self.limits = {name: dict(limit) for name, limit in DEFAULT_MODEL_LIMITS.items()}
+        for name, limit in (model_limits or {}).items():
+            self.limits.setdefault(name, dict(self.limits["default"])).update(limit)
+        self.safety_margin = safety_margin  # 估算误差的预留比例
+        self.min_output_tokens = min_output_tokens  # 至少为输出预留的token数
+        self.calibration_file = os.path.join(cache_dir, 'token_calibration.json') if cache_dir else None
+        self.calibration = {}  # 格式: {模型名: {"scale", "samples", "estimated", "reported"}}，"*"为全部模型汇总
+        self._lock = threading.Lock()
+        self._load_calibration()
+
+    def _load_calibration(self):
+        if not self.calibration_file or not os.path.exists(self.calibration_file):
+            return
+        try:
+            with open(self.calibration_file, 'r', encoding='utf-8') as f:
+                self.calibration = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"加载token校准数据失败: {str(e)}")
+
+    def _save_calibration(self):
+        if not self.calibration_file:
+            return
+        try:
+            with open(self.calibration_file, 'w', encoding='utf-8') as f:
+                json.dump(self.calibration, f, ensure_ascii=False, indent=2)
+        except OSError as e:
+            print(f"保存token校准数据失败: {str(e)}")
+
+    def get_scale(self, model=None):
+        entry = self.calibration.get(model) or self.calibration.get("*")
+        return entry["scale"] if entry else 1.0
+
+    def estimate(self, text, model=None):
+        """估算文本token数（已按模型校准）"""
+        return int(estimate_tokens(text) * self.get_scale(model) + 0.5)
+
+    def estimate_messages(self, messages, model=None):
+        """估算消息列表的prompt token数，返回(校准后估算值, 未校准估算值)"""
+        raw = sum(estimate_tokens(m.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for m in messages)
+        return int(raw * self.get_scale(model) + 0.5), raw
+
+    def get_limits(self, model):
+        return self.limits.get(model, self.limits["default"])
+
+    def check_budget(self, model, messages, max_tokens):
+        """请求前检查prompt长度，返回(估算prompt token数, 未校准估算值, 调整后的max_tokens)
+
+        max_tokens超过模型输出上限或剩余上下文时自动收紧；剩余上下文不足以输出时抛出PromptTooLargeError。
+        """
+        limits = self.get_limits(model)
+        estimated, raw = self.estimate_messages(messages, model)
+        available = int(limits["context"] - estimated * (1 + self.safety_margin))
+        max_tokens = min(max_tokens, limits["max_output"])
+        min_output = min(max_tokens, self.min_output_tokens)
+        if available < min_output:
+            raise PromptTooLargeError(model, estimated, limits["context"], min_output)
+        return estimated, raw, min(max_tokens, available)
+
+    def record_usage(self, model, raw_estimate, usage):
+        """记录估算值与API返回的实际prompt token数，更新校准系数"""
+        reported = getattr(usage, "prompt_tokens", None) if usage is not None else None
+        if not reported or not raw_estimate:
+            return None
+        ratio = min(max(reported / raw_estimate, SCALE_RANGE[0]), SCALE_RANGE[1])
+        with self._lock:
+            for key in (model, "*"):
+                entry = self.calibration.setdefault(
+                    key, {"scale": 1.0, "samples": 0, "estimated": 0, "reported": 0}
+                )
+                # 前几次直接按平均比例，之后按固定权重平滑
+                weight = max(CALIBRATION_WEIGHT, 1.0 / (entry["samples"] + 1))
+                entry["scale"] = round(entry["scale"] * (1 - weight) + ratio * weight, 4)
+                entry["samples"] += 1
+                entry["estimated"] += int(raw_estimate)
+                entry["reported"] += int(reported)
+            self._save_calibration()
+        return ratio
+
+    def report(self):
+        """各模型的累计估算与实际token数及当前校准系数"""
+        with self._lock:
+            return {name: dict(entry) for name, entry in self.calibration.items()}
@@ -1,5 +1,6 @@
 import sys
 import os
+import multiprocessing
 from PyQt5.QtWidgets import QApplication
 from ui.main_window import LogAnalyzerGUI
 from utils.config import Config
@@ -14,5 +15,6 @@ def main():
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
-
+    # 打包后的程序启动代码执行子进程时需要
+    multiprocessing.freeze_support()
     main()
\ No newline at end of file
@@ -0,0 +1,65 @@
+import os
+import shutil
+import tempfile
+import unittest
+from utils.config import Config
+from core.processor import LogAIProcessor
+
+
+HEADER = "time,src_ip,user,code,port\n"
+ROWS = [
+    "2024-01-01 00:00:00,10.0.0.1,admin,E01,22\n",
+    "2024-01-01 00:01:00,10.0.0.2,bob,E02,22\n",
+]
+# 追加的行中code列恰好都是数字，单独解析时会被推断为整数
+APPENDED = [
+    "2024-01-01 00:02:00,10.0.0.3,alice,404,8080\n",
+    "2024-01-01 00:03:00,10.0.0.1,,500,443\n",
+]
+
+
+class IncrementalIngestTest(unittest.TestCase):
+    def setUp(self):
+        self.work_dir = tempfile.mkdtemp()
+        self.data_dir = os.path.join(self.work_dir, "data")
+        os.makedirs(self.data_dir)
+        self.path = os.path.join(self.data_dir, "auth.csv")
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(HEADER + "".join(ROWS))
+
+    def tearDown(self):
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+    def processor(self, cache_name):
+        config = Config()
+        config.config.update({
+            "data_dir": self.data_dir,
+            "cache_dir": os.path.join(self.work_dir, cache_name),
+            "subprocess_execution": False
+        })
+        return LogAIProcessor(config)
+
+    def test_append_matches_full_reload(self):
+        processor = self.processor("cache_incremental")
+        processor.load_data_files(["auth.csv"])
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write("".join(APPENDED))
+        appended = processor.load_data_files(["auth.csv"])["auth.csv"]
+
+        full_reload = self.processor("cache_full").load_data_files(["auth.csv"])["auth.csv"]
+        self.assertEqual(len(appended), len(ROWS) + len(APPENDED))
+        self.assertTrue(appended.equals(full_reload))
+        self.assertTrue(appended.dtypes.equals(full_reload.dtypes))
+
+    def test_returned_frame_does_not_alias_cache(self):
+        processor = self.processor("cache")
+        data = processor.load_data_files(["auth.csv"])["auth.csv"]
+        data.drop(index=0, inplace=True)
+        data["extra"] = 1
+        reloaded = processor.load_data_files(["auth.csv"])["auth.csv"]
+        self.assertEqual(len(reloaded), len(ROWS))
+        self.assertNotIn("extra", reloaded.columns)
+
+
+if __name__ == "__main__":
+    unittest.main()
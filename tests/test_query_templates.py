@@ -0,0 +1,75 @@
+import unittest
+import pandas as pd
+from core.query_templates import QueryRouter
+
+
+def _sample():
+    return pd.DataFrame({
+        "time": [f"2024-01-01 00:00:{second:02d}" for second in range(6)],
+        "src_ip": ["10.0.0.1", "10.0.0.2", "10.0.0.5", "10.0.0.1", "10.0.0.3", "10.0.0.1"],
+        "user": ["admin", "bob", "alice", "admin", "bob", "carol"],
+        "event": ["login", "login", "logout", "file_read", "login", "login"],
+        "status": ["success", "failed", "success", "success", "failed", "200"]
+    })
+
+
+class QueryRouterTest(unittest.TestCase):
+    def setUp(self):
+        self.router = QueryRouter()
+        self.samples = {"auth.csv": _sample()}
+        self.time_columns = {"auth.csv": ["time"]}
+
+    def route(self, request):
+        match = self.router.route(request, self.samples, self.time_columns)
+        return None if match is None else match.name
+
+    def test_routes_unfiltered_requests(self):
+        self.assertEqual(self.route("统计访问次数最多的前5个IP"), "top_ips")
+        self.assertEqual(self.route("top 10 ips"), "top_ips")
+        self.assertEqual(self.route("统计每个用户登录失败的次数"), "failed_logins_per_user")
+        self.assertEqual(self.route("failed logins per user"), "failed_logins_per_user")
+        self.assertEqual(self.route("按事件类型统计数量"), "event_type_counts")
+        self.assertEqual(self.route("统计每小时的事件数"), "events_per_hour")
+        self.assertEqual(self.route("按「status」统计"), "count_by_column")
+        self.assertEqual(self.route("统计来源IP前10"), "top_ips")
+        self.assertEqual(self.route("按事件类型统计数量，画饼图"), "event_type_counts")
+
+    def test_ascii_keywords_match_whole_words(self):
+        self.assertIsNone(self.route("top 10 recipients"))
+        self.assertIsNone(self.route("list the most frequent zip codes"))
+
+    def test_rejects_comparisons(self):
+        self.assertIsNone(self.route("统计 status=500 的请求IP排名"))
+        self.assertIsNone(self.route("统计状态：失败的IP排名"))
+        self.assertIsNone(self.route("top ips with status != 200"))
+
+    def test_rejects_ip_literals(self):
+        self.assertIsNone(self.route("统计IP 10.0.0.5 出现的次数"))
+        self.assertIsNone(self.route("192.168.1.1的事件类型统计"))
+
+    def test_rejects_quoted_values(self):
+        self.assertIsNone(self.route("统计\"file_read\"事件的IP排名"))
+        self.assertIsNone(self.route("统计「磁盘告警」的每小时事件数"))
+
+    def test_rejects_named_entities(self):
+        self.assertIsNone(self.route("用户admin的操作类型统计"))
+        self.assertIsNone(self.route("用户名为root的IP排名"))
+        self.assertIsNone(self.route("top ips for user svc-backup01"))
+        self.assertIsNone(self.route("统计PROTECTEDa1B2c3D4的事件类型"))
+
+    def test_rejects_unhandled_words(self):
+        self.assertIsNone(self.route("统计登录失败的IP排名"))
+        self.assertIsNone(self.route("统计SSH暴力破解的来源IP前10"))
+        self.assertIsNone(self.route("列出被拦截次数最多的前10个IP"))
+        self.assertIsNone(self.route("统计出现次数最多的IP 仅限外网"))
+        self.assertIsNone(self.route("统计凌晨2点到4点每小时的事件数"))
+        self.assertIsNone(self.route("统计每小时失败的事件数"))
+
+    def test_rejects_values_from_sample(self):
+        self.assertIsNone(self.route("统计alice的操作类型"))
+        self.assertIsNone(self.route("logout事件的IP排名"))
+        self.assertIsNone(self.route("统计状态为200的每小时事件数"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,10 @@
 from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QTextEdit,
-                             QComboBox, QProgressBar, QPushButton, QGroupBox)
+                             QComboBox, QProgressBar, QPushButton, QGroupBox, QLineEdit, QCheckBox)
 from PyQt5.QtCore import Qt
+import pandas as pd
 from core.analysis_thread import AnalysisThread
 from utils.helpers import show_error_message
+from utils.timing import format_timings
 
 
 class AnalysisTab(QWidget):
@@ -32,8 +34,30 @@ class AnalysisTab(QWidget):
         self.mode_combo.addItems(["代码处理", "直接回答"])
         mode_layout.addWidget(self.mode_combo)
         mode_layout.addStretch()
+        # 响应缓存启用时可选择忽略缓存，重新请求API
+        self.bypass_cache_check = QCheckBox("忽略缓存结果")
+        self.bypass_cache_check.setVisible(self.processor.response_cache is not None)
+        mode_layout.addWidget(self.bypass_cache_check)
         self.mode_combo.currentIndexChanged.connect(self.on_mode_changed)
 
+        # 时间范围（可选，仅分析范围内的数据）
+        time_layout = QHBoxLayout()
+        time_layout.addWidget(QLabel("时间范围:"))
+        self.start_time_edit = QLineEdit()
+        self.start_time_edit.setPlaceholderText("开始时间（可选），如 2024-01-01 02:00")
+        self.end_time_edit = QLineEdit()
+        self.end_time_edit.setPlaceholderText("结束时间（可选），如 2024-01-01 04:00")
+        time_layout.addWidget(self.start_time_edit)
+        time_layout.addWidget(QLabel("至"))
+        time_layout.addWidget(self.end_time_edit)
+
+        # 关键词过滤（可选，基于日志文本的倒排索引，只分析包含全部关键词的行）
+        keyword_layout = QHBoxLayout()
+        keyword_layout.addWidget(QLabel("关键词过滤:"))
+        self.keyword_edit = QLineEdit()
+        self.keyword_edit.setPlaceholderText('可选，空格分隔多个关键词（需全部包含），短语用双引号，如 evil.com "login failed"')
+        keyword_layout.addWidget(self.keyword_edit)
+
         # 进度条
         self.progress = QProgressBar()
         self.progress.setAlignment(Qt.AlignCenter)
@@ -48,13 +72,21 @@ class AnalysisTab(QWidget):
         self.start_btn = QPushButton("开始分析")
         self.start_btn.clicked.connect(self.start_analysis)
 
+        # 取消按钮：中止正在接收的API响应
+        self.cancel_btn = QPushButton("取消")
+        self.cancel_btn.setEnabled(False)
+        self.cancel_btn.clicked.connect(self.cancel_analysis)
+
         btn_layout.addWidget(self.back_btn)
         btn_layout.addStretch()
+        btn_layout.addWidget(self.cancel_btn)
         btn_layout.addWidget(self.start_btn)
 
         # 组装布局
         layout.addWidget(req_group)
         layout.addLayout(mode_layout)
+        layout.addLayout(time_layout)
+        layout.addLayout(keyword_layout)
         layout.addWidget(self.progress)
         layout.addLayout(btn_layout)
 
@@ -75,8 +107,15 @@ class AnalysisTab(QWidget):
             show_error_message(self, "警告", "请先选择文件")
             return
 
+        try:
+            time_range = self.get_time_range()
+        except ValueError as e:
+            show_error_message(self, "警告", str(e))
+            return
+
         # 准备分析
         self.start_btn.setEnabled(False)
+        self.cancel_btn.setEnabled(True)
         self.progress.setVisible(True)
         self.progress.setRange(0, 0)  # 无限进度
         if self.parent and hasattr(self.parent, 'statusBar'):
@@ -90,12 +129,38 @@ class AnalysisTab(QWidget):
             self.processor,
             selected_files,
             request,
-            mode
+            mode,
+            time_range,
+            use_cache=not self.bypass_cache_check.isChecked(),
+            keyword_filter=self.keyword_edit.text().strip() or None
         )
         self.analysis_thread.update_signal.connect(self.update_status)
         self.analysis_thread.complete_signal.connect(self.analysis_complete)
         self.analysis_thread.start()
 
+    def cancel_analysis(self):
+        """取消正在进行的分析"""
+        if getattr(self, 'analysis_thread', None) and self.analysis_thread.isRunning():
+            self.analysis_thread.cancel()
+            self.cancel_btn.setEnabled(False)
+            self.update_status("正在取消分析...")
+
+    def get_time_range(self):
+        """读取时间范围输入，均为空时返回None"""
+        bounds = []
+        for edit in (self.start_time_edit, self.end_time_edit):
+            text = edit.text().strip()
+            if not text:
+                bounds.append(None)
+                continue
+            try:
+                bounds.append(pd.Timestamp(text))
+            except (ValueError, TypeError):
+                raise ValueError(f"无法识别的时间: {text}")
+        if not any(b is not None for b in bounds):
+            return None
+        return tuple(bounds)
+
     def update_status(self, message):
         """更新状态信息"""
         if self.parent and hasattr(self.parent, 'statusBar'):
@@ -114,10 +179,12 @@ class AnalysisTab(QWidget):
         """分析完成处理"""
         self.progress.setVisible(False)
         self.start_btn.setEnabled(True)
+        self.cancel_btn.setEnabled(False)
 
         if result["status"] == "success":
             if self.parent:
-                self.parent.statusBar().showMessage("分析完成")
+                timings = format_timings(result["result"].get("timings"))
+                self.parent.statusBar().showMessage(f"分析完成  {timings}" if timings else "分析完成")
                 self.parent.set_analysis_result(result["result"])
                 self.parent.tabs.setCurrentIndex(3)  # 切换到结果标签页
         else:
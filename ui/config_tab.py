@@ -2,7 +2,6 @@ from PyQt5.QtWidgets import (QWidget, QVBoxLayout, QHBoxLayout, QLabel, QLineEdi
                             QPushButton, QGroupBox, QFileDialog)
 from utils.helpers import show_info_message, show_error_message
 import os
-from core.api_client import DeepSeekAPI
 
 class ConfigTab(QWidget):
     def __init__(self, config, parent=None):
@@ -69,13 +68,9 @@ class ConfigTab(QWidget):
         api_key = self.api_key_edit.text().strip()
         self.config.set("api_key", api_key)
 
-        # 更新处理器的API Key并重新初始化客户端，传入敏感词处理器
+        # 更新处理器的API Key（已有客户端时复用其连接池，不重新初始化）
         if hasattr(self.parent, 'processor'):
-            self.parent.processor.api_key = api_key
-            self.parent.processor.client = DeepSeekAPI(
-                api_key=api_key,
-                sensitive_processor=self.parent.processor.sensitive_processor
-            ) if api_key else None
+            self.parent.processor.set_api_key(api_key)
 
         show_info_message(self, "成功", "API Key已保存并生效")
 
@@ -5,7 +5,8 @@ from PyQt5.QtCore import (Qt, QTimer)
 from PyQt5.QtWidgets import QFileIconProvider
 import os
 import shutil
-from utils.helpers import get_file_list, show_info_message, show_error_message
+from utils.helpers import show_info_message, show_error_message
+from core.column_profile import format_profiles
 from ui.sensitive_tab import ProgressDialog  # 导入新类
 from PyQt5.QtCore import QThread, pyqtSignal
 
@@ -50,7 +51,7 @@ class FileTab(QWidget):
         # 顶部按钮区
         btn_layout = QHBoxLayout()
         self.refresh_btn = QPushButton("刷新文件列表")
-        self.refresh_btn.clicked.connect(self.update_file_list)
+        self.refresh_btn.clicked.connect(lambda: self.update_file_list(check_files=True))
         self.add_btn = QPushButton("添加选中")
         self.add_btn.clicked.connect(self.add_files)
         self.remove_btn = QPushButton("移除选中")
@@ -182,23 +183,81 @@ class FileTab(QWidget):
                 )
                 self.update_file_list()
 
-    def update_file_list(self):
-        """更新当前数据目录中的文件列表"""
+    def update_file_list(self, check_files=False):
+        """更新当前数据目录中的文件列表（基于目录索引，仅比对变化的文件）"""
         self.file_list.clear()
         try:
-            # 读取当前数据目录中的文件
-            files = get_file_list(self.current_data_dir)
+            # 从目录索引读取当前数据目录中的文件
+            entries = self.processor.get_file_entries(check_files)
             icon_provider = QFileIconProvider()
-
-            for file in files:
-                item = QListWidgetItem(icon_provider.icon(QFileIconProvider.File), file)
+            file_icon = icon_provider.icon(QFileIconProvider.File)
+
+            self.file_list.setUpdatesEnabled(False)
+            for entry in entries:
+                item = QListWidgetItem(file_icon, entry["name"])
+                item.setToolTip(self._format_entry_tooltip(
+                    entry, self.processor.get_column_profiles(entry["name"])
+                ))
                 self.file_list.addItem(item)
+            self.file_list.setUpdatesEnabled(True)
 
             if self.parent:
-                self.parent.statusBar().showMessage(f"已加载 {len(files)} 个文件")
+                self.parent.statusBar().showMessage(f"已加载 {len(entries)} 个文件")
+
+            # 后台补全编码和估算行数
+            self.start_catalog_details()
         except Exception as e:
+            self.file_list.setUpdatesEnabled(True)
             show_error_message(self, "警告", f"加载文件列表失败: {str(e)}")
 
+    def start_catalog_details(self):
+        """启动后台线程补全目录索引中的编码和估算行数"""
+        if not self.current_data_dir or not os.path.isdir(self.current_data_dir):
+            return
+        if getattr(self, 'catalog_thread', None) and self.catalog_thread.isRunning():
+            self.catalog_thread.stop()
+            self.catalog_thread.wait()
+        self.catalog_thread = CatalogDetailThread(self.processor.file_catalog, self.current_data_dir)
+        self.catalog_thread.complete_signal.connect(self.update_file_tooltips)
+        self.catalog_thread.start()
+
+    def showEvent(self, event):
+        """切换回本页时刷新提示信息（分析过程中加载的文件会有列统计）"""
+        super().showEvent(event)
+        self.update_file_tooltips(self.file_list.count())
+
+    def update_file_tooltips(self, count):
+        """目录索引详情补全后（或切换回本页时）刷新文件提示信息"""
+        if not count:
+            return
+        catalog = self.processor.file_catalog
+        for row in range(self.file_list.count()):
+            item = self.file_list.item(row)
+            entry = catalog.get_entry(self.current_data_dir, item.text())
+            if entry:
+                item.setToolTip(self._format_entry_tooltip(
+                    entry, self.processor.get_column_profiles(item.text())
+                ))
+
+    @staticmethod
+    def _format_entry_tooltip(entry, profiles=None):
+        """格式化文件索引记录为提示文本（文件已加载时附上各列统计）"""
+        size = entry["size"]
+        for unit in ["B", "KB", "MB", "GB"]:
+            if size < 1024 or unit == "GB":
+                break
+            size /= 1024
+        lines = [f"大小: {size:.1f} {unit}" if unit != "B" else f"大小: {size} B",
+                 f"格式: {entry.get('format') or '不支持'}"]
+        if entry.get("encoding"):
+            lines.append(f"编码: {entry['encoding']}")
+        if entry.get("est_rows") is not None:
+            lines.append(f"估算行数: {entry['est_rows']}")
+        if profiles:
+            lines.append("列统计:")
+            lines.append(format_profiles(profiles, top=3))
+        return "\n".join(lines)
+
     def add_files(self):
         """添加文件到选择列表"""
         selected = self.file_list.selectedItems()
@@ -210,6 +269,7 @@ class FileTab(QWidget):
             filename = item.text()
             if not self.selected_list.findItems(filename, Qt.MatchExactly):
                 self.selected_list.addItem(filename)
+                self.selected_list.item(self.selected_list.count() - 1).setToolTip(item.toolTip())
                 self.selected_files.append(filename)
 
         self.update_next_button()
@@ -295,6 +355,28 @@ class FileTab(QWidget):
         # 延迟关闭进度对话框
         QTimer.singleShot(1000, progress_dialog.close)
 
+# 目录索引详情补全线程
+class CatalogDetailThread(QThread):
+    complete_signal = pyqtSignal(int)
+
+    def __init__(self, file_catalog, directory):
+        super().__init__()
+        self.file_catalog = file_catalog
+        self.directory = directory
+        self._stopped = False
+
+    def stop(self):
+        self._stopped = True
+
+    def run(self):
+        try:
+            count = self.file_catalog.fill_details(self.directory, stop_flag=lambda: self._stopped)
+        except Exception as e:
+            print(f"补全文件目录索引失败: {str(e)}")
+            count = 0
+        self.complete_signal.emit(count)
+
+
 # 添加去敏处理线程
 class AnonymizeThread(QThread):
     update_signal = pyqtSignal(str)
@@ -10,6 +10,7 @@ class Config:
             "api_key": "",
             "data_dir": "",
             "save_dir": "",
+            "cache_dir": "",  # 缓存目录（文件目录索引等），为空时使用程序目录下的.cache
             "verbose_logging": False
         }
         self.load()
@@ -39,4 +40,12 @@ class Config:
 
     def set(self, key, value):
         self.config[key] = value
-        self.save()  # 自动保存
\ No newline at end of file
+        self.save()  # 自动保存
+
+    def get_cache_dir(self):
+        """获取缓存目录，不存在时自动创建"""
+        cache_dir = self.config.get("cache_dir") or os.path.join(
+            os.path.dirname(os.path.abspath(__file__)), '../.cache'
+        )
+        os.makedirs(cache_dir, exist_ok=True)
+        return cache_dir
\ No newline at end of file
@@ -1,5 +1,6 @@
 import os
 import re
+import numpy as np
 from PyQt5.QtWidgets import QMessageBox
 
 
@@ -19,10 +20,10 @@ def get_file_list(directory):
         return []
 
     try:
-        # 只返回文件，不返回目录
-        return [f for f in os.listdir(directory)
-                if os.path.isfile(os.path.join(directory, f))
-                and not f.startswith('.')]
+        # 只返回文件，不返回目录（scandir复用目录项类型信息，避免逐个stat）
+        with os.scandir(directory) as it:
+            return [entry.name for entry in it
+                    if not entry.name.startswith('.') and entry.is_file()]
     except Exception as e:
         print(f"获取文件列表失败: {str(e)}")
         return []
@@ -34,6 +35,15 @@ def sanitize_filename(filename):
     return safe_name.strip() or "unnamed_file"
 
 
+def json_default(value):
+    """json.dumps的default：序列化numpy/pandas标量等非标准JSON类型"""
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return str(value)
+
+
 def get_unique_filename(directory, base_name, extension):
     """生成唯一文件名"""
     if extension.startswith('.'):
@@ -0,0 +1,315 @@
+"""本地模拟的OpenAI兼容对话接口，用于离线基准测试和压力测试
+
+用法:
+    python -m utils.mock_server --port 8765 --scenario scenario.json
+
+然后在config.json中设置 "api_base_url": "http://127.0.0.1:8765"（api_key可任意填写）。
+
+场景文件（JSON，所有字段可选）:
+    {
+      "seed": 42,                                   # 随机数种子，保证延迟和错误注入可复现
+      "latency": {"type": "lognormal", "mean": 1.5, "sigma": 0.5},   # 首个token前的延迟（秒）
+      "token_latency": {"type": "fixed", "value": 0.005},           # 流式输出时每段内容的间隔（秒）
+      "error_rates": {"429": 0.05, "503": 0.02},    # 按概率注入的错误状态码
+      "fail_first": [429, 500],                     # 前几个请求依次返回的错误状态码
+      "retry_after": 1,                             # 429响应的Retry-After（秒）
+      "responses": [                                # 按顺序匹配最后一条用户消息的脚本化响应
+        {"match": "编写完整的Python处理代码", "content": "```python\\n...\\n```", "reasoning": "..."},
+        {"match": ".*", "content": "总结内容"}
+      ]
+    }
+延迟分布支持 fixed(value)、uniform(low, high)、normal(mean, std)、lognormal(mean, sigma)、exponential(mean)。
+"""
+import os
+import re
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from core.token_estimator import estimate_tokens
+
+
+# 服务端前缀缓存的粒度（token），与DeepSeek一致
+CACHE_UNIT_TOKENS = 64
+
+DEFAULT_CODE_RESPONSE = """```python
+result_table = pd.concat(data_dict.values(), ignore_index=True)
+summary = f"共 {len(result_table)} 行数据（模拟响应）"
+chart_info = None
+```"""
+
+DEFAULT_SCENARIO = {
+    "seed": None,
+    "latency": {"type": "fixed", "value": 0.0},
+    "token_latency": {"type": "fixed", "value": 0.0},
+    "error_rates": {},
+    "fail_first": [],
+    "retry_after": 1,
+    "stream_chunk_chars": 16,
+    "responses": [
+        {"match": "Python处理代码", "content": DEFAULT_CODE_RESPONSE, "reasoning": "模拟推理过程。"},
+        {"match": ".*", "content": "这是模拟的分析结论。", "reasoning": "模拟推理过程。"}
+    ]
+}
+
+
+def sample_latency(spec, rng):
+    """按分布配置采样延迟秒数（不小于0）"""
+    if not spec:
+        return 0.0
+    kind = spec.get("type", "fixed")
+    if kind == "fixed":
+        value = spec.get("value", 0.0)
+    elif kind == "uniform":
+        value = rng.uniform(spec.get("low", 0.0), spec.get("high", 1.0))
+    elif kind == "normal":
+        value = rng.gauss(spec.get("mean", 1.0), spec.get("std", 0.1))
+    elif kind == "lognormal":
+        # mean为分布的中位数（秒），sigma为对数标准差
+        value = rng.lognormvariate(0.0, spec.get("sigma", 0.5)) * spec.get("mean", 1.0)
+    elif kind == "exponential":
+        value = rng.expovariate(1.0 / max(1e-9, spec.get("mean", 1.0)))
+    else:
+        raise ValueError(f"不支持的延迟分布: {kind}")
+    return max(0.0, value)
+
+
+class MockScenario:
+    """模拟服务的行为配置及运行状态（请求计数、前缀缓存、统计）"""
+
+    def __init__(self, scenario=None):
+        self.config = dict(DEFAULT_SCENARIO)
+        self.config.update(scenario or {})
+        self.rng = random.Random(self.config.get("seed"))
+        self.responses = [
+            (re.compile(rule.get("match", ".*"), re.DOTALL), rule) for rule in self.config["responses"]
+        ]
+        self.prefixes = []  # 最近请求的prompt，用于模拟前缀缓存命中
+        self.request_count = 0
+        self.stats = {"requests": 0, "streamed": 0, "injected_errors": {}, "prompt_tokens": 0, "completion_tokens": 0}
+        self._lock = threading.Lock()
+
+    def next_request(self):
+        """为新请求分配序号，返回(要注入的错误状态码或None, 延迟秒数, 每段内容间隔秒数)"""
+        with self._lock:
+            index = self.request_count
+            self.request_count += 1
+            self.stats["requests"] += 1
+            status = None
+            fail_first = self.config.get("fail_first") or []
+            if index < len(fail_first):
+                status = int(fail_first[index])
+            else:
+                for code, rate in (self.config.get("error_rates") or {}).items():
+                    if self.rng.random() < rate:
+                        status = int(code)
+                        break
+            if status is not None:
+                key = str(status)
+                self.stats["injected_errors"][key] = self.stats["injected_errors"].get(key, 0) + 1
+            latency = sample_latency(self.config.get("latency"), self.rng)
+            token_latency = sample_latency(self.config.get("token_latency"), self.rng)
+        return status, latency, token_latency
+
+    def pick_response(self, prompt):
+        for pattern, rule in self.responses:
+            if pattern.search(prompt):
+                return rule.get("content", ""), rule.get("reasoning")
+        return "", None
+
+    def prompt_usage(self, prompt_text):
+        """按与之前请求的最长公共前缀估算缓存命中token数（以64 token为单位）"""
+        prompt_tokens = estimate_tokens(prompt_text)
+        with self._lock:
+            previous_prompts = list(self.prefixes)
+            self.prefixes = (self.prefixes + [prompt_text])[-50:]
+        # 在锁外比较，避免长prompt的前缀比较阻塞并发请求
+        common = max((len(os.path.commonprefix([previous, prompt_text])) for previous in previous_prompts), default=0)
+        hit = estimate_tokens(prompt_text[:common]) // CACHE_UNIT_TOKENS * CACHE_UNIT_TOKENS
+        hit = min(hit, prompt_tokens)
+        return prompt_tokens, hit, prompt_tokens - hit
+
+    def record_usage(self, prompt_tokens, completion_tokens, streamed):
+        with self._lock:
+            self.stats["prompt_tokens"] += prompt_tokens
+            self.stats["completion_tokens"] += completion_tokens
+            if streamed:
+                self.stats["streamed"] += 1
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # 支持长连接
+    scenario = None  # 由MockLLMServer设置
+
+    def log_message(self, format, *args):
+        pass  # 不输出访问日志
+
+    def _send_json(self, status, payload, headers=None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip('/') == "/stats":
+            self._send_json(200, self.scenario.stats)
+        else:
+            self._send_json(404, {"error": {"message": "not found"}})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith("/chat/completions"):
+            self._send_json(404, {"error": {"message": "not found"}})
+            return
+        length = int(self.headers.get("Content-Length") or 0)
+        try:
+            request = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError:
+            self._send_json(400, {"error": {"message": "invalid json", "type": "invalid_request_error"}})
+            return
+
+        status, latency, token_latency = self.scenario.next_request()
+        time.sleep(latency)
+        if status is not None:
+            headers = {"Retry-After": str(self.scenario.config.get("retry_after", 1))} if status == 429 else None
+            self._send_json(status, {"error": {"message": f"injected error {status}", "type": "mock_error"}}, headers)
+            return
+
+        messages = request.get("messages") or []
+        user_text = next((m.get("content") or "" for m in reversed(messages) if m.get("role") == "user"), "")
+        prompt_text = "".join(m.get("content") or "" for m in messages)
+        content, reasoning = self.scenario.pick_response(user_text)
+        prompt_tokens, hit, miss = self.scenario.prompt_usage(prompt_text)
+        completion_tokens = estimate_tokens(content) + estimate_tokens(reasoning or "")
+        usage = {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "prompt_cache_hit_tokens": hit,
+            "prompt_cache_miss_tokens": miss
+        }
+        model = request.get("model", "mock")
+        response_id = f"mock-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+        streamed = bool(request.get("stream"))
+        self.scenario.record_usage(prompt_tokens, completion_tokens, streamed)
+
+        if not streamed:
+            self._send_json(200, {
+                "id": response_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": content, "reasoning_content": reasoning},
+                    "finish_reason": "stop"
+                }],
+                "usage": usage
+            })
+            return
+
+        include_usage = bool((request.get("stream_options") or {}).get("include_usage"))
+        self._stream(response_id, created, model, content, reasoning, usage if include_usage else None,
+                     token_latency)
+
+    def _stream(self, response_id, created, model, content, reasoning, usage, token_latency):
+        """按SSE格式分段输出（先推理内容，再回答内容），最后输出用量和[DONE]"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        size = max(1, int(self.scenario.config.get("stream_chunk_chars", 16)))
+
+        def send(choices, usage_payload=None):
+            chunk = {"id": response_id, "object": "chat.completion.chunk", "created": created, "model": model,
+                     "choices": choices}
+            if usage_payload is not None:
+                chunk["usage"] = usage_payload
+            self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        try:
+            for field, text in (("reasoning_content", reasoning or ""), ("content", content)):
+                for start in range(0, len(text), size):
+                    send([{"index": 0, "delta": {field: text[start:start + size]}, "finish_reason": None}])
+                    time.sleep(token_latency)
+            send([{"index": 0, "delta": {}, "finish_reason": "stop"}])
+            if usage is not None:
+                send([], usage)
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass  # 客户端提前结束接收（如代码块已完整）
+
+
+class MockLLMServer:
+    """模拟服务：可在后台线程中启动（供测试脚本使用），也可通过命令行前台运行"""
+
+    def __init__(self, host="127.0.0.1", port=0, scenario=None):
+        self.scenario = MockScenario(scenario)
+        handler = type("MockHandler", (_Handler,), {"scenario": self.scenario})
+        self.httpd = ThreadingHTTPServer((host, port), handler)
+        self.httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="mock-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="本地模拟的OpenAI兼容对话接口")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--scenario", help="场景配置文件（JSON）")
+    parser.add_argument("--seed", type=int, help="随机数种子（覆盖场景文件中的设置）")
+    args = parser.parse_args(argv)
+
+    scenario = {}
+    if args.scenario:
+        with open(args.scenario, 'r', encoding='utf-8') as f:
+            scenario = json.load(f)
+    if args.seed is not None:
+        scenario["seed"] = args.seed
+
+    server = MockLLMServer(args.host, args.port, scenario)
+    print(f"模拟服务已启动: {server.base_url}（在config.json中设置api_base_url指向该地址）")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.httpd.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
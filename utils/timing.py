@@ -0,0 +1,53 @@
+import time
+import threading
+from contextlib import contextmanager
+
+
+class StageTimer:
+    """记录分析流程各阶段的起止时间，统计总耗时及并行阶段重叠节省的时间"""
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.stages = {}  # 格式: {阶段名: [(开始偏移, 结束偏移), ...]}，单位秒；同名阶段（如多轮修复）累计
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name):
+        """计时上下文，可在不同线程中并行使用；同名阶段多次执行时耗时累加"""
+        start = time.perf_counter() - self.origin
+        try:
+            yield
+        finally:
+            end = time.perf_counter() - self.origin
+            with self._lock:
+                self.stages.setdefault(name, []).append((start, end))
+
+    def report(self):
+        """返回各阶段耗时、多次执行的阶段的次数、总耗时以及重叠时间（各阶段耗时之和 - 实际总耗时）"""
+        with self._lock:
+            intervals = {name: list(spans) for name, spans in self.stages.items()}
+        durations = {name: round(sum(end - start for start, end in spans), 3) for name, spans in intervals.items()}
+        spans = [span for name_spans in intervals.values() for span in name_spans]
+        total = max((end for _, end in spans), default=0.0)
+        overlap = max(0.0, sum(end - start for start, end in spans) - total)
+        return {
+            "stages": durations,
+            "runs": {name: len(spans) for name, spans in intervals.items() if len(spans) > 1},
+            "total": round(total, 3),
+            "overlap": round(overlap, 3)
+        }
+
+
+def format_timings(timings):
+    """格式化阶段耗时报告用于状态栏显示"""
+    if not timings:
+        return ""
+    runs = timings.get("runs", {})
+    parts = [
+        f"{name} {seconds:.1f}s" + (f"（{runs[name]}次）" if name in runs else "")
+        for name, seconds in timings["stages"].items()
+    ]
+    text = f"阶段耗时: {', '.join(parts)}；总耗时 {timings['total']:.1f}s"
+    if timings.get("overlap", 0) > 0.05:
+        text += f"（并行节省 {timings['overlap']:.1f}s）"
+    return text